@@ -45,6 +45,9 @@ export async function forwardToPython(path, payload = {}, options = {}) {
 
   const r = await fetch(url, { method: 'POST', headers, body: JSON.stringify(body) })
   const text = await r.text()
+  // per-stage timings from the ML service, correlated by request id
+  const timing = r.headers.get('server-timing')
+  if (timing) console.log(`[ml ${r.headers.get('x-request-id') || requestId || '-'}] ${path} ${r.status} ${timing}`)
   let json = null
   try { json = JSON.parse(text) } catch (_) { json = text }
   if (!r.ok) {
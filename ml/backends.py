@@ -0,0 +1,89 @@
+"""Lazy registry of optional heavy backends.
+
+Optional dependencies (torch, diffusers, cv2, numpy, Real-ESRGAN, Tesseract
+bindings) are imported once, on first use, instead of at module import time,
+so the service boots fast and replicas take traffic sooner. Each backend
+records whether it is available, how long its import took and why it failed.
+
+`require(name)` returns the module or raises RuntimeError; `load(name)` returns
+None when unavailable. `report()` summarises import timings for the startup
+log and the /backends endpoint.
+
+Env configuration:
+- BACKEND_PRELOAD comma-separated backend names to import in the background
+  at startup (e.g. "torch,diffusers" on GPU replicas)
+"""
+import time
+import importlib
+import threading
+from typing import Dict, Optional
+
+# registry name -> importable module
+BACKENDS = {
+    'numpy': 'numpy',
+    'cv2': 'cv2',
+    'torch': 'torch',
+    'diffusers': 'diffusers',
+    'realesrgan': 'realesrgan',
+    'tesserocr': 'tesserocr',
+    'pytesseract': 'pytesseract',
+}
+
+_STATE: Dict[str, dict] = {}
+_LOCK = threading.Lock()
+
+
+def load(name: str):
+    """Import backend `name` once; returns the module, or None if unavailable."""
+    state = _STATE.get(name)
+    if state is None:
+        with _LOCK:
+            state = _STATE.get(name)
+            if state is None:
+                state = _import(name)
+                _STATE[name] = state
+    return state['module']
+
+
+def _import(name: str) -> dict:
+    t0 = time.perf_counter()
+    try:
+        module = importlib.import_module(BACKENDS.get(name, name))
+        error = None
+    except Exception as e:
+        module, error = None, f'{type(e).__name__}: {e}'
+    return {
+        'module': module,
+        'available': module is not None,
+        'import_ms': round((time.perf_counter() - t0) * 1000.0, 1),
+        'error': error,
+    }
+
+
+def require(name: str):
+    module = load(name)
+    if module is None:
+        raise RuntimeError(f'{name} not available: {_STATE[name]["error"]}')
+    return module
+
+
+def available(name: str) -> bool:
+    return load(name) is not None
+
+
+def report() -> Dict[str, Optional[dict]]:
+    """Per-backend state; backends never requested show as not loaded."""
+    out = {}
+    for name in BACKENDS:
+        state = _STATE.get(name)
+        if state is None:
+            out[name] = { 'loaded': False }
+        else:
+            out[name] = { 'loaded': True, 'available': state['available'], 'import_ms': state['import_ms'], 'error': state['error'] }
+    return out
+
+
+def preload(names) -> Dict[str, Optional[dict]]:
+    for name in names:
+        load(name)
+    return report()
@@ -0,0 +1,259 @@
+#!/usr/bin/env python3
+"""Offline micro-benchmarks for the ML service's CPU hot paths.
+
+Runs in-process against synthetic card and logo images at several sizes; no
+network, no model downloads (HF / Stability tokens are ignored for the run).
+Each case reports throughput, latency percentiles and memory, and the whole run
+is written as JSON so results can be diffed across commits:
+
+    python ml/bench.py --out bench.json
+    python ml/bench.py --only postprocess,icons_search --compare bench.json
+
+Memory: `peak_traced_kb` is the tracemalloc peak of one extra (untimed) call,
+which covers Python and NumPy allocations but not Pillow's internal buffers;
+`maxrss_kb` is the process high-water mark after the case, so it only grows.
+"""
+import os
+import io
+import base64
+import gc
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+import platform
+import resource
+import tracemalloc
+from typing import Callable, Dict, List, Optional
+
+# offline: never reach the hosted providers from a benchmark
+for _name in ('HUGGINGFACE_API_TOKEN', 'HF_TOKEN', 'STABILITY_API_KEY'):
+    os.environ.pop(_name, None)
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from PIL import Image, ImageDraw  # noqa: E402
+
+import server  # noqa: E402
+from inpaint import make_mask_from_boxes  # noqa: E402
+from contrast import contrast_matrix  # noqa: E402
+from layout_suggestion import FONTS  # noqa: E402
+
+# load_dotenv in server may have put them back
+for _name in ('HUGGINGFACE_API_TOKEN', 'HF_TOKEN', 'STABILITY_API_KEY'):
+    os.environ.pop(_name, None)
+
+CARD_SIZES = { 'card-s': (525, 300), 'card-m': (1050, 600), 'card-l': (2100, 1200) }
+LOGO_SIZES = { 'logo-s': 256, 'logo-m': 512, 'logo-l': 1024 }
+ICON_QUERIES = ['coffee', 'rocket launch', 'medical', 'leaf', 'camera photo', 'shop cart', 'realestate', 'lawyer scales', 'cofee', 'bank']
+
+
+def synthetic_card(size) -> tuple:
+    """(PNG bytes, text boxes) for a card: tinted background, a colour band and real text."""
+    W, H = size
+    rng = random.Random(W * H)
+    img = Image.new('RGB', (W, H), (245, 242, 236))
+    d = ImageDraw.Draw(img)
+    d.rectangle((0, 0, W // 3, H), fill=(30, 58, 138))
+    for _ in range(40):
+        # paper noise so PNG encoding and filters see realistic content
+        x, y = rng.randrange(W), rng.randrange(H)
+        d.point((x, y), fill=(rng.randrange(200, 255),) * 3)
+    boxes = []
+    y = int(H * 0.2)
+    for text, rel in (('Alexandra Montgomery', 0.09), ('Senior Product Designer', 0.05), ('alex@northwind.com', 0.04), ('+1 (555) 123-4567', 0.04)):
+        m = FONTS.metrics('bold' if rel > 0.05 else 'regular', max(8, int(H * rel)))
+        x = int(W * 0.4)
+        d.text((x, y), text, font=m.font, fill=(17, 17, 17))
+        boxes.append((x, y, int(m.width(text)), m.line_height, text))
+        y += int(m.line_height * 1.4)
+    buf = io.BytesIO()
+    img.save(buf, format='PNG')
+    return buf.getvalue(), boxes
+
+
+def synthetic_logo(side: int) -> bytes:
+    """A flat three-colour logo on white: ring, triangle and a bar."""
+    img = Image.new('RGB', (side, side), 'white')
+    d = ImageDraw.Draw(img)
+    s = side / 256.0
+    d.ellipse((28 * s, 28 * s, 228 * s, 228 * s), outline=(220, 38, 38), width=max(2, int(18 * s)))
+    d.polygon([(128 * s, 60 * s), (190 * s, 170 * s), (66 * s, 170 * s)], fill=(37, 99, 235))
+    d.rectangle((80 * s, 185 * s, 176 * s, 200 * s), fill=(17, 17, 17))
+    buf = io.BytesIO()
+    img.save(buf, format='PNG')
+    return buf.getvalue()
+
+
+def _percentile(sorted_ms: List[float], q: float) -> float:
+    if not sorted_ms:
+        return 0.0
+    k = (len(sorted_ms) - 1) * q
+    lo = int(k)
+    hi = min(lo + 1, len(sorted_ms) - 1)
+    return sorted_ms[lo] + (sorted_ms[hi] - sorted_ms[lo]) * (k - lo)
+
+
+def measure(fn: Callable[[], object], min_time: float, min_runs: int, max_runs: int, warmup: int) -> Dict:
+    for _ in range(warmup):
+        fn()
+    gc.collect()
+    times = []
+    t_start = time.perf_counter()
+    while len(times) < max_runs and (len(times) < min_runs or time.perf_counter() - t_start < min_time):
+        t0 = time.perf_counter()
+        fn()
+        times.append((time.perf_counter() - t0) * 1000.0)
+    total = sum(times) / 1000.0
+    # memory pass last and untimed: tracing slows allocation-heavy code down
+    tracemalloc.start()
+    fn()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    times.sort()
+    return {
+        'runs': len(times),
+        'ops_per_s': round(len(times) / total, 3) if total else None,
+        'mean_ms': round(total * 1000.0 / len(times), 3),
+        'min_ms': round(times[0], 3),
+        'p50_ms': round(_percentile(times, 0.5), 3),
+        'p90_ms': round(_percentile(times, 0.9), 3),
+        'p99_ms': round(_percentile(times, 0.99), 3),
+        'max_ms': round(times[-1], 3),
+        'peak_traced_kb': round(peak / 1024.0, 1),
+        'maxrss_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+    }
+
+
+def build_cases(loop) -> List[tuple]:
+    """[(group, case, params, fn)] for every benchmark."""
+    cases = []
+    cards = { name: (size, *synthetic_card(size)) for name, size in CARD_SIZES.items() }
+    logos = { name: (side, synthetic_logo(side)) for name, side in LOGO_SIZES.items() }
+
+    for name, (size, png, boxes) in cards.items():
+        mp = size[0] * size[1] / 1e6
+        cases.append(('postprocess', name, { 'width': size[0], 'height': size[1], 'megapixels': mp },
+                      lambda png=png: server._postprocess_image_bytes(png)))
+        cases.append(('local_text_boost', name, { 'width': size[0], 'height': size[1], 'megapixels': mp },
+                      lambda png=png: server._local_text_boost(png)))
+        cases.append(('make_mask_from_boxes', name, { 'width': size[0], 'height': size[1], 'boxes': len(boxes) },
+                      lambda png=png, boxes=boxes: make_mask_from_boxes(png, boxes)))
+
+    for name, (side, png) in logos.items():
+        req = server.VectorizeRequest(imageBase64='data:image/png;base64,' + base64.b64encode(png).decode('ascii'))
+        cases.append(('vectorize', name, { 'width': side, 'height': side, 'megapixels': side * side / 1e6 },
+                      lambda req=req: _check_vectorize(loop.run_until_complete(server.vectorize(req)))))
+
+    reqs = [server.IconSearchRequest(q=q, top_k=6) for q in ICON_QUERIES]
+    cases.append(('icons_search', 'lexical', { 'queries': len(reqs) },
+                  lambda: [loop.run_until_complete(server.icons_search(r)) for r in reqs]))
+
+    rng = random.Random(7)
+    colors = ['#%06x' % rng.randrange(0xFFFFFF) for _ in range(64)]
+    pairs = [(a, b) for a in colors for b in colors]
+    cases.append(('contrast_ratio', '64x64', { 'pairs': len(pairs) },
+                  lambda: [server.contrast_ratio(a, b) for a, b in pairs]))
+    cases.append(('contrast_matrix', '64x64', { 'pairs': len(pairs) },
+                  lambda: contrast_matrix(colors, colors)))
+    return cases
+
+
+def _check_vectorize(result):
+    # a fallback dict means the backend is missing; fail loudly instead of timing the error path
+    if isinstance(result, dict) and result.get('error'):
+        raise RuntimeError(result.get('details') or result['error'])
+    return result
+
+
+def _versions() -> Dict:
+    out = { 'python': platform.python_version() }
+    for mod in ('PIL', 'numpy', 'cv2', 'fastapi'):
+        try:
+            out[mod] = getattr(__import__(mod), '__version__', None)
+        except Exception:
+            out[mod] = None
+    return out
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        import subprocess
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), timeout=5).stdout.strip() or None
+    except Exception:
+        return None
+
+
+def compare(previous: Dict, current: Dict) -> List[str]:
+    """One line per case present in both runs: p50 and throughput change."""
+    before = { (r['group'], r['case']): r for r in previous.get('results', []) if 'p50_ms' in r }
+    lines = []
+    for r in current['results']:
+        old = before.get((r['group'], r['case']))
+        if old is None or 'p50_ms' not in r or not old['p50_ms']:
+            continue
+        change = (r['p50_ms'] - old['p50_ms']) / old['p50_ms'] * 100.0
+        lines.append(f"{r['group']:<22}{r['case']:<10} p50 {old['p50_ms']:>10.3f} -> {r['p50_ms']:>10.3f} ms ({change:+6.1f}%)")
+    return lines
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    ap.add_argument('--only', help='comma-separated groups (postprocess, local_text_boost, vectorize, icons_search, contrast_ratio, contrast_matrix, make_mask_from_boxes)')
+    ap.add_argument('--min-time', type=float, default=1.0, help='seconds per case (default 1.0)')
+    ap.add_argument('--min-runs', type=int, default=5)
+    ap.add_argument('--max-runs', type=int, default=1000)
+    ap.add_argument('--warmup', type=int, default=1)
+    ap.add_argument('--out', help='write JSON here (default: stdout)')
+    ap.add_argument('--compare', help='previous JSON run to compare against (summary on stderr)')
+    args = ap.parse_args(argv)
+
+    only = { g.strip() for g in (args.only or '').split(',') if g.strip() }
+    loop = asyncio.new_event_loop()
+    results = []
+    try:
+        for group, case, params, fn in build_cases(loop):
+            if only and group not in only:
+                continue
+            try:
+                stats = measure(fn, args.min_time, args.min_runs, args.max_runs, args.warmup)
+                if 'megapixels' in params:
+                    stats['megapixels_per_s'] = round(stats['ops_per_s'] * params['megapixels'], 3)
+                entry = { 'group': group, 'case': case, 'params': params, **stats }
+            except Exception as e:
+                entry = { 'group': group, 'case': case, 'params': params, 'error': f'{type(e).__name__}: {e}' }
+            results.append(entry)
+            print(f"{group:<22}{case:<10} " + (f"p50 {entry['p50_ms']:.3f} ms, {entry['ops_per_s']} ops/s" if 'p50_ms' in entry else entry['error']), file=sys.stderr)
+    finally:
+        loop.run_until_complete(asyncio.to_thread(server.shutdown_vectorize))
+        loop.close()
+
+    report = {
+        'meta': {
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+            'commit': _git_commit(),
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'versions': _versions(),
+            'settings': { 'min_time': args.min_time, 'min_runs': args.min_runs, 'max_runs': args.max_runs, 'warmup': args.warmup },
+        },
+        'results': results,
+    }
+    text = json.dumps(report, indent=2)
+    if args.out:
+        with open(args.out, 'w', encoding='utf-8') as fh:
+            fh.write(text + '\n')
+    else:
+        print(text)
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as fh:
+            previous = json.load(fh)
+        for line in compare(previous, report):
+            print(line, file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,96 @@
+"""Vectorized WCAG contrast checks.
+
+Colours are normalised to `#rrggbb`, de-duplicated, and their relative
+luminance is computed once per unique colour (memoized across calls). A full
+foreground x background contrast matrix is then a single broadcast, and the
+AA / AAA / large-text verdicts are boolean masks over it, so thousands of
+palette combinations are checked in one call.
+"""
+from functools import lru_cache
+from typing import Dict, List, Optional, Sequence, Tuple
+
+try:
+    from .backends import require as require_backend
+except Exception:
+    from backends import require as require_backend
+
+# WCAG 2.x thresholds
+AA = 4.5
+AAA = 7.0
+AA_LARGE = 3.0
+AAA_LARGE = 4.5
+# 18pt regular text, in CSS px
+LARGE_TEXT_PX = 24.0
+
+
+def normalize_hex(color: Optional[str], default: str = '#000000') -> str:
+    """'#abc' / 'ABCDEF' -> '#aabbcc'; unparseable input maps to black like hex_to_rgb."""
+    if not color:
+        return default
+    h = str(color).strip().lstrip('#').lower()
+    if len(h) == 3:
+        h = ''.join(c * 2 for c in h)
+    h = h[:6]
+    try:
+        int(h, 16)
+    except ValueError:
+        return '#000000'
+    return '#' + h if len(h) == 6 else '#000000'
+
+
+@lru_cache(maxsize=8192)
+def relative_luminance(color: str) -> float:
+    h = normalize_hex(color)
+    lin = []
+    for i in (1, 3, 5):
+        c = int(h[i:i + 2], 16) / 255.0
+        lin.append(c / 12.92 if c <= 0.03928 else ((c + 0.055) / 1.055) ** 2.4)
+    return 0.2126 * lin[0] + 0.7152 * lin[1] + 0.0722 * lin[2]
+
+
+def luminances(colors: Sequence[str], default: str = '#000000') -> Tuple[List[str], object]:
+    """(normalised colours, luminance array) with one lookup per unique colour."""
+    np = require_backend('numpy')
+    norm = [normalize_hex(c, default) for c in colors]
+    unique = { c: relative_luminance(c) for c in dict.fromkeys(norm) }
+    return norm, np.fromiter((unique[c] for c in norm), dtype=np.float64, count=len(norm))
+
+
+def _ratio(la, lb, np):
+    return (np.maximum(la, lb) + 0.05) / (np.minimum(la, lb) + 0.05)
+
+
+def contrast_matrix(foregrounds: Sequence[str], backgrounds: Sequence[str]) -> Dict:
+    """Contrast of every foreground on every background, plus pass masks (rows = foregrounds)."""
+    np = require_backend('numpy')
+    fg, lf = luminances(foregrounds)
+    bg, lb = luminances(backgrounds, '#ffffff')
+    ratios = _ratio(lf[:, None], lb[None, :], np)
+    return { 'foregrounds': fg, 'backgrounds': bg, 'ratios': ratios, **pass_masks(ratios) }
+
+
+def pair_contrast(text_colors: Sequence[str], bg_colors: Sequence[str], font_sizes: Optional[Sequence[Optional[float]]] = None) -> Dict:
+    """Element-wise contrast of text_colors[i] on bg_colors[i]; large-text verdicts use font size."""
+    np = require_backend('numpy')
+    _, lt = luminances(text_colors)
+    _, lb = luminances(bg_colors, '#ffffff')
+    ratios = _ratio(lt, lb, np)
+    large = None
+    if font_sizes is not None:
+        large = np.fromiter(((s or 0) >= LARGE_TEXT_PX for s in font_sizes), dtype=bool, count=len(ratios))
+    return { 'ratios': ratios, **pass_masks(ratios, large) }
+
+
+def pass_masks(ratios, large=None) -> Dict:
+    """AA / AAA for normal text, AA / AAA for large text, and `pass` (the verdict that
+    applies to each entry when `large` marks which entries are large text)."""
+    np = require_backend('numpy')
+    masks = {
+        'passAA': ratios >= AA,
+        'passAAA': ratios >= AAA,
+        'passLarge': ratios >= AA_LARGE,
+        'passLargeAAA': ratios >= AAA_LARGE,
+    }
+    if large is not None:
+        masks['pass'] = np.where(large, masks['passLarge'], masks['passAA'])
+    return masks
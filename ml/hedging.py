@@ -0,0 +1,68 @@
+"""Hedged requests: race a backup call against a slow primary.
+
+`hedged()` starts the primary call, and if it has not finished after `delay`
+seconds starts the hedge call in parallel. The first success wins and the
+other call is cancelled. `LatencyTracker` keeps a rolling window of observed
+latencies so the hedge delay can follow a percentile of real traffic.
+"""
+import asyncio
+import math
+import threading
+from collections import deque
+from typing import Optional
+
+
+class LatencyTracker:
+    def __init__(self, window: int = 200):
+        self._samples = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def record(self, seconds: float):
+        with self._lock:
+            self._samples.append(float(seconds))
+
+    def count(self) -> int:
+        return len(self._samples)
+
+    def percentile(self, p: float) -> Optional[float]:
+        """Nearest-rank percentile of the window (p in 0..100), or None when empty."""
+        with self._lock:
+            data = sorted(self._samples)
+        if not data:
+            return None
+        rank = int(math.ceil(max(0.0, min(100.0, p)) / 100.0 * len(data)))
+        return data[max(0, rank - 1)]
+
+
+async def hedged(primary, hedge, delay: Optional[float]):
+    """Run `primary()`; if still pending after `delay` seconds, also run `hedge()`.
+    Returns (result, winner) with winner 'primary' or 'hedge'. If the primary
+    finishes (or fails) before the delay, its outcome is returned as-is. If both
+    fail, the primary's exception is raised.
+    """
+    p_task = asyncio.ensure_future(primary())
+    tasks = [p_task]
+    try:
+        done, _ = await asyncio.wait({p_task}, timeout=delay)
+        if done:
+            return p_task.result(), 'primary'
+        h_task = asyncio.ensure_future(hedge())
+        tasks.append(h_task)
+        pending = {p_task, h_task}
+        errors = {}
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for t in done:
+                if t.cancelled():
+                    errors[t] = asyncio.CancelledError()
+                elif t.exception() is not None:
+                    errors[t] = t.exception()
+                else:
+                    return t.result(), ('primary' if t is p_task else 'hedge')
+        raise errors.get(p_task) or errors[h_task]
+    finally:
+        losers = [t for t in tasks if not t.done()]
+        for t in losers:
+            t.cancel()
+        if losers:
+            await asyncio.gather(*losers, return_exceptions=True)
@@ -0,0 +1,113 @@
+"""Shared, app-lifetime httpx clients for outbound provider calls.
+
+One pooled `httpx.AsyncClient` is kept per provider so repeated calls reuse
+TCP/TLS connections instead of paying a fresh handshake on every request.
+Clients are created by `startup_clients()` (wired to the FastAPI startup hook)
+and closed by `shutdown_clients()`. `get_client()` lazily creates a client when
+used outside the app lifecycle (scripts, one-off tools).
+
+Per-provider tuning via env (PREFIX is HF or STABILITY), falling back to the
+unprefixed HTTP_* value and then to the built-in default:
+- {PREFIX}_HTTP_MAX_CONNECTIONS (default 20)
+- {PREFIX}_HTTP_MAX_KEEPALIVE (default 10)
+- {PREFIX}_HTTP_KEEPALIVE_EXPIRY seconds (default 60)
+- {PREFIX}_HTTP_TIMEOUT default total timeout seconds (default 60)
+- {PREFIX}_HTTP2 (1/0, default 1; only used when the `h2` package is installed)
+
+Call sites pass `timeout=` per request to override the client default.
+
+Provider base URLs (e.g. a local mock, see mock_providers.py):
+- HF_API_BASE (default https://api-inference.huggingface.co)
+- STABILITY_API_BASE (default https://api.stability.ai)
+"""
+import os
+import httpx
+
+try:
+    from .metrics import InstrumentedTransport
+except Exception:
+    from metrics import InstrumentedTransport
+try:
+    from .provider_router import RouterTransport
+except Exception:
+    from provider_router import RouterTransport
+
+PROVIDERS = ('hf', 'stability')
+
+_DEFAULT_BASES = { 'hf': 'https://api-inference.huggingface.co', 'stability': 'https://api.stability.ai' }
+
+_CLIENTS = {}
+
+
+def _env(provider: str, name: str, default):
+    raw = os.environ.get(f'{provider.upper()}_HTTP_{name}')
+    if raw is None:
+        raw = os.environ.get(f'HTTP_{name}')
+    if raw is None or str(raw).strip() == '':
+        return default
+    try:
+        return type(default)(raw)
+    except Exception:
+        return default
+
+
+def _http2_enabled(provider: str) -> bool:
+    raw = os.environ.get(f'{provider.upper()}_HTTP2', os.environ.get('HTTP2', '1'))
+    if str(raw).lower() in ('0', 'false', 'no'):
+        return False
+    try:
+        import h2  # noqa: F401
+        return True
+    except Exception:
+        return False
+
+
+def _build_client(provider: str) -> httpx.AsyncClient:
+    limits = httpx.Limits(
+        max_connections=_env(provider, 'MAX_CONNECTIONS', 20),
+        max_keepalive_connections=_env(provider, 'MAX_KEEPALIVE', 10),
+        keepalive_expiry=_env(provider, 'KEEPALIVE_EXPIRY', 60.0),
+    )
+    timeout = httpx.Timeout(_env(provider, 'TIMEOUT', 60.0), connect=10.0)
+    transport = httpx.AsyncHTTPTransport(limits=limits, http2=_http2_enabled(provider))
+    if RouterTransport is not None:
+        # success rate / latency per route for the circuit breakers (see provider_router.py)
+        transport = RouterTransport(transport)
+    if InstrumentedTransport is not None:
+        # per-call latency / status metrics for every provider request (see metrics.py)
+        transport = InstrumentedTransport(transport, provider)
+    return httpx.AsyncClient(transport=transport, timeout=timeout)
+
+
+def provider_url(provider: str, path: str) -> str:
+    """Absolute URL for `path` on the provider's API ({PREFIX}_API_BASE overrides the host)."""
+    base = os.environ.get(f'{provider.upper()}_API_BASE') or _DEFAULT_BASES[provider]
+    return base.rstrip('/') + '/' + path.lstrip('/')
+
+
+def hf_model_url(model: str) -> str:
+    return provider_url('hf', f'models/{model}')
+
+
+def get_client(provider: str) -> httpx.AsyncClient:
+    """Return the shared client for `provider` ('hf' | 'stability')."""
+    client = _CLIENTS.get(provider)
+    if client is None or client.is_closed:
+        client = _build_client(provider)
+        _CLIENTS[provider] = client
+    return client
+
+
+async def startup_clients():
+    for provider in PROVIDERS:
+        get_client(provider)
+
+
+async def shutdown_clients():
+    clients = list(_CLIENTS.values())
+    _CLIENTS.clear()
+    for client in clients:
+        try:
+            await client.aclose()
+        except Exception as e:
+            print('HTTP client close failed:', e)
@@ -0,0 +1,396 @@
+"""Prebuilt icon index for /icons/search.
+
+The icon catalogue is parsed from the frontend data files (SVG icons in
+`icons.js`, `emojiIcons.js` and the categorised `industryIcons.js`), kept in
+memory and rebuilt only when one of the files' mtimes changes.
+
+Two rankers share the catalogue:
+- Semantic: label embeddings are computed once per (model, catalogue) and
+  stored on disk as a row-normalised float32 `.npy` matrix that is
+  memory-mapped on load, so restarts reuse it and only the query string is
+  ever sent for embedding. Scoring is one matrix-vector product plus an
+  `argpartition` top-k.
+- Lexical (offline): an inverted index over ids, labels, synonyms, emoji
+  Unicode names and category tags. Whole words and word prefixes are scored
+  BM25-style with precomputed per-posting weights, so a query is a handful of
+  NumPy scatter-adds. An unknown query word is first corrected against the
+  word vocabulary (edit distance over words of similar length) and scored as the
+  closest indexed words, so `emial` finds Email and `fone` finds Phone.
+
+Env configuration:
+- ICON_DATA_DIR catalogue directory (default frontend/src/data)
+- ICON_EMBED_CACHE_DIR embedding matrices (default ml/.cache/icon_embeddings)
+"""
+import os
+import re
+import math
+import bisect
+import hashlib
+import threading
+import unicodedata
+from collections import OrderedDict
+from typing import Awaitable, Callable, List, Optional, Sequence
+
+try:
+    from .backends import require as require_backend
+except Exception:
+    from backends import require as require_backend
+
+try:
+    from .singleflight import SingleFlight
+except Exception:
+    from singleflight import SingleFlight
+
+_HERE = os.path.dirname(os.path.abspath(__file__))
+_DEFAULT_DATA = os.path.join(_HERE, '..', 'frontend', 'src', 'data')
+_SOURCES = (('icons', 'icons.js'), ('emoji', 'emojiIcons.js'), ('industry', 'industryIcons.js'))
+_DEFAULT_CACHE = os.path.join(_HERE, '.cache', 'icon_embeddings')
+
+# crude parsing: find "id: '...'" and "label: '...'" occurrences within ICONS array
+_ENTRY_RE = re.compile(r"\{([^}]+)\}", flags=re.DOTALL)
+_ID_RE = re.compile(r"id\s*:\s*['\"]([\w-]+)['\"]")
+_LABEL_RE = re.compile(r"label\s*:\s*['\"]([^'\"]+)['\"]")
+
+
+def parse_icons_js(txt: str) -> List[dict]:
+    out = []
+    for e in _ENTRY_RE.findall(txt):
+        m_id = _ID_RE.search(e)
+        m_label = _LABEL_RE.search(e)
+        if m_id and m_label:
+            out.append({ 'id': m_id.group(1), 'label': m_label.group(1) })
+    return out
+
+
+_QUOTED_RE = re.compile(r"'([^']+)'")
+_CATEGORY_RE = re.compile(r"(\w+)\s*:\s*\[([^\]]*)\]")
+
+
+def parse_emoji_js(txt: str) -> List[tuple]:
+    """[(emoji, group comment)] from the EMOJI_ICONS array."""
+    out = []
+    group = ''
+    for ln in txt.splitlines():
+        ln = ln.strip()
+        if ln.startswith('//'):
+            group = ln[2:].strip()
+            continue
+        out.extend((e, group) for e in _QUOTED_RE.findall(ln))
+    return out
+
+
+def parse_industry_js(txt: str) -> List[tuple]:
+    """[(emoji, category)] from the INDUSTRY_ICONS map."""
+    return [(e, cat) for cat, body in _CATEGORY_RE.findall(txt) for e in _QUOTED_RE.findall(body)]
+
+
+# extra search terms for the SVG icons, whose labels are brand or single words
+_SYNONYMS = {
+    'phone': 'call telephone mobile contact number',
+    'email': 'mail envelope message contact inbox',
+    'globe': 'web internet site url world homepage',
+    'location': 'map pin address place office',
+    'linkedin': 'social network professional jobs',
+    'twitter': 'x social tweet',
+    'instagram': 'social photo camera',
+    'github': 'code git repository developer',
+    'whatsapp': 'chat message social',
+}
+
+# joiners, variation selectors and skin/gender modifiers carry no meaning on their own
+_EMOJI_SKIP = { 0x200D, 0xFE0E, 0xFE0F, 0x20E3 } | set(range(0x1F3FB, 0x1F400))
+
+
+def emoji_name(emoji: str) -> str:
+    names = []
+    for ch in emoji:
+        if ord(ch) in _EMOJI_SKIP:
+            continue
+        try:
+            names.append(unicodedata.name(ch).lower())
+        except ValueError:
+            pass
+    return ' '.join(names)
+
+
+def build_catalogue(sources: dict) -> tuple:
+    """(icons, search texts) from {'icons': txt, 'emoji': txt, 'industry': txt}."""
+    icons, texts = [], []
+    for ic in parse_icons_js(sources.get('icons') or ''):
+        icons.append({ 'id': ic['id'], 'label': ic['label'], 'source': 'icons' })
+        texts.append(' '.join((ic['id'].replace('-', ' '), ic['label'], _SYNONYMS.get(ic['id'], ''))))
+    tags = {}
+    for emoji, cat in parse_industry_js(sources.get('industry') or ''):
+        tags.setdefault(emoji, []).append(cat)
+    seen = {}
+    for emoji, group in parse_emoji_js(sources.get('emoji') or '') + [(e, '') for e in tags]:
+        if emoji in seen:
+            continue
+        seen[emoji] = True
+        name = emoji_name(emoji)
+        if not name:
+            continue
+        icons.append({
+            'id': 'emoji-' + '-'.join(f'{ord(c):x}' for c in emoji if ord(c) not in _EMOJI_SKIP),
+            'label': name.title(),
+            'source': 'emoji',
+            'emoji': emoji,
+        })
+        texts.append(' '.join([name, group.replace('/', ' ')] + tags.get(emoji, [])))
+    return icons, texts
+
+
+_WORD_RE = re.compile(r'[a-z0-9]+')
+
+
+def _words(text: str) -> List[str]:
+    return _WORD_RE.findall(text.lower())
+
+
+_DOUBLED_RE = re.compile(r'(.)\1+')
+
+
+def _fold(word: str) -> str:
+    """Spelling-insensitive form for typo matching: 'ph' -> 'f', doubled letters once."""
+    return _DOUBLED_RE.sub(r'\1', word.replace('ph', 'f'))
+
+
+def _edit_distance(a: str, b: str, limit: int) -> int:
+    """Levenshtein distance counting adjacent transpositions as one edit; `limit + 1` once it exceeds `limit`."""
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    prev2, prev = None, list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        cur = [i] + [0] * len(b)
+        for j in range(1, len(b) + 1):
+            cur[j] = min(prev[j] + 1, cur[j - 1] + 1, prev[j - 1] + (a[i - 1] != b[j - 1]))
+            if i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                cur[j] = min(cur[j], prev2[j - 2] + 1)
+        if min(cur) > limit:
+            return limit + 1
+        prev2, prev = prev, cur
+    return prev[-1]
+
+
+class LexicalIndex:
+    """BM25 over word terms with weights precomputed per posting; typos are corrected
+    against the vocabulary before scoring.
+    """
+
+    WORD_BOOST = 3.0
+    PREFIX_BOOST = 2.0
+    MAX_PREFIX_WORDS = 64
+    MIN_TYPO_LEN = 3
+
+    def __init__(self, texts: Sequence[str], k1: float = 1.2, b: float = 0.75):
+        np = require_backend('numpy')
+        self.size = len(texts)
+        raw = {}
+        lengths = np.zeros(self.size, dtype=np.float32)
+        for doc, text in enumerate(texts):
+            for w in _words(text):
+                tf = raw.setdefault(f'w:{w}', {})
+                tf[doc] = tf.get(doc, 0) + 1
+                lengths[doc] += 1
+        avg = max(float(lengths.mean()) if self.size else 0.0, 1.0)
+        self._postings = {}
+        for term, tf in raw.items():
+            ids = np.fromiter(tf.keys(), dtype=np.int32, count=len(tf))
+            freq = np.fromiter(tf.values(), dtype=np.float32, count=len(tf))
+            idf = math.log(1.0 + (self.size - len(tf) + 0.5) / (len(tf) + 0.5))
+            norm = k1 * (1.0 - b + b * lengths[ids] / avg)
+            self._postings[term] = (ids, (idf * freq * (k1 + 1.0) / (freq + norm)).astype(np.float32))
+        self._vocab = sorted(t[2:] for t in self._postings)
+        # typo candidates: length -> folded vocabulary words -> vocabulary words
+        self._folded = {}
+        self._by_len = {}
+        for w in self._vocab:
+            if len(w) >= self.MIN_TYPO_LEN:
+                f = _fold(w)
+                if f not in self._folded:
+                    self._by_len.setdefault(len(f), []).append(f)
+                self._folded.setdefault(f, []).append(w)
+
+    def _prefixed(self, word: str) -> List[str]:
+        lo = bisect.bisect_left(self._vocab, word)
+        hi = bisect.bisect_left(self._vocab, word + '\uffff', lo)
+        return [v for v in self._vocab[lo:min(hi, lo + self.MAX_PREFIX_WORDS)] if v != word]
+
+    def _corrected(self, word: str) -> List[str]:
+        """Closest vocabulary words to an unknown word: one edit for short words, two
+        from six letters, compared in folded form; only the nearest ones are kept.
+        """
+        if len(word) < self.MIN_TYPO_LEN or word.isdigit():
+            return []
+        f = _fold(word)
+        limit = 1 if len(f) <= 5 else 2
+        best, out = limit + 1, []
+        for c in (c for n in range(len(f) - limit, len(f) + limit + 1) for c in self._by_len.get(n, ())):
+            d = _edit_distance(f, c, limit)
+            if d < best:
+                best, out = d, [c]
+            elif d == best:
+                out.append(c)
+        return [w for c in sorted(out) for w in self._folded[c]] if best <= limit else []
+
+    def search(self, q: str, top_k: int):
+        """[(doc, score)] best first; documents without any matching term are left out."""
+        np = require_backend('numpy')
+        if not self.size:
+            return []
+        scores = np.zeros(self.size, dtype=np.float32)
+        for word in dict.fromkeys(_words(q)):
+            weighted = [(f'w:{word}', self.WORD_BOOST)]
+            if len(word) >= 2:
+                weighted += [(f'w:{v}', self.PREFIX_BOOST) for v in self._prefixed(word)]
+            if f'w:{word}' not in self._postings:
+                # unknown word: score the vocabulary words it is most likely a typo of
+                weighted += [(f'w:{v}', self.WORD_BOOST) for v in self._corrected(word)]
+            for term, boost in weighted:
+                post = self._postings.get(term)
+                if post is not None:
+                    scores[post[0]] += boost * post[1]
+        hits = int(np.count_nonzero(scores))
+        return [(i, s) for i, s in top_k_scores(scores, min(int(top_k), hits))]
+
+
+class IconIndex:
+    def __init__(self, data_dir: Optional[str] = None, cache_dir: Optional[str] = None, query_cache: int = 256):
+        self.data_dir = os.path.abspath(data_dir or os.environ.get('ICON_DATA_DIR') or _DEFAULT_DATA)
+        self.paths = { name: os.path.join(self.data_dir, fname) for name, fname in _SOURCES }
+        self.cache_dir = cache_dir or os.environ.get('ICON_EMBED_CACHE_DIR') or _DEFAULT_CACHE
+        self.query_cache = max(0, int(query_cache))
+        self._mtimes = None
+        self._icons: List[dict] = []
+        self._lexical = None
+        self._version = ''
+        self._matrices = {}
+        self._queries = OrderedDict()
+        self._lock = threading.Lock()
+        self._flight = SingleFlight()
+
+    def _stat(self) -> tuple:
+        mtimes = []
+        for path in self.paths.values():
+            try:
+                mtimes.append(os.stat(path).st_mtime_ns)
+            except OSError:
+                mtimes.append(None)
+        return tuple(mtimes)
+
+    def icons(self) -> List[dict]:
+        """Current catalogue; re-parsed only when a source file changed."""
+        mtimes = self._stat()
+        if mtimes != self._mtimes:
+            with self._lock:
+                if mtimes != self._mtimes:
+                    self._rebuild(mtimes)
+        return self._icons
+
+    def _rebuild(self, mtimes):
+        sources = {}
+        for name, path in self.paths.items():
+            try:
+                with open(path, 'r', encoding='utf-8') as fh:
+                    sources[name] = fh.read()
+            except OSError:
+                pass
+        icons, texts = build_catalogue(sources)
+        try:
+            lexical = LexicalIndex(texts)
+        except Exception as e:
+            print('Icon lexical index unavailable:', e)
+            lexical = None
+        labels = '\n'.join(i['label'] for i in icons)
+        self._icons = icons
+        self._lexical = lexical
+        self._version = hashlib.sha256(labels.encode('utf-8')).hexdigest()[:16]
+        self._matrices = {}
+        self._mtimes = mtimes
+
+    def lexical_search(self, q: str, top_k: int) -> List[dict]:
+        """Offline ranking; None when the lexical index could not be built."""
+        icons = self.icons()
+        lexical = self._lexical
+        if lexical is None:
+            return None
+        return [dict(icons[i], score=round(score, 4)) for i, score in lexical.search(q, top_k)]
+
+    def _matrix_path(self, model: str) -> str:
+        slug = re.sub(r'[^\w.-]+', '_', model)
+        return os.path.join(self.cache_dir, f'{slug}-{self._version}.npy')
+
+    async def label_matrix(self, model: str, embed: Callable[[Sequence[str]], Awaitable[list]]):
+        """(n_icons, dim) normalised label embeddings for `model`, computed once."""
+        icons = self.icons()
+        key = f'{model}:{self._version}'
+        mat = self._matrices.get(key)
+        if mat is not None:
+            return mat
+
+        async def build():
+            np = require_backend('numpy')
+            path = self._matrix_path(model)
+            if os.path.exists(path):
+                try:
+                    return np.load(path, mmap_mode='r')
+                except Exception as e:
+                    print('Icon embedding cache unreadable, rebuilding:', e)
+            vecs = _normalise(np.asarray(await embed([i['label'] for i in icons]), dtype=np.float32), np)
+            if vecs.shape[0] != len(icons):
+                raise RuntimeError(f'embedding returned {vecs.shape[0]} vectors for {len(icons)} labels')
+            os.makedirs(self.cache_dir, exist_ok=True)
+            tmp = f'{path}.{os.getpid()}.tmp.npy'
+            np.save(tmp, vecs)
+            os.replace(tmp, path)
+            return np.load(path, mmap_mode='r')
+
+        mat, _ = await self._flight.do(key, build)
+        self._matrices[key] = mat
+        return mat
+
+    async def query_vector(self, model: str, q: str, embed: Callable[[Sequence[str]], Awaitable[list]]):
+        key = (model, q)
+        vec = self._queries.get(key)
+        if vec is not None:
+            self._queries.move_to_end(key)
+            return vec
+        np = require_backend('numpy')
+        vec = _normalise(np.asarray(await embed([q]), dtype=np.float32), np)[0]
+        if self.query_cache:
+            self._queries[key] = vec
+            while len(self._queries) > self.query_cache:
+                self._queries.popitem(last=False)
+        return vec
+
+    async def semantic_search(self, q: str, top_k: int, model: str, embed: Callable[[Sequence[str]], Awaitable[list]]) -> List[dict]:
+        icons = self.icons()
+        if not icons:
+            return []
+        np = require_backend('numpy')
+        mat = await self.label_matrix(model, embed)
+        qvec = await self.query_vector(model, q, embed)
+        return [dict(icons[i], score=score) for i, score in top_k_scores(np.asarray(mat @ qvec), top_k)]
+
+
+def _normalise(vecs, np):
+    if vecs.ndim == 3:
+        # token-level features: mean-pool to one vector per text
+        vecs = vecs.mean(axis=1)
+    vecs = np.atleast_2d(vecs)
+    norms = np.linalg.norm(vecs, axis=1, keepdims=True)
+    return vecs / np.maximum(norms, 1e-12)
+
+
+def top_k_scores(scores, k: int):
+    """[(row, score)] of the `k` highest scores, best first."""
+    np = require_backend('numpy')
+    k = max(0, min(int(k), scores.shape[0]))
+    if k == 0:
+        return []
+    idx = np.argpartition(-scores, k - 1)[:k] if k < scores.shape[0] else np.arange(scores.shape[0])
+    idx = idx[np.argsort(-scores[idx], kind='stable')]
+    return [(int(i), float(scores[i])) for i in idx]
+
+
+ICON_INDEX = IconIndex()
@@ -0,0 +1,160 @@
+"""Decode-once image handle shared across pipeline stages.
+
+An `ImageHandle` wraps one image and lazily derives whatever representation a
+stage asks for: decoded pixels (`pil`, `rgb()`, `gray()`), PNG bytes or a data
+URL. Each representation is computed at most once and cached, and a handle
+built from encoded bytes or a data URL hands those back untouched instead of
+re-encoding. Handles are treated as immutable: a stage that changes pixels
+returns a new handle (`ImageHandle.from_pil(...)`).
+
+Endpoints encode handles to data URLs once, at the response boundary.
+"""
+import base64
+from io import BytesIO
+
+try:
+    from PIL import Image
+    PIL_AVAILABLE = True
+except Exception:
+    PIL_AVAILABLE = False
+
+try:
+    from .tracing import span
+except Exception:
+    from tracing import span
+
+
+def _sniff_mime(head: bytes) -> str:
+    if head.startswith(b'\x89PNG'):
+        return 'image/png'
+    if head.startswith(b'\xff\xd8'):
+        return 'image/jpeg'
+    if head[:4] == b'RIFF' and head[8:12] == b'WEBP':
+        return 'image/webp'
+    if head[:6] in (b'GIF87a', b'GIF89a'):
+        return 'image/gif'
+    return 'image/png'
+
+
+class ImageHandle:
+    __slots__ = ('_pil', '_encoded', '_mime', '_b64', '_png', '_views')
+
+    def __init__(self, pil=None, encoded: bytes = None, mime: str = None, b64: str = None):
+        self._pil = pil
+        self._encoded = encoded
+        self._mime = mime
+        self._b64 = b64
+        self._png = None
+        self._views = {}
+
+    @classmethod
+    def from_bytes(cls, data: bytes, mime: str = None) -> 'ImageHandle':
+        return cls(encoded=bytes(data), mime=mime or _sniff_mime(data[:16]))
+
+    @classmethod
+    def from_base64(cls, value: str) -> 'ImageHandle':
+        """Accept a data URL or bare base64 string. Nothing is decoded until needed."""
+        if value.startswith('data:'):
+            header, b64 = value.split(',', 1)
+            mime = header[5:].split(';', 1)[0] or None
+        else:
+            b64, mime = value, None
+        if mime is None:
+            try:
+                mime = _sniff_mime(base64.b64decode(b64[:24] + '=' * (-len(b64[:24]) % 4)))
+            except Exception:
+                # malformed input surfaces when the bytes are actually needed
+                mime = None
+        return cls(mime=mime, b64=b64)
+
+    @classmethod
+    def from_pil(cls, img) -> 'ImageHandle':
+        return cls(pil=img)
+
+    @property
+    def mime(self) -> str:
+        return self._mime or 'image/png'
+
+    def encoded_bytes(self) -> bytes:
+        """Bytes in the source encoding (PNG when built from pixels)."""
+        if self._encoded is None:
+            if self._b64 is not None:
+                self._encoded = base64.b64decode(self._b64)
+            else:
+                self._encoded = self.png_bytes()
+                self._mime = 'image/png'
+        return self._encoded
+
+    @property
+    def pil(self):
+        if self._pil is None:
+            if not PIL_AVAILABLE:
+                raise RuntimeError('Pillow required to decode images')
+            with span('decode'):
+                img = Image.open(BytesIO(self.encoded_bytes()))
+                # force a full decode so the image can be shared across threads safely
+                img.load()
+            self._pil = img
+        return self._pil
+
+    @property
+    def size(self):
+        return self.pil.size
+
+    def _view(self, mode: str):
+        view = self._views.get(mode)
+        if view is None:
+            img = self.pil
+            view = img if img.mode == mode else img.convert(mode)
+            self._views[mode] = view
+        return view
+
+    def rgb(self):
+        return self._view('RGB')
+
+    def rgba(self):
+        return self._view('RGBA')
+
+    def gray(self):
+        return self._view('L')
+
+    def png_bytes(self) -> bytes:
+        if self._png is None:
+            if self.mime == 'image/png' and (self._encoded is not None or self._b64 is not None):
+                self._png = self.encoded_bytes()
+            else:
+                img = self.pil
+                buf = BytesIO()
+                with span('encode'):
+                    img.save(buf, format='PNG')
+                self._png = buf.getvalue()
+        return self._png
+
+    def data_url(self) -> str:
+        if self._b64 is None:
+            self.encoded_bytes()
+            with span('encode'):
+                self._b64 = base64.b64encode(self._encoded).decode('utf-8')
+        return f'data:{self.mime};base64,{self._b64}'
+
+
+def as_handle(img) -> ImageHandle:
+    """Coerce bytes, a data URL/base64 string, a PIL image or a handle to a handle."""
+    if isinstance(img, ImageHandle):
+        return img
+    if isinstance(img, (bytes, bytearray)):
+        return ImageHandle.from_bytes(img)
+    if isinstance(img, str):
+        return ImageHandle.from_base64(img)
+    return ImageHandle.from_pil(img)
+
+
+def encode_images(obj):
+    """Response boundary: replace every ImageHandle in a result with its data URL."""
+    if isinstance(obj, ImageHandle):
+        return obj.data_url()
+    if isinstance(obj, dict):
+        return { k: encode_images(v) for k, v in obj.items() }
+    if isinstance(obj, list):
+        return [encode_images(v) for v in obj]
+    return obj
@@ -7,67 +7,62 @@ except Exception:
     PIL_AVAILABLE = False
 
 try:
-    import pytesseract
-    TESSERACT_AVAILABLE = True
+    from .ocr_pool import OCR_POOL
 except Exception:
-    pytesseract = None
-    TESSERACT_AVAILABLE = False
-
+    from ocr_pool import OCR_POOL
 try:
-    import cv2
-    import numpy as np
-    CV2_AVAILABLE = True
+    from .image_handle import as_handle
 except Exception:
-    cv2 = None
-    np = None
-    CV2_AVAILABLE = False
+    from image_handle import as_handle
+
+def _filter_words(words, min_confidence: int) -> List[Tuple[int,int,int,int,str]]:
+    return [(x, y, w, h, text) for (x, y, w, h, text, conf) in words if text and conf >= min_confidence]
+
 
-def detect_text_bboxes(img_bytes: bytes, min_confidence: int = 20) -> List[Tuple[int,int,int,int,str]]:
-    """Return list of (x, y, w, h, text) for detected OCR text boxes using pytesseract.
-    If pytesseract not available, return empty list.
+def detect_text_bboxes(img_bytes, min_confidence: int = 20) -> List[Tuple[int,int,int,int,str]]:
+    """Return list of (x, y, w, h, text) for detected OCR text boxes using the OCR pool backend.
+    If no OCR backend is available, return empty list.
     """
-    if not PIL_AVAILABLE or not TESSERACT_AVAILABLE:
+    if not PIL_AVAILABLE or OCR_POOL.backend() is None:
         return []
     try:
-        img = Image.open(BytesIO(img_bytes)).convert('RGB')
-        data = pytesseract.image_to_data(img, output_type=pytesseract.Output.DICT)
-        boxes = []
-        n = len(data.get('level', []))
-        for i in range(n):
-            conf = data.get('conf', [])[i]
-            try:
-                conf_v = int(float(conf))
-            except Exception:
-                conf_v = -1
-            text = (data.get('text', [''])[i] or '').strip()
-            if text and conf_v >= min_confidence:
-                x = int(data.get('left', [0])[i])
-                y = int(data.get('top', [0])[i])
-                w = int(data.get('width', [0])[i])
-                h = int(data.get('height', [0])[i])
-                boxes.append((x, y, w, h, text))
-        return boxes
+        return _filter_words(OCR_POOL.words_sync(img_bytes), min_confidence)
     except Exception:
         return []
 
 
-def make_mask_from_boxes(img_bytes: bytes, boxes: List[Tuple[int,int,int,int,str]], pad: int = 6) -> bytes:
+async def detect_text_bboxes_async(img_bytes, min_confidence: int = 20) -> List[Tuple[int,int,int,int,str]]:
+    """Async variant of `detect_text_bboxes` running on the shared OCR worker pool."""
+    if not PIL_AVAILABLE or OCR_POOL.backend() is None:
+        return []
+    try:
+        return _filter_words(await OCR_POOL.words(img_bytes), min_confidence)
+    except Exception:
+        return []
+
+
+def make_mask_image(size: Tuple[int,int], boxes: List[Tuple[int,int,int,int,str]], pad: int = 6):
+    """Binary 'L' mask of `size` where text boxes are white (to be inpainted) and background is black."""
+    w, h = size
+    mask = Image.new('L', (w, h), 0)
+    draw = ImageDraw.Draw(mask)
+    for (x, y, bw, bh, txt) in boxes:
+        x0 = max(0, x - pad)
+        y0 = max(0, y - pad)
+        x1 = min(w, x + bw + pad)
+        y1 = min(h, y + bh + pad)
+        draw.rectangle([x0, y0, x1, y1], fill=255)
+    return mask
+
+
+def make_mask_from_boxes(img_bytes, boxes: List[Tuple[int,int,int,int,str]], pad: int = 6) -> bytes:
     """Create a binary mask PNG where text boxes are white (to be inpainted) and background is black.
-    Returns PNG bytes. If PIL not available or no boxes, returns empty bytes.
+    Accepts image bytes or an ImageHandle. Returns PNG bytes. If PIL not available, returns empty bytes.
     """
     if not PIL_AVAILABLE:
         return b''
     try:
-        img = Image.open(BytesIO(img_bytes)).convert('RGBA')
-        w, h = img.size
-        mask = Image.new('L', (w, h), 0)
-        draw = ImageDraw.Draw(mask)
-        for (x, y, bw, bh, txt) in boxes:
-            x0 = max(0, x - pad)
-            y0 = max(0, y - pad)
-            x1 = min(w, x + bw + pad)
-            y1 = min(h, y + bh + pad)
-            draw.rectangle([x0, y0, x1, y1], fill=255)
+        mask = make_mask_image(as_handle(img_bytes).size, boxes, pad=pad)
         out = BytesIO()
         mask.save(out, format='PNG')
         return out.getvalue()
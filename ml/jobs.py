@@ -0,0 +1,247 @@
+"""Durable async jobs for long generations.
+
+`JobManager` accepts a job (a kind plus its request payload), records it in a
+SQLite database and runs it on a bounded set of asyncio workers. Status and
+the final result (or error) are written back to the database, so
+finished results survive a restart and jobs that were queued or running when
+the process stopped are picked up again on the next start.
+
+Env configuration:
+- JOB_WORKERS concurrent jobs (default 2)
+- JOBS_DB sqlite path (default ml/.cache/jobs.sqlite3)
+- JOB_TTL seconds to keep finished jobs (default 604800; <= 0 keeps forever)
+"""
+import os
+import json
+import time
+import uuid
+import asyncio
+import sqlite3
+import threading
+from typing import Callable, Dict, Optional, Sequence
+
+FINISHED = ('done', 'failed', 'cancelled')
+
+
+class JobStore:
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = None
+
+    def _db(self) -> sqlite3.Connection:
+        if self._conn is None:
+            if os.path.dirname(self.path):
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            conn = sqlite3.connect(self.path, check_same_thread=False)
+            conn.row_factory = sqlite3.Row
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS jobs ('
+                ' id TEXT PRIMARY KEY, kind TEXT NOT NULL, status TEXT NOT NULL,'
+                ' progress REAL NOT NULL DEFAULT 0, payload TEXT NOT NULL,'
+                ' result TEXT, error TEXT, created REAL NOT NULL, updated REAL NOT NULL)'
+            )
+            conn.execute('CREATE INDEX IF NOT EXISTS jobs_status ON jobs(status)')
+            conn.commit()
+            self._conn = conn
+        return self._conn
+
+    def _row(self, row) -> Optional[dict]:
+        if row is None:
+            return None
+        job = dict(row)
+        job['payload'] = json.loads(job['payload'])
+        job['result'] = json.loads(job['result']) if job['result'] else None
+        return job
+
+    def insert(self, kind: str, payload: dict) -> dict:
+        now = time.time()
+        job_id = uuid.uuid4().hex
+        with self._lock:
+            db = self._db()
+            db.execute(
+                'INSERT INTO jobs (id, kind, status, progress, payload, created, updated) VALUES (?, ?, ?, 0, ?, ?, ?)',
+                (job_id, kind, 'queued', json.dumps(payload), now, now),
+            )
+            db.commit()
+        return self.get(job_id)
+
+    def get(self, job_id: str) -> Optional[dict]:
+        with self._lock:
+            row = self._db().execute('SELECT * FROM jobs WHERE id = ?', (job_id,)).fetchone()
+        return self._row(row)
+
+    def update(self, job_id: str, only_if_status: Optional[Sequence[str]] = None, **fields) -> int:
+        """Set `fields` on a job; with `only_if_status`, only while the job is in one of
+        those statuses (checked in the same statement). Returns the rows changed.
+        """
+        if 'result' in fields and fields['result'] is not None:
+            fields['result'] = json.dumps(fields['result'], default=str)
+        fields['updated'] = time.time()
+        cols = ', '.join(f'{k} = ?' for k in fields)
+        where, params = 'id = ?', [job_id]
+        if only_if_status:
+            where += ' AND status IN (' + ', '.join('?' for _ in only_if_status) + ')'
+            params.extend(only_if_status)
+        with self._lock:
+            db = self._db()
+            cur = db.execute(f'UPDATE jobs SET {cols} WHERE {where}', (*fields.values(), *params))
+            db.commit()
+        return cur.rowcount
+
+    def pending_ids(self):
+        """Jobs left queued or running by a previous process, oldest first."""
+        with self._lock:
+            rows = self._db().execute(
+                "SELECT id FROM jobs WHERE status IN ('queued', 'running') ORDER BY created"
+            ).fetchall()
+        return [r['id'] for r in rows]
+
+    def purge(self, older_than: float) -> int:
+        marks = ', '.join('?' for _ in FINISHED)
+        with self._lock:
+            db = self._db()
+            cur = db.execute(f'DELETE FROM jobs WHERE status IN ({marks}) AND updated < ?', (*FINISHED, older_than))
+            db.commit()
+        return cur.rowcount
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+
+class JobManager:
+    """Runs stored jobs on `workers` asyncio tasks.
+    `runners` maps a job kind to `async fn(payload, progress)`, where
+    `progress(fraction)` may be called to report 0..1 completion and the
+    return value must be JSON-serialisable.
+    """
+
+    def __init__(self, store: JobStore, runners: Dict[str, Callable], workers: int = 2, ttl: float = 0):
+        self.store = store
+        self.runners = runners
+        self.workers = max(1, int(workers))
+        self.ttl = float(ttl)
+        self._queue = None
+        self._tasks = []
+        self._running = {}
+        self._progress = {}
+        self._cancelled = set()
+
+    async def start(self):
+        if self._tasks:
+            return
+        self._queue = asyncio.Queue()
+        if self.ttl > 0:
+            await asyncio.to_thread(self.store.purge, time.time() - self.ttl)
+        # resume work interrupted by a restart
+        for job_id in await asyncio.to_thread(self.store.pending_ids):
+            await asyncio.to_thread(self.store.update, job_id, status='queued', progress=0)
+            self._queue.put_nowait(job_id)
+        self._tasks = [asyncio.ensure_future(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self):
+        tasks, self._tasks = self._tasks, []
+        for t in tasks:
+            t.cancel()
+        if tasks:
+            await asyncio.gather(*tasks, return_exceptions=True)
+        await asyncio.to_thread(self.store.close)
+
+    async def submit(self, kind: str, payload: dict) -> dict:
+        if kind not in self.runners:
+            raise KeyError(kind)
+        job = await asyncio.to_thread(self.store.insert, kind, payload)
+        if self._queue is None:
+            await self.start()
+        self._queue.put_nowait(job['id'])
+        return job
+
+    async def get(self, job_id: str) -> Optional[dict]:
+        job = await asyncio.to_thread(self.store.get, job_id)
+        # live progress is kept in memory; only the final value is persisted
+        if job is not None and job['status'] == 'running' and job_id in self._progress:
+            job['progress'] = self._progress[job_id]
+        return job
+
+    async def cancel(self, job_id: str) -> Optional[dict]:
+        job = await self.get(job_id)
+        if job is None or job['status'] in FINISHED:
+            return job
+        self._cancelled.add(job_id)
+        task = self._running.get(job_id)
+        if task is not None:
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+        # a queued job is skipped by the worker when dequeued
+        # a job that finished meanwhile keeps its result
+        await asyncio.to_thread(self.store.update, job_id, ('queued', 'running'), status='cancelled')
+        return await self.get(job_id)
+
+    async def _worker(self):
+        while True:
+            job_id = await self._queue.get()
+            try:
+                await self._run(job_id)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print('Job worker error:', job_id, e)
+
+    async def _run(self, job_id: str):
+        job = await asyncio.to_thread(self.store.get, job_id)
+        if job is None or job['status'] != 'queued':
+            self._cancelled.discard(job_id)
+            return
+        await asyncio.to_thread(self.store.update, job_id, status='running', progress=0)
+
+        def progress(fraction: float):
+            self._progress[job_id] = max(0.0, min(1.0, float(fraction)))
+
+        task = asyncio.ensure_future(self.runners[job['kind']](job['payload'], progress))
+        self._running[job_id] = task
+        if job_id in self._cancelled:
+            # cancelled while we were marking it running
+            task.cancel()
+        try:
+            result = await asyncio.shield(task)
+        except asyncio.CancelledError:
+            if job_id in self._cancelled:
+                await asyncio.to_thread(self.store.update, job_id, ('queued', 'running'), status='cancelled')
+                return
+            # worker shutdown: stop the job and leave it queued for the next start
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+            await asyncio.to_thread(self.store.update, job_id, status='queued', progress=0)
+            raise
+        except Exception as e:
+            detail = getattr(e, 'detail', None) or str(e)
+            await asyncio.to_thread(self.store.update, job_id, status='failed', error=str(detail))
+            return
+        finally:
+            self._running.pop(job_id, None)
+            self._progress.pop(job_id, None)
+            self._cancelled.discard(job_id)
+        await asyncio.to_thread(self.store.update, job_id, status='done', progress=1.0, result=result)
+
+
+def _env_float(name: str, default: float) -> float:
+    try:
+        return float(os.environ.get(name, default))
+    except Exception:
+        return default
+
+
+_DEFAULT_DB = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.cache', 'jobs.sqlite3')
+
+
+def make_job_manager(runners: Dict[str, Callable]) -> JobManager:
+    return JobManager(
+        JobStore(os.environ.get('JOBS_DB') or _DEFAULT_DB),
+        runners,
+        workers=int(_env_float('JOB_WORKERS', 2)),
+        ttl=_env_float('JOB_TTL', 7 * 24 * 3600.0),
+    )
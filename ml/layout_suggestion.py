@@ -0,0 +1,407 @@
+"""Business-card text layout engine.
+
+A layout spec places groups of fields (name block, contact details) into
+regions of the card with an alignment, a vertical anchor and optionally a 90
+degree rotation. Each group is fitted to its region: the name takes the largest
+size that fits the region's width and height budget, title / company / details
+follow a fixed typographic hierarchy, individual detail lines shrink (down to a
+legibility floor) or wrap when they are too wide. A block that still does not
+fit grows past its region but stays inside the card's safe area (bottom-anchored
+groups grow upwards); boxes past their region's width or height, and the layout
+itself, are marked `overflow`.
+
+Text is measured with real font metrics. Glyph advances are cached per
+(font, size) and filled lazily one character at a time, so after warm-up a
+line is measured with dictionary lookups instead of a FreeType call.
+
+Specs exist for each category in `frontend/100_business_card_text_layout_prompts.json`
+(`prompt_layouts()` maps every prompt to one) and for the legacy
+`logo_preference` placements.
+
+Env configuration:
+- LAYOUT_FONT / LAYOUT_FONT_BOLD TrueType files for details / name
+  (default DejaVu Sans, then Pillow's bundled font)
+- LAYOUT_FONT_CACHE max cached (style, size) font entries (default 256)
+"""
+import os
+import re
+import json
+import threading
+from typing import Dict, List, Optional
+
+try:
+    from PIL import ImageFont
+    PIL_AVAILABLE = True
+except Exception:
+    PIL_AVAILABLE = False
+
+_HERE = os.path.dirname(os.path.abspath(__file__))
+PROMPTS_PATH = os.path.join(_HERE, '..', 'frontend', '100_business_card_text_layout_prompts.json')
+
+MARGIN = 0.05
+# size relative to NAME (prompts: title 35-45% smaller, details ~1/3 of the name)
+WEIGHTS = { 'name': 1.0, 'title': 0.6, 'company': 0.5, 'detail': 0.36 }
+DETAIL_FIELDS = ('phone', 'email', 'website', 'address')
+LINE_GAP = 1.2
+# print sizes at 300 DPI on a 1050px-wide card: NAME <= 34pt, details >= 7pt
+NAME_MAX_PX = 142.0
+DETAIL_MIN_PX = 29.0
+
+
+class FontMetrics:
+    """Advance widths and line metrics for one font file at one pixel size."""
+
+    def __init__(self, font, size: int):
+        self.font = font
+        self.size = size
+        self._advances = {}
+        self._lock = threading.Lock()
+        if font is not None:
+            ascent, descent = font.getmetrics()
+        else:
+            ascent, descent = round(size * 0.8), round(size * 0.2)
+        self.line_height = ascent + descent
+
+    def width(self, text: str) -> float:
+        adv = self._advances
+        missing = [ch for ch in set(text) if ch not in adv]
+        if missing:
+            with self._lock:
+                for ch in missing:
+                    adv[ch] = self.font.getlength(ch) if self.font is not None else self.size * 0.55
+        return sum(adv[ch] for ch in text)
+
+
+class FontBook:
+    """Per (style, size) FontMetrics cache, bounded to `max_entries` (oldest evicted first)."""
+
+    def __init__(self, regular: Optional[str] = None, bold: Optional[str] = None, max_entries: Optional[int] = None):
+        self.paths = {
+            'regular': regular or os.environ.get('LAYOUT_FONT') or 'DejaVuSans.ttf',
+            'bold': bold or os.environ.get('LAYOUT_FONT_BOLD') or 'DejaVuSans-Bold.ttf',
+        }
+        if max_entries is None:
+            try:
+                max_entries = int(os.environ.get('LAYOUT_FONT_CACHE', 256))
+            except Exception:
+                max_entries = 256
+        self.max_entries = max(8, max_entries)
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _load(self, style: str, size: int):
+        if not PIL_AVAILABLE:
+            return None
+        try:
+            return ImageFont.truetype(self.paths[style], size)
+        except Exception:
+            pass
+        try:
+            # Pillow >= 10.1 bundles a scalable font
+            return ImageFont.load_default(size=size)
+        except TypeError:
+            return None
+
+    def metrics(self, style: str, size: int) -> FontMetrics:
+        size = max(1, int(size))
+        key = (style, size)
+        m = self._metrics.get(key)
+        if m is None:
+            with self._lock:
+                m = self._metrics.get(key)
+                if m is None:
+                    m = FontMetrics(self._load(style, size), size)
+                    if len(self._metrics) >= self.max_entries:
+                        self._metrics.pop(next(iter(self._metrics)))
+                    self._metrics[key] = m
+        return m
+
+    def cached_sizes(self) -> int:
+        return len(self._metrics)
+
+
+FONTS = FontBook()
+
+
+# --- layout specs -----------------------------------------------------------
+
+def _group(fields, region, align='left', valign='top', rotate=0, inline=False):
+    return { 'fields': fields, 'region': region, 'align': align, 'valign': valign, 'rotate': rotate, 'inline': inline }
+
+
+_NAME_BLOCK = ['name', 'title', 'company']
+_ALL = _NAME_BLOCK + ['details']
+_M = MARGIN
+_FULL_H = 1 - 2 * _M
+
+CATEGORY_SPECS = {
+    'Centered': { 'groups': [_group(_ALL, (_M, 0.25, 1 - 2 * _M, 0.5), 'center', 'center')] },
+    'Split 50/50': { 'groups': [
+        _group(_NAME_BLOCK, (_M, _M, 0.45 - _M, _FULL_H), 'left', 'center'),
+        _group(['details'], (0.55, _M, 0.45 - _M, _FULL_H), 'left', 'center'),
+    ] },
+    'Top-Left Anchor': { 'groups': [_group(_ALL, (_M, _M, 0.6, 0.6), 'left', 'top')], 'logo': (0.75, 0.6, 0.2, 0.35) },
+    'Top-Right Anchor': { 'groups': [_group(_ALL, (0.35, _M, 0.6, 0.6), 'right', 'top')], 'logo': (0.05, 0.6, 0.2, 0.35) },
+    'Bottom-Left Anchor': { 'groups': [_group(_ALL, (_M, 0.35, 0.6, 0.6), 'left', 'bottom')], 'logo': (0.75, 0.05, 0.2, 0.35) },
+    'Bottom-Right Anchor': { 'groups': [_group(_ALL, (0.35, 0.35, 0.6, 0.6), 'right', 'bottom')], 'logo': (0.05, 0.05, 0.2, 0.35) },
+    'Left Edge Column': { 'groups': [_group(_ALL, (_M, _M, 0.5, _FULL_H), 'left', 'center')], 'logo': (0.7, 0.3, 0.25, 0.4) },
+    'Right Edge Column': { 'groups': [_group(_ALL, (0.45, _M, 0.5, _FULL_H), 'right', 'center')], 'logo': (0.05, 0.3, 0.25, 0.4) },
+    'Split 30/70': { 'groups': [_group(_ALL, (0.3 + _M, _M, 0.7 - 2 * _M, _FULL_H), 'left', 'center')], 'logo': (_M, 0.3, 0.3 - 2 * _M, 0.4) },
+    'Vertical/Rotated': { 'groups': [
+        _group(['name'], (_M, _M, 0.15, _FULL_H), 'center', 'center', rotate=90),
+        _group(['title', 'company', 'details'], (0.25, _M, 0.7, _FULL_H), 'left', 'center'),
+    ] },
+    'Diagonal': { 'groups': [
+        _group(_NAME_BLOCK, (_M, _M, 0.6, 0.45), 'left', 'top'),
+        _group(['details'], (0.4, 0.5, 0.55, 0.45), 'right', 'bottom'),
+    ] },
+    'Overlay/Badge': { 'groups': [
+        _group(_NAME_BLOCK, (_M, _M, 1 - 2 * _M, 0.65), 'left', 'bottom'),
+        _group(['details'], (_M, 0.77, 1 - 2 * _M, 0.2), 'left', 'center', inline=True),
+    ] },
+    'Minimalist': { 'groups': [
+        _group(['name'], (_M, _M, 0.5, 0.15), 'left', 'top'),
+        _group(['details'], (0.35, 0.85, 0.6, 0.1), 'right', 'bottom', inline=True),
+    ] },
+    # legacy logo_preference placements
+    'logo-left': { 'groups': [_group(_ALL, (0.33, _M, 0.62, _FULL_H), 'left', 'center')], 'logo': (0.05, 0.2, 0.25, 0.6) },
+    'logo-right': { 'groups': [_group(_ALL, (_M, _M, 0.62, _FULL_H), 'left', 'center')], 'logo': (0.70, 0.2, 0.25, 0.6) },
+    'logo-center': { 'groups': [_group(_ALL, (_M, 0.38, 1 - 2 * _M, 0.57), 'center', 'center')], 'logo': (0.35, 0.05, 0.30, 0.30) },
+}
+
+
+def spec_for_prompt(prompt: dict) -> dict:
+    spec = dict(CATEGORY_SPECS.get(prompt.get('category'), CATEGORY_SPECS['Centered']))
+    text = prompt.get('prompt', '')
+    if 'No logo' in text:
+        spec.pop('logo', None)
+    if any(k in text for k in ('single inline row', 'single contact line', 'one line', 'middle dots')):
+        spec['groups'] = [dict(g, inline=True) if 'details' in g['fields'] else g for g in spec['groups']]
+    return spec
+
+
+_PROMPTS = None
+
+
+def prompt_layouts() -> Dict[int, dict]:
+    """Prompt id -> {'id', 'name', 'category', 'spec'} for the frontend layout prompts (parsed once)."""
+    global _PROMPTS
+    if _PROMPTS is None:
+        try:
+            with open(PROMPTS_PATH, 'r', encoding='utf-8') as fh:
+                prompts = json.load(fh)
+        except Exception as e:
+            print('Layout prompts unavailable:', e)
+            prompts = []
+        _PROMPTS = {
+            int(p['id']): { 'id': int(p['id']), 'name': p.get('name'), 'category': p.get('category'), 'spec': spec_for_prompt(p) }
+            for p in prompts if 'id' in p
+        }
+    return _PROMPTS
+
+
+# --- fitting ------------------------------------------------------------------
+
+def _lines_for(fields: List[str], card: dict, inline: bool) -> List[tuple]:
+    """[(field, kind, text)] for the non-empty fields of a group."""
+    out = []
+    for f in fields:
+        if f != 'details':
+            if card.get(f):
+                out.append((f, f, str(card[f]).strip()))
+            continue
+        details = []
+        for d in DETAIL_FIELDS:
+            for part in str(card.get(d) or '').splitlines():
+                if part.strip():
+                    details.append((d, part.strip()))
+        details += [('contact', str(c).strip()) for c in (card.get('contact') or []) if str(c).strip()]
+        if inline and details:
+            out.append(('details', 'detail', ' · '.join(t for _, t in details)))
+        else:
+            out.extend((d, 'detail', t) for d, t in details)
+    return out
+
+
+def _style(kind: str) -> str:
+    return 'bold' if kind == 'name' else 'regular'
+
+
+_BREAK_RE = re.compile(r'(?=@)|(?<=[./-])')
+
+
+def _wrap(text: str, metrics: FontMetrics, max_w: float) -> List[str]:
+    # break at spaces, then inside long tokens (emails, URLs) before '@' or after '.', '/', '-'
+    tokens = []
+    for i, word in enumerate(text.split(' ')):
+        pieces = [p for p in _BREAK_RE.split(word) if p] if metrics.width(word) > max_w else [word]
+        tokens.extend((p, i > 0 and j == 0) for j, p in enumerate(pieces))
+    lines, cur = [], ''
+    for piece, spaced in tokens:
+        trial = cur + (' ' if spaced and cur else '') + piece
+        if cur and metrics.width(trial) > max_w:
+            lines.append(cur)
+            cur = piece
+        else:
+            cur = trial
+    lines.append(cur)
+    return lines
+
+
+def _name_cap(lines: List[tuple], region_w: float, region_h: float, scale: float, fonts: FontBook) -> float:
+    """Largest NAME size the group's lines allow (widths scale ~linearly with size)."""
+    ref = 100
+    caps = [NAME_MAX_PX * scale, region_h / (LINE_GAP * sum(WEIGHTS[kind] for _, kind, _ in lines))]
+    for _, kind, text in lines:
+        if kind != 'detail':
+            # detail lines shrink or wrap on their own instead of capping the hierarchy
+            caps.append(region_w * ref / max(fonts.metrics(_style(kind), ref).width(text), 1.0) / WEIGHTS[kind])
+    return min(caps)
+
+
+def _fit_group(lines: List[tuple], region_w: float, region_h: float, name: float, scale: float, fonts: FontBook) -> List[dict]:
+    """Sizes and wrapped text for each line; the block may overflow only past the legibility floor."""
+    min_detail = DETAIL_MIN_PX * scale
+    while True:
+        out = []
+        detail = max(min_detail, name * WEIGHTS['detail'])
+        for field, kind, text in lines:
+            size = detail if kind == 'detail' else max(min_detail, name * WEIGHTS[kind])
+            m = fonts.metrics(_style(kind), size)
+            width = m.width(text)
+            if width > region_w:
+                # shrink this line alone, down to the floor; wrap what still does not fit
+                size = max(min_detail, int(size * region_w / width))
+                m = fonts.metrics(_style(kind), size)
+            parts = _wrap(text, m, region_w) if m.width(text) > region_w else [text]
+            out.append({ 'field': field, 'kind': kind, 'size': m.size, 'metrics': m, 'lines': parts })
+        height = sum(o['metrics'].line_height * LINE_GAP * len(o['lines']) for o in out)
+        if height <= region_h or name * WEIGHTS['detail'] <= min_detail:
+            return out
+        name *= min(0.95, max(0.5, region_h / height))
+
+
+def _frame(group: dict, W: float, H: float) -> tuple:
+    rx, ry, rw, rh = (group['region'][0] * W, group['region'][1] * H, group['region'][2] * W, group['region'][3] * H)
+    # rotated groups are laid out in their own (height x width) frame
+    fw, fh = (rh, rw) if group['rotate'] == 90 else (rw, rh)
+    return (rx, ry, rw, rh), (fw, fh)
+
+
+def _layout_group(group: dict, lines: List[tuple], name: float, W: float, H: float, fonts: FontBook) -> List[dict]:
+    (rx, ry, rw, rh), (fw, fh) = _frame(group, W, H)
+    rotated = group['rotate'] == 90
+    fitted = _fit_group(lines, fw, fh, name, H / 600.0, fonts)
+    block_h = sum(o['metrics'].line_height * LINE_GAP * len(o['lines']) for o in fitted)
+    v = { 'top': 0.0, 'center': (fh - block_h) / 2.0, 'bottom': fh - block_h }[group['valign']]
+    v = max(0.0, v)
+    # a block still taller than its region (at the legibility floor) may grow past it,
+    # but stays inside the card's safe area: bottom-anchored groups grow upwards
+    origin, extent = (rx, W) if rotated else (ry, H)
+    safe_lo, safe_hi = MARGIN * extent - origin, (1 - MARGIN) * extent - origin
+    if v + block_h > safe_hi:
+        v = max(safe_lo, safe_hi - block_h)
+    boxes = []
+    for o in fitted:
+        m = o['metrics']
+        lh = m.line_height * LINE_GAP
+        line_w = max(m.width(t) for t in o['lines'])
+        u = { 'left': 0.0, 'center': (fw - line_w) / 2.0, 'right': fw - line_w }[group['align']]
+        bw, bh = line_w, lh * len(o['lines'])
+        if rotated:
+            # text reads bottom-to-top: frame (u, v) -> card (rx + v, ry + rh - u - width)
+            x, y, w, h = rx + v, ry + rh - u - bw, bh, bw
+        else:
+            x, y, w, h = rx + u, ry + v, bw, bh
+        box = {
+            'field': o['field'], 'x': round(x / W, 4), 'y': round(y / H, 4), 'w': round(w / W, 4), 'h': round(h / H, 4),
+            'font_size': o['size'], 'font_weight': 'bold' if o['kind'] == 'name' else 'regular',
+            'align': group['align'], 'lines': o['lines'],
+        }
+        if rotated:
+            box['rotate'] = 90
+        if line_w > fw + 0.5 or v < -0.5 or v + bh > fh + 0.5:
+            # wider than the region, or pushed past its top / bottom
+            box['overflow'] = True
+        boxes.append(box)
+        v += bh
+    return boxes
+
+
+def _union(boxes: List[dict]) -> dict:
+    x0 = min(b['x'] for b in boxes)
+    y0 = min(b['y'] for b in boxes)
+    x1 = max(b['x'] + b['w'] for b in boxes)
+    y1 = max(b['y'] + b['h'] for b in boxes)
+    return { 'x': round(x0, 4), 'y': round(y0, 4), 'w': round(x1 - x0, 4), 'h': round(y1 - y0, 4) }
+
+
+def resolve_spec(card: dict) -> tuple:
+    """(spec, layout info) from layout_id, category or logo_preference."""
+    layout_id = card.get('layout_id')
+    if layout_id is not None:
+        entry = prompt_layouts().get(int(layout_id))
+        if entry is None:
+            raise ValueError(f'unknown layout_id {layout_id}')
+        return entry['spec'], { 'id': entry['id'], 'name': entry['name'], 'category': entry['category'] }
+    category = card.get('category')
+    if category:
+        if category not in CATEGORY_SPECS:
+            raise ValueError(f'unknown layout category {category!r}')
+        return CATEGORY_SPECS[category], { 'category': category }
+    pref = card.get('logo_preference') or 'left'
+    key = f'logo-{pref}' if f'logo-{pref}' in CATEGORY_SPECS else 'logo-center'
+    return CATEGORY_SPECS[key], { 'category': key }
+
+
+def text_boxes(card: dict, fonts: Optional[FontBook] = None) -> tuple:
+    """(spec, layout info, boxes): one fitted box per text line group, in drawing order,
+    each with its `field` ('details' for an inline block, 'contact' for extra lines)."""
+    fonts = fonts or FONTS
+    W = float(card.get('width') or 1050)
+    H = float(card.get('height') or 600)
+    spec, info = resolve_spec(card)
+    groups = [(g, _lines_for(g['fields'], card, g['inline'])) for g in spec['groups']]
+    groups = [(g, lines) for g, lines in groups if lines]
+    # one NAME size for the whole card keeps the hierarchy consistent across groups
+    name = min((_name_cap(lines, *_frame(g, W, H)[1], H / 600.0, fonts) for g, lines in groups), default=NAME_MAX_PX)
+    return spec, info, [box for group, lines in groups for box in _layout_group(group, lines, name, W, H, fonts)]
+
+
+def suggest_layout(card: dict, fonts: Optional[FontBook] = None) -> dict:
+    """Boxes as fractions of the card (x, y, w, h) with fitted font sizes in card pixels."""
+    W = float(card.get('width') or 1050)
+    H = float(card.get('height') or 600)
+    spec, info, placed = text_boxes(card, fonts)
+    boxes = {}
+    if spec.get('logo'):
+        x, y, w, h = spec['logo']
+        boxes['logo'] = { 'x': x, 'y': y, 'w': w, 'h': h }
+    details = []
+    for box in placed:
+        box = dict(box)
+        field = box.pop('field')
+        if field in DETAIL_FIELDS or field in ('contact', 'details'):
+            details.append(box)
+            if field in ('contact', 'details'):
+                continue
+        # a multi-line address keeps its first box; the contact block covers the rest
+        boxes.setdefault(field, box)
+    if details:
+        boxes['contact'] = dict(_union(details), lines=[t for b in details for t in b['lines']], font_size=details[0]['font_size'])
+        if any(b.get('overflow') for b in details):
+            boxes['contact']['overflow'] = True
+    out = { 'width': int(W), 'height': int(H), 'layout': info, 'boxes': boxes }
+    if any(b.get('overflow') for b in placed):
+        out['overflow'] = True
+    return out
+
+
+def suggest_layouts(cards: List[dict], fonts: Optional[FontBook] = None) -> List[dict]:
+    out = []
+    for card in cards:
+        try:
+            out.append(suggest_layout(card, fonts))
+        except ValueError as e:
+            out.append({ 'error': str(e) })
+    return out
@@ -0,0 +1,208 @@
+#!/usr/bin/env python3
+"""Open-loop load generator for the ML service's /generate/* endpoints.
+
+Requests are started on a fixed schedule at `--rps` (Poisson arrivals with
+`--poisson`) whatever the latency, so queueing and retry storms show up in the
+numbers instead of slowing the generator down. Run it against a service wired
+to mock_providers.py to load-test retries, backoff and fallbacks offline:
+
+    python ml/loadgen.py --url http://127.0.0.1:8000 --mock-url http://127.0.0.1:9100 \
+        --endpoint /generate/logo --rps 5 --duration 60 --out load.json
+
+Reports latency percentiles (all requests and successes only), throughput,
+an error breakdown (HTTP status plus a short detail, or the client exception),
+and, with `--mock-url`, provider call amplification: upstream HF / Stability
+calls per service request, read from the mock's /__mock/stats before and after.
+Prompts get a per-request suffix so the result cache does not absorb the load
+(`--repeat-prompts` keeps them identical to measure cache hits instead).
+"""
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+from collections import Counter
+from typing import Dict, List, Optional
+
+import httpx
+
+DEFAULT_BODIES = {
+    '/generate/logo': { 'prompt': 'flat vector logo for a coffee roastery, two colours', 'width': 512, 'height': 512, 'steps': 20 },
+    '/generate/card': { 'prompt': 'business card for Alice Example, Example Co, clean layout', 'width': 512, 'height': 320, 'steps': 20 },
+    '/generate/stability': { 'prompt': 'business card mockup, minimalist', 'width': 512, 'height': 512, 'steps': 20 },
+    '/generate/multi': { 'prompt': 'minimalist logo, geometric fox', 'width': 512, 'height': 512, 'steps': 20, 'mode': 'first' },
+}
+
+
+def _percentile(sorted_vals: List[float], q: float) -> Optional[float]:
+    if not sorted_vals:
+        return None
+    k = (len(sorted_vals) - 1) * q
+    lo = int(k)
+    hi = min(lo + 1, len(sorted_vals) - 1)
+    return round(sorted_vals[lo] + (sorted_vals[hi] - sorted_vals[lo]) * (k - lo), 2)
+
+
+def _latency_summary(ms: List[float]) -> Dict:
+    ms = sorted(ms)
+    return {
+        'count': len(ms),
+        'mean_ms': round(sum(ms) / len(ms), 2) if ms else None,
+        'p50_ms': _percentile(ms, 0.5),
+        'p95_ms': _percentile(ms, 0.95),
+        'p99_ms': _percentile(ms, 0.99),
+        'max_ms': round(ms[-1], 2) if ms else None,
+    }
+
+
+def _error_key(status: Optional[int], body: str = '', exc: Optional[BaseException] = None) -> str:
+    if exc is not None:
+        return f'client:{type(exc).__name__}'
+    detail = ''
+    try:
+        detail = str(json.loads(body).get('detail', ''))
+    except Exception:
+        detail = body
+    # keep the leading words only so similar errors group together
+    detail = ' '.join(detail.split()[:4])
+    return f'{status}:{detail}' if detail else str(status)
+
+
+async def _mock_stats(client: httpx.AsyncClient, mock_url: Optional[str]) -> Optional[Dict]:
+    if not mock_url:
+        return None
+    try:
+        r = await client.get(mock_url.rstrip('/') + '/__mock/stats', timeout=5.0)
+        return r.json().get('providers')
+    except Exception as e:
+        print('mock stats unavailable:', e, file=sys.stderr)
+        return None
+
+
+def _amplification(before: Optional[Dict], after: Optional[Dict], requests: int) -> Optional[Dict]:
+    if before is None or after is None or not requests:
+        return None
+    out = {}
+    total = 0
+    for provider, stats in after.items():
+        prev = before.get(provider, {})
+        calls = stats['calls'] - prev.get('calls', 0)
+        statuses = { k: v - prev.get('by_status', {}).get(k, 0) for k, v in stats['by_status'].items() }
+        total += calls
+        out[provider] = {
+            'calls': calls,
+            'calls_per_request': round(calls / requests, 3),
+            'by_status': { k: v for k, v in statuses.items() if v },
+        }
+    out['total_calls_per_request'] = round(total / requests, 3)
+    return out
+
+
+async def run(args) -> Dict:
+    url = args.url.rstrip('/') + args.endpoint
+    body = dict(DEFAULT_BODIES.get(args.endpoint, { 'prompt': 'test' }))
+    if args.body:
+        body.update(json.loads(args.body))
+    if not args.repeat_prompts:
+        body['cache_bypass'] = True
+    rng = random.Random(args.seed)
+    limits = httpx.Limits(max_connections=args.max_in_flight, max_keepalive_connections=args.max_in_flight)
+    results = []
+    in_flight = asyncio.Semaphore(args.max_in_flight)
+    dropped = 0
+
+    async with httpx.AsyncClient(limits=limits, timeout=httpx.Timeout(args.timeout, connect=10.0)) as client:
+        before = await _mock_stats(client, args.mock_url)
+
+        async def one(i: int):
+            payload = dict(body)
+            if not args.repeat_prompts:
+                payload['prompt'] = f"{body['prompt']} #{i}"
+            t0 = time.perf_counter()
+            try:
+                r = await client.post(url, json=payload)
+                ms = (time.perf_counter() - t0) * 1000.0
+                ok = r.status_code == 200 and 'error' not in (r.json() if r.headers.get('content-type', '').startswith('application/json') else {})
+                results.append({ 'ms': ms, 'ok': ok, 'status': r.status_code, 'error': None if ok else _error_key(r.status_code, r.text[:500]) })
+            except Exception as e:
+                results.append({ 'ms': (time.perf_counter() - t0) * 1000.0, 'ok': False, 'status': None, 'error': _error_key(None, exc=e) })
+            finally:
+                in_flight.release()
+
+        tasks = []
+        started = time.perf_counter()
+        next_at = started
+        i = 0
+        while next_at - started < args.duration:
+            delay = next_at - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            if in_flight.locked():
+                # at the in-flight cap the schedule keeps going and this arrival is dropped
+                dropped += 1
+            else:
+                await in_flight.acquire()
+                tasks.append(asyncio.create_task(one(i)))
+            i += 1
+            gap = rng.expovariate(args.rps) if args.poisson else 1.0 / args.rps
+            next_at += gap
+        window = time.perf_counter() - started
+        if tasks:
+            await asyncio.gather(*tasks)
+        elapsed = time.perf_counter() - started
+        after = await _mock_stats(client, args.mock_url)
+
+    ok_ms = [r['ms'] for r in results if r['ok']]
+    return {
+        'meta': {
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+            'url': url, 'target_rps': args.rps, 'duration_s': args.duration, 'poisson': args.poisson,
+            'max_in_flight': args.max_in_flight, 'timeout_s': args.timeout, 'body': body,
+        },
+        'requests': len(results),
+        'dropped': dropped,
+        'succeeded': len(ok_ms),
+        'error_rate': round(1 - len(ok_ms) / len(results), 4) if results else None,
+        # arrivals over the arrival window; goodput also counts the drain of in-flight requests
+        'achieved_rps': round(len(results) / window, 3) if window else None,
+        'goodput_rps': round(len(ok_ms) / elapsed, 3) if elapsed else None,
+        'latency': _latency_summary([r['ms'] for r in results]),
+        'latency_ok': _latency_summary(ok_ms),
+        'errors': dict(Counter(r['error'] for r in results if not r['ok']).most_common()),
+        'status_codes': dict(Counter(str(r['status']) for r in results)),
+        'provider_amplification': _amplification(before, after, len(results)),
+    }
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description='Open-loop load generator for /generate/* endpoints')
+    ap.add_argument('--url', default='http://127.0.0.1:8000', help='ML service base URL')
+    ap.add_argument('--endpoint', default='/generate/logo', help='one of ' + ', '.join(DEFAULT_BODIES))
+    ap.add_argument('--rps', type=float, default=2.0, help='target request rate')
+    ap.add_argument('--duration', type=float, default=30.0, help='seconds of arrivals (in-flight requests are awaited)')
+    ap.add_argument('--poisson', action='store_true', help='exponential inter-arrival times instead of a fixed rate')
+    ap.add_argument('--max-in-flight', type=int, default=256, help='arrivals beyond this many open requests are dropped')
+    ap.add_argument('--timeout', type=float, default=300.0, help='client timeout per request (s)')
+    ap.add_argument('--body', help='JSON merged into the default request body')
+    ap.add_argument('--repeat-prompts', action='store_true', help='identical prompts (exercise the result cache)')
+    ap.add_argument('--mock-url', help='mock_providers.py base URL, for provider call amplification')
+    ap.add_argument('--seed', type=int, default=0)
+    ap.add_argument('--out', help='write the JSON report here (default: stdout)')
+    args = ap.parse_args(argv)
+    if args.rps <= 0:
+        ap.error('--rps must be > 0')
+
+    report = asyncio.run(run(args))
+    text = json.dumps(report, indent=2)
+    if args.out:
+        with open(args.out, 'w', encoding='utf-8') as fh:
+            fh.write(text + '\n')
+        lat = report['latency']
+        print(f"{report['requests']} requests, {report['succeeded']} ok, p50 {lat['p50_ms']} ms, p95 {lat['p95_ms']} ms, p99 {lat['p99_ms']} ms", file=sys.stderr)
+    else:
+        print(text)
+
+
+if __name__ == '__main__':
+    main()
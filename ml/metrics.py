@@ -0,0 +1,373 @@
+"""In-process Prometheus metrics (text exposition format 0.0.4).
+
+A small dependency-free registry: counters, gauges and fixed-bucket histograms
+with labels. Recording is a dict lookup for the label set plus an integer or
+float update under a per-series lock, so instrumentation stays off the
+profile; everything else (cumulative buckets, formatting) happens when
+/metrics is scraped.
+
+The instruments the service records live at module level below, e.g.
+
+    PROVIDER_RETRIES.inc('hf', '503')
+    with STAGE_SECONDS.time('postprocess'):
+        ...
+
+`MetricsMiddleware` wraps the ASGI app to record per-endpoint latency and
+in-flight requests (labelled by route template, not raw path). `stage()` and
+provider calls also record request spans (see tracing.py).
+
+Env configuration:
+- METRICS_ENABLED (default 1): 0 turns /metrics off and every instrument into a no-op
+"""
+import os
+import time
+import bisect
+import threading
+from typing import Iterable, List, Optional, Sequence, Tuple
+
+try:
+    from .tracing import span
+except Exception:
+    from tracing import span
+
+ENABLED = str(os.environ.get('METRICS_ENABLED', '1')).lower() not in ('0', 'false', 'no')
+
+# seconds; provider calls and card generation reach minutes
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+STAGE_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _escape(value: str) -> str:
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _labels(names: Sequence[str], values: Sequence[str], extra: str = '') -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return '{' + ','.join(parts) + '}' if parts else ''
+
+
+def _fmt(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) and not value.is_integer() else str(int(value))
+
+
+class _Metric:
+    kind = ''
+
+    def __init__(self, name: str, doc: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.doc = doc
+        self.label_names = tuple(labels)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def _child(self, values: Tuple[str, ...]):
+        series = self._series.get(values)
+        if series is None:
+            with self._lock:
+                series = self._series.setdefault(values, self._new())
+        return series
+
+    def _new(self):
+        raise NotImplementedError
+
+    def header(self) -> List[str]:
+        return [f'# HELP {self.name} {self.doc}', f'# TYPE {self.name} {self.kind}']
+
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def _new(self):
+        return [0.0, threading.Lock()]
+
+    def inc(self, *labels, amount: float = 1.0):
+        if not ENABLED:
+            return
+        s = self._child(tuple(str(v) for v in labels))
+        with s[1]:
+            s[0] += amount
+
+    def value(self, *labels) -> float:
+        s = self._series.get(tuple(str(v) for v in labels))
+        return s[0] if s else 0.0
+
+    def collect(self) -> List[str]:
+        lines = self.header()
+        for values, s in sorted(self._series.items()):
+            lines.append(f'{self.name}_total{_labels(self.label_names, values)} {_fmt(s[0])}')
+        return lines
+
+
+class Gauge(_Metric):
+    kind = 'gauge'
+
+    def _new(self):
+        return [0.0, threading.Lock()]
+
+    def add(self, amount: float, *labels):
+        if not ENABLED:
+            return
+        s = self._child(tuple(str(v) for v in labels))
+        with s[1]:
+            s[0] += amount
+
+    def set(self, value: float, *labels):
+        if not ENABLED:
+            return
+        self._child(tuple(str(v) for v in labels))[0] = value
+
+    def track(self, *labels) -> '_InFlight':
+        """Context manager: +1 while the block runs."""
+        return _InFlight(self, labels)
+
+    def collect(self) -> List[str]:
+        lines = self.header()
+        for values, s in sorted(self._series.items()):
+            lines.append(f'{self.name}{_labels(self.label_names, values)} {_fmt(s[0])}')
+        return lines
+
+
+class _InFlight:
+    __slots__ = ('gauge', 'labels')
+
+    def __init__(self, gauge: Gauge, labels):
+        self.gauge = gauge
+        self.labels = labels
+
+    def __enter__(self):
+        self.gauge.add(1, *self.labels)
+        return self
+
+    def __exit__(self, *exc):
+        self.gauge.add(-1, *self.labels)
+        return False
+
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, name: str, doc: str, labels: Sequence[str] = (), buckets: Iterable[float] = LATENCY_BUCKETS):
+        super().__init__(name, doc, labels)
+        self.buckets = tuple(sorted(buckets))
+
+    def _new(self):
+        # per-bucket (non-cumulative) counts, +Inf slot last, then sum; lock
+        return [[0] * (len(self.buckets) + 1), 0.0, threading.Lock()]
+
+    def observe(self, seconds: float, *labels):
+        if not ENABLED:
+            return
+        s = self._child(tuple(str(v) for v in labels))
+        i = bisect.bisect_left(self.buckets, seconds)
+        with s[2]:
+            s[0][i] += 1
+            s[1] += seconds
+
+    def time(self, *labels) -> '_Timer':
+        return _Timer(self, labels)
+
+    def count(self, *labels) -> int:
+        s = self._series.get(tuple(str(v) for v in labels))
+        return sum(s[0]) if s else 0
+
+    def collect(self) -> List[str]:
+        lines = self.header()
+        for values, s in sorted(self._series.items()):
+            with s[2]:
+                counts, total = list(s[0]), s[1]
+            running = 0
+            for bound, n in zip(self.buckets + (float('inf'),), counts):
+                running += n
+                le = f'le="{_fmt(bound)}"'
+                lines.append(f'{self.name}_bucket{_labels(self.label_names, values, le)} {running}')
+            lines.append(f'{self.name}_sum{_labels(self.label_names, values)} {repr(float(total))}')
+            lines.append(f'{self.name}_count{_labels(self.label_names, values)} {running}')
+        return lines
+
+
+class _Timer:
+    __slots__ = ('hist', 'labels', 't0')
+
+    def __init__(self, hist: Histogram, labels):
+        self.hist = hist
+        self.labels = labels
+
+    def __enter__(self):
+        self.t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.hist.observe(time.perf_counter() - self.t0, *self.labels)
+        return False
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric: _Metric) -> _Metric:
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        lines = []
+        for m in self._metrics:
+            lines.extend(m.collect())
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+HTTP_REQUEST_SECONDS = REGISTRY.register(Histogram(
+    'ml_http_request_duration_seconds', 'Request latency by endpoint (route template), method and status.',
+    ('endpoint', 'method', 'status')))
+HTTP_IN_FLIGHT = REGISTRY.register(Gauge(
+    'ml_http_requests_in_flight', 'Requests currently being served, by endpoint.', ('endpoint',)))
+PROVIDER_CALL_SECONDS = REGISTRY.register(Histogram(
+    'ml_provider_call_duration_seconds', 'Outbound provider call latency to response headers (or error).',
+    ('provider', 'operation')))
+PROVIDER_CALLS = REGISTRY.register(Counter(
+    'ml_provider_calls', "Outbound provider calls by status code ('timeout' / 'error' when no response).",
+    ('provider', 'operation', 'status')))
+PROVIDER_IN_FLIGHT = REGISTRY.register(Gauge(
+    'ml_provider_calls_in_flight', 'Outbound provider calls awaiting a response.', ('provider',)))
+PROVIDER_RETRIES = REGISTRY.register(Counter(
+    'ml_provider_retries', 'Provider call retries, by provider and reason.', ('provider', 'reason')))
+PROVIDER_FALLBACKS = REGISTRY.register(Counter(
+    'ml_provider_fallbacks', 'Requests moved to another provider or API version (from -> to), by reason.',
+    ('from_provider', 'to_provider', 'reason')))
+CIRCUIT_STATE = REGISTRY.register(Gauge(
+    'ml_provider_circuit_state', 'Circuit breaker state per provider route (0 closed, 1 half-open, 2 open).', ('route',)))
+CIRCUIT_TRANSITIONS = REGISTRY.register(Counter(
+    'ml_provider_circuit_transitions', 'Circuit breaker state changes per provider route, by new state.', ('route', 'state')))
+STAGE_SECONDS = REGISTRY.register(Histogram(
+    'ml_stage_duration_seconds', 'CPU / pipeline stage durations (postprocess, sr, ocr, text_boost, vectorize, ...).',
+    ('stage',), STAGE_BUCKETS))
+CACHE_REQUESTS = REGISTRY.register(Counter(
+    'ml_cache_requests', 'Cache lookups by cache and result (hit | miss | bypass | coalesced).', ('cache', 'result')))
+
+
+def _provider_operation(host_path: str) -> Tuple[str, str]:
+    """(provider, operation) for an outbound URL path."""
+    path = host_path.lower()
+    if '/v2beta/' in path:
+        return 'stability', 'v2beta'
+    if '/v1/generation/' in path:
+        return 'stability', 'v1'
+    if '/models/' in path:
+        return 'hf', 'inference'
+    return 'other', 'other'
+
+
+try:
+    import httpx
+
+    class InstrumentedTransport(httpx.AsyncBaseTransport):
+        """httpx transport wrapper that records provider call metrics."""
+
+        def __init__(self, transport: httpx.AsyncBaseTransport, provider: Optional[str] = None):
+            self._transport = transport
+            self._provider = provider
+
+        async def handle_async_request(self, request):
+            provider, operation = _provider_operation(request.url.path)
+            provider = provider if provider != 'other' else (self._provider or provider)
+            t0 = time.perf_counter()
+            status = 'error'
+            with PROVIDER_IN_FLIGHT.track(provider), span(f'provider.{provider}'):
+                try:
+                    response = await self._transport.handle_async_request(request)
+                    status = str(response.status_code)
+                    return response
+                except httpx.TimeoutException:
+                    status = 'timeout'
+                    raise
+                finally:
+                    PROVIDER_CALL_SECONDS.observe(time.perf_counter() - t0, provider, operation)
+                    PROVIDER_CALLS.inc(provider, operation, status)
+
+        async def aclose(self):
+            await self._transport.aclose()
+except Exception:
+    InstrumentedTransport = None
+
+
+class MetricsMiddleware:
+    """ASGI middleware: latency histogram and in-flight gauge per route template.
+    The template is resolved against `router` before the request runs (memoized
+    per method and path, bounded) so in-flight counts carry the endpoint too.
+    """
+
+    def __init__(self, app, router=None, skip: Sequence[str] = ('/metrics',), max_paths: int = 2048):
+        self.app = app
+        self.router = router
+        self.skip = set(skip)
+        self.max_paths = max_paths
+        self._endpoints = {}
+
+    def _endpoint(self, scope) -> str:
+        key = (scope.get('method'), scope.get('path'))
+        endpoint = self._endpoints.get(key)
+        if endpoint is None:
+            endpoint = 'unmatched'
+            for route in getattr(self.router, 'routes', ()):
+                match, _ = route.matches(scope)
+                if match.name == 'FULL':
+                    endpoint = getattr(route, 'path', endpoint)
+                    break
+            if len(self._endpoints) < self.max_paths:
+                self._endpoints[key] = endpoint
+        return endpoint
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http' or not ENABLED or scope.get('path') in self.skip:
+            await self.app(scope, receive, send)
+            return
+        endpoint = self._endpoint(scope)
+        status = ['500']
+
+        async def _send(message):
+            if message['type'] == 'http.response.start':
+                status[0] = str(message['status'])
+            await send(message)
+
+        t0 = time.perf_counter()
+        with HTTP_IN_FLIGHT.track(endpoint):
+            try:
+                await self.app(scope, receive, _send)
+            finally:
+                HTTP_REQUEST_SECONDS.observe(time.perf_counter() - t0, endpoint, scope.get('method', ''), status[0])
+
+
+def render() -> str:
+    return REGISTRY.render()
+
+
+class _Stage:
+    __slots__ = ('timer', 'span')
+
+    def __init__(self, name: str):
+        self.timer = STAGE_SECONDS.time(name)
+        self.span = span(name)
+
+    def __enter__(self):
+        self.span.__enter__()
+        self.timer.__enter__()
+        return self
+
+    def __exit__(self, *exc):
+        self.timer.__exit__(*exc)
+        self.span.__exit__(*exc)
+        return False
+
+
+def stage(name: str) -> _Stage:
+    """Context manager timing one pipeline stage into ml_stage_duration_seconds
+    and, inside a request, a span of the same name (Server-Timing).
+    """
+    return _Stage(name)
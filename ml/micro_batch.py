@@ -0,0 +1,106 @@
+"""Cross-request micro-batching for pipeline calls.
+
+`MicroBatcher` collects pending items that share a batch key (for local
+diffusion: width, height, steps and high_noise_frac) for up to `window`
+seconds, or until `max_batch` items are waiting, then hands the whole group to
+`run_batch(key, items)` in one call and splits the returned list back to the
+individual callers. Batches run one at a time on a dedicated thread, so the
+pipelines are never entered concurrently; `run_exclusive` lets other pipeline
+work (refine, inpaint) share that thread.
+
+`run_batch` is a plain synchronous function, so the scheduler can be driven
+by a stub on CPU.
+
+Env configuration:
+- LOCAL_BATCH_WINDOW_MS gather window (default 50)
+- LOCAL_BATCH_MAX largest batch (default 4)
+"""
+import os
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Hashable, Optional
+
+
+def _env_float(name: str, default: float) -> float:
+    try:
+        return float(os.environ.get(name, default))
+    except Exception:
+        return default
+
+
+class MicroBatcher:
+    def __init__(self, run_batch: Callable, window: Optional[float] = None, max_batch: Optional[int] = None):
+        self.run_batch = run_batch
+        self.window = max(0.0, float(window if window is not None else _env_float('LOCAL_BATCH_WINDOW_MS', 50) / 1000.0))
+        self.max_batch = max(1, int(max_batch if max_batch is not None else _env_float('LOCAL_BATCH_MAX', 4)))
+        self.stats = { 'batches': 0, 'items': 0, 'largest': 0 }
+        self._groups = {}
+        self._running = set()
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def _ensure_executor(self) -> ThreadPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='batch')
+            return self._executor
+
+    async def submit(self, key: Hashable, item):
+        """Queue `item` under `key` and wait for its slot of the batched result."""
+        loop = asyncio.get_running_loop()
+        fut = loop.create_future()
+        group = self._groups.get(key)
+        if group is None:
+            group = { 'items': [] }
+            self._groups[key] = group
+            group['timer'] = loop.call_later(self.window, self._flush, key, group)
+        group['items'].append((item, fut))
+        if len(group['items']) >= self.max_batch:
+            self._flush(key, group)
+        return await fut
+
+    async def run_exclusive(self, fn: Callable, *args):
+        """Run other pipeline work on the batch thread, between batches."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._ensure_executor(), fn, *args)
+
+    def pending(self) -> int:
+        return sum(len(g['items']) for g in self._groups.values())
+
+    def _flush(self, key, group):
+        if self._groups.get(key) is not group:
+            return
+        del self._groups[key]
+        group['timer'].cancel()
+        # callers that gave up before the batch started are dropped from it
+        items = [(item, fut) for item, fut in group['items'] if not fut.done()]
+        if not items:
+            return
+        task = asyncio.ensure_future(self._run(key, items))
+        self._running.add(task)
+        task.add_done_callback(self._running.discard)
+
+    async def _run(self, key, items):
+        loop = asyncio.get_running_loop()
+        try:
+            results = await loop.run_in_executor(self._ensure_executor(), self.run_batch, key, [item for item, _ in items])
+            if len(results) != len(items):
+                raise RuntimeError(f'batch returned {len(results)} results for {len(items)} inputs')
+        except Exception as e:
+            for _, fut in items:
+                if not fut.done():
+                    fut.set_exception(e)
+            return
+        self.stats['batches'] += 1
+        self.stats['items'] += len(items)
+        self.stats['largest'] = max(self.stats['largest'], len(items))
+        for (_, fut), result in zip(items, results):
+            if not fut.done():
+                fut.set_result(result)
+
+    def shutdown(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True)
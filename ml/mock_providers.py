@@ -0,0 +1,322 @@
+#!/usr/bin/env python3
+"""Local stand-in for the Hugging Face inference and Stability APIs.
+
+Point the ML service at it with HF_API_BASE / STABILITY_API_BASE (any token or
+key value works) to exercise retries, backoff, hedging and fallbacks offline:
+
+    python ml/mock_providers.py --port 9100 --hf-latency-ms 800 --hf-rate-503 0.2
+    HF_API_BASE=http://127.0.0.1:9100 STABILITY_API_BASE=http://127.0.0.1:9100 \
+        HUGGINGFACE_API_TOKEN=mock STABILITY_API_KEY=mock uvicorn server:app
+
+Endpoints mimicked:
+- POST /models/{model}: text-to-image (PNG bytes), feature extraction (list
+  inputs -> vectors), text generation (`max_new_tokens` -> generated_text) and
+  image-to-image (multipart image -> PNG)
+- POST /v2beta/stable-image/generate/{variant}: raw image bytes
+- POST /v1/generation/{engine}/text-to-image: JSON `artifacts`
+
+Per provider (hf, stability) behaviour, set by flags, MOCK_* env or at runtime
+through POST /__mock/config:
+- latency_ms / latency_sigma: lognormal latency (median, shape)
+- rate_429 / rate_503 / rate_402: fraction of calls answered with that status
+- cold_start_s: a model's first call starts a warm-up of this long; HF answers
+  503 "Model is loading" meanwhile (or waits, with options.wait_for_model)
+- timeout_rate: fraction of calls that hang for hang_s (client read timeouts)
+
+GET /__mock/stats returns call counts by provider, route and status (0 = hung),
+which the load generator (loadgen.py) uses to report provider call
+amplification.
+"""
+import os
+import io
+import json
+import base64
+import time
+import math
+import random
+import asyncio
+import hashlib
+import argparse
+import threading
+from email.parser import BytesParser
+from email.policy import HTTP
+from typing import Dict, Optional
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, Response
+
+try:
+    from PIL import Image
+    PIL_AVAILABLE = True
+except Exception:
+    PIL_AVAILABLE = False
+
+PROVIDERS = ('hf', 'stability')
+_FIELDS = {
+    'latency_ms': 400.0, 'latency_sigma': 0.35, 'rate_429': 0.0, 'rate_503': 0.0, 'rate_402': 0.0,
+    'cold_start_s': 0.0, 'timeout_rate': 0.0, 'hang_s': 300.0,
+}
+EMBED_DIM = 384
+
+
+class ProviderBehaviour:
+    __slots__ = tuple(_FIELDS)
+
+    def __init__(self, **values):
+        for k, default in _FIELDS.items():
+            setattr(self, k, float(values.get(k, default)))
+
+    @classmethod
+    def from_env(cls, provider: str) -> 'ProviderBehaviour':
+        values = {}
+        for k in _FIELDS:
+            raw = os.environ.get(f'MOCK_{provider.upper()}_{k.upper()}')
+            if raw not in (None, ''):
+                try:
+                    values[k] = float(raw)
+                except ValueError:
+                    pass
+        return cls(**values)
+
+    def update(self, values: Dict):
+        for k, v in values.items():
+            if k in _FIELDS and v is not None:
+                setattr(self, k, float(v))
+
+    def as_dict(self) -> Dict:
+        return { k: getattr(self, k) for k in _FIELDS }
+
+
+class MockState:
+    def __init__(self):
+        self.behaviour = { p: ProviderBehaviour.from_env(p) for p in PROVIDERS }
+        self.rng = random.Random(int(os.environ.get('MOCK_SEED', 0)) or None)
+        self._warm_at = {}  # (provider, model) -> time the model is ready
+        self._stats = {}
+        self._lock = threading.Lock()
+
+    def record(self, provider: str, route: str, status: int):
+        key = (provider, route, status)
+        with self._lock:
+            self._stats[key] = self._stats.get(key, 0) + 1
+
+    def stats(self) -> Dict:
+        with self._lock:
+            items = list(self._stats.items())
+        out = { p: { 'calls': 0, 'by_status': {}, 'by_route': {} } for p in PROVIDERS }
+        for (provider, route, status), n in items:
+            entry = out[provider]
+            entry['calls'] += n
+            entry['by_status'][str(status)] = entry['by_status'].get(str(status), 0) + n
+            entry['by_route'][route] = entry['by_route'].get(route, 0) + n
+        return out
+
+    def reset(self):
+        with self._lock:
+            self._stats.clear()
+            self._warm_at.clear()
+
+    def cold_remaining(self, provider: str, model: str) -> float:
+        """Seconds until `model` is warm; the first call starts the warm-up."""
+        b = self.behaviour[provider]
+        if b.cold_start_s <= 0:
+            return 0.0
+        now = time.monotonic()
+        with self._lock:
+            ready = self._warm_at.setdefault((provider, model), now + b.cold_start_s)
+        return max(0.0, ready - now)
+
+    def latency(self, provider: str) -> float:
+        b = self.behaviour[provider]
+        if b.latency_ms <= 0:
+            return 0.0
+        return b.latency_ms / 1000.0 * math.exp(self.rng.gauss(0.0, b.latency_sigma))
+
+    def fault(self, provider: str) -> Optional[str]:
+        """'429' | '503' | '402' | 'hang' | None, drawn from the configured rates."""
+        b = self.behaviour[provider]
+        r = self.rng.random()
+        for name, rate in (('429', b.rate_429), ('503', b.rate_503), ('402', b.rate_402), ('hang', b.timeout_rate)):
+            if r < rate:
+                return name
+            r -= rate
+        return None
+
+
+STATE = MockState()
+app = FastAPI(title='Mock HF / Stability providers')
+_PNG_CACHE = {}
+
+
+def _png(width: int, height: int, seed: str) -> bytes:
+    """Flat-colour PNG of the requested size (one encode per size and colour)."""
+    width, height = max(8, min(int(width or 512), 2048)), max(8, min(int(height or 512), 2048))
+    colour = tuple(hashlib.sha256(seed.encode('utf-8')).digest()[:3])
+    key = (width, height, colour)
+    data = _PNG_CACHE.get(key)
+    if data is None:
+        if not PIL_AVAILABLE:
+            raise RuntimeError('Pillow required for mock images')
+        buf = io.BytesIO()
+        Image.new('RGB', (width, height), colour).save(buf, format='PNG', compress_level=1)
+        data = buf.getvalue()
+        if len(_PNG_CACHE) < 256:
+            _PNG_CACHE[key] = data
+    return data
+
+
+def _fault_response(provider: str, fault: str) -> Response:
+    if fault == '429':
+        return JSONResponse({ 'error': 'Rate limit reached', 'name': 'rate_limited' }, status_code=429, headers={ 'Retry-After': '1' })
+    if fault == '402':
+        return JSONResponse({ 'name': 'payment_required', 'errors': ['insufficient credits'] }, status_code=402)
+    if provider == 'hf':
+        return JSONResponse({ 'error': 'Service Unavailable' }, status_code=503)
+    return JSONResponse({ 'name': 'service_unavailable', 'errors': ['temporarily unavailable'] }, status_code=503)
+
+
+async def _simulate(provider: str, route: str, model: str, wait_for_model: bool = True) -> Optional[Response]:
+    """Latency, cold start and injected faults; a Response means 'answer with this'."""
+    b = STATE.behaviour[provider]
+    cold = STATE.cold_remaining(provider, model)
+    if cold > 0:
+        if provider == 'hf' and not wait_for_model:
+            STATE.record(provider, route, 503)
+            return JSONResponse({ 'error': f'Model {model} is currently loading', 'estimated_time': round(cold, 1) }, status_code=503)
+        await asyncio.sleep(cold)
+    fault = STATE.fault(provider)
+    if fault == 'hang':
+        # counted up front (status 0): the client has usually given up before this returns
+        STATE.record(provider, route, 0)
+        await asyncio.sleep(b.hang_s)
+        return JSONResponse({ 'error': 'upstream timeout' }, status_code=504)
+    await asyncio.sleep(STATE.latency(provider))
+    if fault:
+        STATE.record(provider, route, int(fault))
+        return _fault_response(provider, fault)
+    STATE.record(provider, route, 200)
+    return None
+
+
+async def _form(request: Request) -> Dict[str, bytes]:
+    """multipart/form-data fields as raw bytes (stdlib parser; no python-multipart needed)."""
+    head = f"Content-Type: {request.headers.get('content-type', '')}\r\n\r\n".encode('latin-1')
+    msg = BytesParser(policy=HTTP).parsebytes(head + await request.body())
+    fields = {}
+    if msg.is_multipart():
+        for part in msg.iter_parts():
+            name = part.get_param('name', header='content-disposition')
+            if name:
+                fields[name] = part.get_payload(decode=True) or b''
+    return fields
+
+
+def _field(form: Dict[str, bytes], name: str):
+    raw = form.get(name)
+    return raw.decode('utf-8', 'replace') if raw is not None else None
+
+
+def _embedding(text: str):
+    digest = hashlib.sha256(text.encode('utf-8')).digest()
+    rng = random.Random(digest)
+    return [rng.uniform(-1.0, 1.0) for _ in range(EMBED_DIM)]
+
+
+@app.post('/models/{model:path}')
+async def hf_model(model: str, request: Request):
+    ctype = request.headers.get('content-type', '')
+    if ctype.startswith('multipart/'):
+        image = (await _form(request)).get('image')
+        size = (512, 512)
+        if image and PIL_AVAILABLE:
+            try:
+                size = Image.open(io.BytesIO(image)).size
+            except Exception:
+                pass
+        early = await _simulate('hf', 'image-to-image', model)
+        if early is not None:
+            return early
+        return Response(content=_png(size[0] * 2, size[1] * 2, model), media_type='image/png')
+    try:
+        payload = await request.json()
+    except Exception:
+        payload = {}
+    inputs = payload.get('inputs')
+    params = payload.get('parameters') or {}
+    wait = bool((payload.get('options') or {}).get('wait_for_model', False))
+    if isinstance(inputs, list):
+        early = await _simulate('hf', 'feature-extraction', model, wait)
+        return early or JSONResponse([_embedding(str(t)) for t in inputs])
+    if 'max_new_tokens' in params:
+        early = await _simulate('hf', 'text-generation', model, wait)
+        return early or JSONResponse([{ 'generated_text': f'{inputs} -- clean, legible layout, balanced palette' }])
+    early = await _simulate('hf', 'text-to-image', model, wait)
+    if early is not None:
+        return early
+    return Response(content=_png(params.get('width'), params.get('height'), str(inputs)), media_type='image/png')
+
+
+@app.post('/v2beta/stable-image/generate/{variant}')
+async def stability_v2(variant: str, request: Request):
+    form = await _form(request)
+    early = await _simulate('stability', f'v2beta/{variant}', variant)
+    if early is not None:
+        return early
+    # always PNG bytes; the label follows output_format like the real endpoint
+    fmt = _field(form, 'output_format') or 'png'
+    return Response(content=_png(_field(form, 'width'), _field(form, 'height'), str(_field(form, 'prompt'))), media_type=f'image/{fmt}')
+
+
+@app.post('/v1/generation/{engine}/text-to-image')
+async def stability_v1(engine: str, request: Request):
+    try:
+        payload = await request.json()
+    except Exception:
+        payload = {}
+    early = await _simulate('stability', 'v1/text-to-image', engine)
+    if early is not None:
+        return early
+    prompt = ' '.join(str(t.get('text', '')) for t in payload.get('text_prompts') or [])
+    png = _png(payload.get('width'), payload.get('height'), prompt)
+    arts = [{ 'base64': base64.b64encode(png).decode('ascii'), 'finishReason': 'SUCCESS', 'seed': i } for i in range(int(payload.get('samples') or 1))]
+    return { 'artifacts': arts }
+
+
+@app.get('/__mock/stats')
+async def mock_stats():
+    return { 'providers': STATE.stats(), 'config': { p: b.as_dict() for p, b in STATE.behaviour.items() } }
+
+
+@app.post('/__mock/config')
+async def mock_config(request: Request):
+    """Body: {"hf": {...}, "stability": {...}} with any ProviderBehaviour fields."""
+    body = await request.json()
+    for p in PROVIDERS:
+        if isinstance(body.get(p), dict):
+            STATE.behaviour[p].update(body[p])
+    return { p: b.as_dict() for p, b in STATE.behaviour.items() }
+
+
+@app.post('/__mock/reset')
+async def mock_reset():
+    STATE.reset()
+    return { 'ok': True }
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description='Mock Hugging Face / Stability provider server')
+    ap.add_argument('--host', default='127.0.0.1')
+    ap.add_argument('--port', type=int, default=9100)
+    for p in PROVIDERS:
+        for k in _FIELDS:
+            ap.add_argument(f'--{p}-{k.replace("_", "-")}', type=float, default=None)
+    args = ap.parse_args(argv)
+    for p in PROVIDERS:
+        STATE.behaviour[p].update({ k: getattr(args, f'{p}_{k}') for k in _FIELDS })
+    print('Mock providers:', json.dumps({ p: b.as_dict() for p, b in STATE.behaviour.items() }))
+    import uvicorn
+    uvicorn.run(app, host=args.host, port=args.port, log_level='warning')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,139 @@
+"""Accept-driven response encoding for image-producing endpoints.
+
+JSON with data-URL images stays the default. A client that prefers an image
+type (`Accept: image/png`, `image/*`) gets the raw bytes of the primary image;
+one that prefers `multipart/mixed` gets a JSON metadata part followed by one
+binary part per image, with the metadata referring to each image as
+`cid:<content-id>`. Binary modes skip base64 entirely: image parts carry the
+handle's source encoding as-is.
+"""
+import json
+import uuid
+from typing import List, Optional, Tuple
+
+from fastapi import Response
+
+try:
+    from .image_handle import ImageHandle, encode_images
+except Exception:
+    from image_handle import ImageHandle, encode_images
+
+
+def _parse_accept(accept: Optional[str]) -> List[Tuple[str, float]]:
+    ranges = []
+    for part in (accept or '').split(','):
+        fields = [f.strip() for f in part.split(';')]
+        media = fields[0].lower()
+        if not media:
+            continue
+        q = 1.0
+        for f in fields[1:]:
+            if f.lower().startswith('q='):
+                try:
+                    q = float(f[2:])
+                except Exception:
+                    q = 0.0
+        ranges.append((media, q))
+    return ranges
+
+
+def preferred_format(accept: Optional[str]) -> str:
+    """'json', 'image', 'multipart', or 'image|multipart' when both binary forms
+    are equally preferred. Ties with JSON and bare wildcards resolve to JSON.
+    """
+    best = { 'json': -1.0, 'image': -1.0, 'multipart': -1.0 }
+    for media, q in _parse_accept(accept):
+        if media in ('application/json', 'application/*', '*/*'):
+            key = 'json'
+        elif media.startswith('image/'):
+            key = 'image'
+        elif media in ('multipart/mixed', 'multipart/*'):
+            key = 'multipart'
+        else:
+            continue
+        best[key] = max(best[key], q)
+    if best['json'] < 0 and best['image'] <= 0 and best['multipart'] <= 0:
+        return 'json'
+    top = max(best.values())
+    if best['json'] >= top:
+        return 'json'
+    # with image and multipart equally preferred, let the result pick (see negotiate)
+    if best['image'] >= top and best['multipart'] >= top:
+        return 'image|multipart'
+    return 'image' if best['image'] >= top else 'multipart'
+
+
+def _collect(obj, found: list):
+    if isinstance(obj, ImageHandle):
+        if not any(h is obj for h in found):
+            found.append(obj)
+    elif isinstance(obj, dict):
+        for v in obj.values():
+            _collect(v, found)
+    elif isinstance(obj, list):
+        for v in obj:
+            _collect(v, found)
+    return found
+
+
+def _primary(result, handles: list) -> Optional[ImageHandle]:
+    if isinstance(result, dict):
+        for key in ('best', 'image', 'result_image'):
+            value = result.get(key)
+            if isinstance(value, ImageHandle):
+                return value
+            # /generate/with-score: best is a scored candidate {'provider', 'image', ...}
+            if isinstance(value, dict):
+                inner = _primary(value, [])
+                if inner is not None:
+                    return inner
+    return handles[0] if handles else None
+
+
+def _with_refs(obj, handles: list):
+    if isinstance(obj, ImageHandle):
+        idx = next(i for i, h in enumerate(handles) if h is obj)
+        return f'cid:image-{idx}'
+    if isinstance(obj, dict):
+        return { k: _with_refs(v, handles) for k, v in obj.items() }
+    if isinstance(obj, list):
+        return [_with_refs(v, handles) for v in obj]
+    return obj
+
+
+def multipart_body(result, handles: list) -> Tuple[bytes, str]:
+    boundary = uuid.uuid4().hex
+    meta = json.dumps(_with_refs(result, handles), default=str).encode('utf-8')
+    chunks = [
+        f'--{boundary}\r\nContent-Type: application/json\r\nContent-ID: <meta>\r\n\r\n'.encode('ascii'),
+        meta,
+    ]
+    for i, h in enumerate(handles):
+        data = h.encoded_bytes()
+        chunks.append((
+            f'\r\n--{boundary}\r\nContent-Type: {h.mime}\r\nContent-ID: <image-{i}>\r\n'
+            f'Content-Length: {len(data)}\r\n\r\n'
+        ).encode('ascii'))
+        chunks.append(data)
+    chunks.append(f'\r\n--{boundary}--\r\n'.encode('ascii'))
+    return b''.join(chunks), boundary
+
+
+def negotiate(accept: Optional[str], result):
+    """Encode an endpoint result (ImageHandles inside) according to `accept`.
+    Results without images always go out as JSON.
+    """
+    fmt = preferred_format(accept)
+    if fmt == 'json':
+        return encode_images(result)
+    handles = _collect(result, [])
+    if not handles:
+        return encode_images(result)
+    if fmt == 'image|multipart':
+        fmt = 'image' if len(handles) == 1 else 'multipart'
+    headers = { 'Vary': 'Accept', 'X-Image-Count': str(len(handles)) }
+    if fmt == 'image':
+        img = _primary(result, handles)
+        return Response(content=img.encoded_bytes(), media_type=img.mime, headers=headers)
+    body, boundary = multipart_body(result, handles)
+    return Response(content=body, media_type=f'multipart/mixed; boundary={boundary}', headers=headers)
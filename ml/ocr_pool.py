@@ -0,0 +1,203 @@
+"""Persistent OCR worker pool.
+
+OCR runs on a bounded set of long-lived worker threads so async handlers never
+block the event loop. When `tesserocr` is installed each worker keeps its own
+Tesseract API instance with the language model loaded once (no process fork,
+no per-call traineddata reload; recognition releases the GIL). Otherwise the
+pool falls back to pytesseract, which still runs off the event loop but spawns
+the tesseract binary per call: there is no warm model in that mode, and
+`mode()` / GET /health report it as 'fork-per-call'. tesserocr is not in
+requirements.txt because it builds against the system libtesseract.
+
+Env configuration:
+- OCR_WORKERS (default min(4, cpu_count))
+- OCR_LANG (default 'eng')
+"""
+import os
+import asyncio
+import threading
+from io import BytesIO
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional, Tuple
+
+try:
+    from PIL import Image
+    PIL_AVAILABLE = True
+except Exception:
+    PIL_AVAILABLE = False
+
+try:
+    from .image_handle import ImageHandle
+except Exception:
+    from image_handle import ImageHandle
+
+try:
+    from .backends import load as load_backend
+except Exception:
+    from backends import load as load_backend
+
+try:
+    from .metrics import stage as metric_stage
+    from .tracing import in_context
+except Exception:
+    from metrics import stage as metric_stage
+    from tracing import in_context
+
+
+def _to_pil(img):
+    if isinstance(img, ImageHandle):
+        return img.rgb()
+    if PIL_AVAILABLE and isinstance(img, Image.Image):
+        return img.convert('RGB') if img.mode not in ('RGB', 'L') else img
+    return Image.open(BytesIO(img)).convert('RGB')
+
+
+def _timed(fn, img):
+    # worker-side timing: excludes the wait for a free worker
+    with metric_stage('ocr'):
+        return fn(img)
+
+
+class OCRPool:
+    def __init__(self, workers: Optional[int] = None, lang: Optional[str] = None):
+        try:
+            default_workers = int(os.environ.get('OCR_WORKERS', 0)) or min(4, os.cpu_count() or 1)
+        except Exception:
+            default_workers = min(4, os.cpu_count() or 1)
+        self.workers = max(1, int(workers or default_workers))
+        self.lang = lang or os.environ.get('OCR_LANG') or 'eng'
+        self._executor = None
+        self._local = threading.local()
+        self._apis = []
+        self._lock = threading.Lock()
+
+    def backend(self) -> Optional[str]:
+        if not PIL_AVAILABLE:
+            return None
+        # Tesseract bindings are imported on first use, not at server import
+        if load_backend('tesserocr') is not None:
+            return 'tesserocr'
+        if load_backend('pytesseract') is not None:
+            return 'pytesseract'
+        return None
+
+    def mode(self) -> Optional[str]:
+        """'warm-pool' (tesserocr), 'fork-per-call' (pytesseract fallback) or None."""
+        backend = self.backend()
+        if backend is None:
+            return None
+        return 'warm-pool' if backend == 'tesserocr' else 'fork-per-call'
+
+    def info(self) -> dict:
+        return { 'backend': self.backend(), 'mode': self.mode(), 'workers': self.workers, 'lang': self.lang }
+
+    def _ensure_executor(self) -> ThreadPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='ocr')
+            return self._executor
+
+    def _api(self):
+        # one Tesseract instance per worker thread, created on first use and reused
+        api = getattr(self._local, 'api', None)
+        if api is None:
+            api = load_backend('tesserocr').PyTessBaseAPI(lang=self.lang)
+            self._local.api = api
+            with self._lock:
+                self._apis.append(api)
+        return api
+
+    def text_sync(self, img) -> str:
+        backend = self.backend()
+        if backend is None:
+            raise RuntimeError('OCR not available: install tesserocr or pytesseract (plus the Tesseract binary) and Pillow')
+        pil = _to_pil(img)
+        if backend == 'tesserocr':
+            api = self._api()
+            api.SetImage(pil)
+            return api.GetUTF8Text()
+        return load_backend('pytesseract').image_to_string(pil, lang=self.lang)
+
+    def words_sync(self, img) -> List[Tuple[int, int, int, int, str, float]]:
+        """Word boxes as (x, y, w, h, text, confidence)."""
+        backend = self.backend()
+        if backend is None:
+            raise RuntimeError('OCR not available: install tesserocr or pytesseract (plus the Tesseract binary) and Pillow')
+        pil = _to_pil(img)
+        words = []
+        if backend == 'tesserocr':
+            tesserocr = load_backend('tesserocr')
+            api = self._api()
+            api.SetImage(pil)
+            api.Recognize()
+            it = api.GetIterator()
+            if it is None:
+                return words
+            level = tesserocr.RIL.WORD
+            for r in tesserocr.iterate_level(it, level):
+                text = (r.GetUTF8Text(level) or '').strip()
+                box = r.BoundingBox(level)
+                if not text or not box:
+                    continue
+                x0, y0, x1, y1 = box
+                words.append((x0, y0, x1 - x0, y1 - y0, text, float(r.Confidence(level))))
+            return words
+        pytesseract = load_backend('pytesseract')
+        data = pytesseract.image_to_data(pil, lang=self.lang, output_type=pytesseract.Output.DICT)
+        for i in range(len(data.get('level', []))):
+            text = (data.get('text', [''])[i] or '').strip()
+            try:
+                conf = float(data.get('conf', [])[i])
+            except Exception:
+                conf = -1.0
+            if not text:
+                continue
+            words.append((int(data['left'][i]), int(data['top'][i]), int(data['width'][i]), int(data['height'][i]), text, conf))
+        return words
+
+    async def text(self, img) -> str:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._ensure_executor(), in_context(_timed), self.text_sync, img)
+
+    async def words(self, img) -> List[Tuple[int, int, int, int, str, float]]:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._ensure_executor(), in_context(_timed), self.words_sync, img)
+
+    async def text_batch(self, images: list) -> list:
+        """OCR many images concurrently (bounded by the worker count).
+        Returns one entry per input: the text, or the exception raised for it.
+        """
+        return await asyncio.gather(*[self.text(img) for img in images], return_exceptions=True)
+
+    def warm(self):
+        """Start every worker and load its Tesseract model ahead of traffic."""
+        if self.backend() != 'tesserocr':
+            return
+        executor = self._ensure_executor()
+        barrier = threading.Barrier(self.workers)
+
+        def _init():
+            self._api()
+            try:
+                # hold the thread until all workers exist so each one gets its own init
+                barrier.wait(timeout=30)
+            except threading.BrokenBarrierError:
+                pass
+
+        for f in [executor.submit(_init) for _ in range(self.workers)]:
+            f.result()
+
+    def shutdown(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+            apis, self._apis = self._apis, []
+        if executor is not None:
+            executor.shutdown(wait=True)
+        for api in apis:
+            try:
+                api.End()
+            except Exception:
+                pass
+
+
+OCR_POOL = OCRPool()
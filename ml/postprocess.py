@@ -0,0 +1,205 @@
+"""Tiled postprocess engine: upscale, unsharp mask and autocontrast.
+
+The output is produced in horizontal strips of `tile_rows` rows. Each strip is
+resampled straight from the source (LANCZOS, with a halo of extra rows so the
+blur sees real neighbours) and sharpened while it is hot, and its histogram is
+accumulated in the same step. The autocontrast lookup table is then applied in
+place, strip by strip, on one preallocated RGBA buffer that becomes the output
+image. Peak memory is the output plus a few strips, instead of several
+full-size intermediates.
+
+Results are pixel-identical to a whole-image LANCZOS resize, Pillow
+`UnsharpMask` and `ImageOps.autocontrast` on the colour channels. Without NumPy
+the engine falls back to those whole-image Pillow filters.
+
+Configuration is resolved from the environment once (`POSTPROCESS_CONFIG`);
+per-request values override it through `PostprocessConfig.merged`.
+
+Env configuration:
+- POSTPROCESS_ENABLED (default 1), POSTPROCESS_UPSCALE (default 1.5)
+- POSTPROCESS_UNSHARP_RADIUS / _PERCENT / _THRESHOLD (default 1.0 / 150 / 3)
+- POSTPROCESS_AUTOCONTRAST (default 1)
+- POSTPROCESS_TILE_ROWS strip height (default 512)
+- POSTPROCESS_WORKERS threads for postprocess_batch (default min(4, cpu_count))
+"""
+import os
+import math
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional
+
+try:
+    from PIL import Image, ImageFilter, ImageOps
+    PIL_AVAILABLE = True
+except Exception:
+    PIL_AVAILABLE = False
+
+try:
+    from .backends import load as load_backend
+except Exception:
+    from backends import load as load_backend
+
+
+def _env_flag(name: str, default: str = '1') -> bool:
+    return str(os.environ.get(name, default)).lower() not in ('0', 'false', 'no')
+
+
+def _env_num(name: str, default, cast=float):
+    try:
+        return cast(os.environ.get(name, default))
+    except Exception:
+        return default
+
+
+class PostprocessConfig:
+    __slots__ = ('enabled', 'upscale', 'unsharp_radius', 'unsharp_percent', 'unsharp_threshold', 'autocontrast', 'tile_rows')
+
+    def __init__(self, enabled=True, upscale=1.5, unsharp_radius=1.0, unsharp_percent=150,
+                 unsharp_threshold=3, autocontrast=True, tile_rows=512):
+        self.enabled = bool(enabled)
+        self.upscale = float(upscale or 1.0)
+        self.unsharp_radius = float(unsharp_radius)
+        self.unsharp_percent = int(unsharp_percent)
+        self.unsharp_threshold = int(unsharp_threshold)
+        self.autocontrast = bool(autocontrast)
+        self.tile_rows = max(16, int(tile_rows))
+
+    @classmethod
+    def from_env(cls) -> 'PostprocessConfig':
+        return cls(
+            enabled=_env_flag('POSTPROCESS_ENABLED'),
+            upscale=_env_num('POSTPROCESS_UPSCALE', 1.5),
+            unsharp_radius=_env_num('POSTPROCESS_UNSHARP_RADIUS', 1.0),
+            unsharp_percent=_env_num('POSTPROCESS_UNSHARP_PERCENT', 150.0),
+            unsharp_threshold=_env_num('POSTPROCESS_UNSHARP_THRESHOLD', 3, int),
+            autocontrast=_env_flag('POSTPROCESS_AUTOCONTRAST'),
+            tile_rows=_env_num('POSTPROCESS_TILE_ROWS', 512, int),
+        )
+
+    def merged(self, **overrides) -> 'PostprocessConfig':
+        """Copy with every non-None override applied."""
+        values = { k: getattr(self, k) for k in self.__slots__ }
+        values.update({ k: v for k, v in overrides.items() if v is not None })
+        return PostprocessConfig(**values)
+
+
+POSTPROCESS_CONFIG = PostprocessConfig.from_env()
+
+
+def _target_size(img, cfg: PostprocessConfig):
+    if cfg.upscale > 1.01:
+        return int(img.width * cfg.upscale), int(img.height * cfg.upscale)
+    return img.width, img.height
+
+
+def _autocontrast_lut(hist) -> list:
+    # same table as ImageOps.autocontrast(cutoff=0)
+    nz = [i for i in range(256) if hist[i]]
+    if not nz or nz[-1] <= nz[0]:
+        return list(range(256))
+    lo, hi = nz[0], nz[-1]
+    scale = 255.0 / (hi - lo)
+    offset = -lo * scale
+    return [min(255, max(0, int(ix * scale + offset))) for ix in range(256)]
+
+
+def _blur_halo(radius: float) -> int:
+    # Pillow's Gaussian blur is three extended box passes; this bounds their reach
+    return 3 * (int(math.ceil(radius * 2.0)) + 1) + 2
+
+
+def _round_up(value: int, step: int) -> int:
+    return -(-value // step) * step
+
+
+def _postprocess_tiled(img, cfg: PostprocessConfig, np):
+    src = img if img.mode in ('RGB', 'RGBA') else img.convert('RGBA')
+    if src.mode == 'RGBA' and src.getextrema()[3][0] == 255:
+        # opaque: work on the colour channels only and re-attach alpha at the end
+        src = src.convert('RGB')
+    width, height = _target_size(src, cfg)
+    halo = _blur_halo(cfg.unsharp_radius)
+    tile_rows = cfg.tile_rows
+    strip_resize = False
+    if (width, height) != src.size:
+        # Resampling a strip via `box` reproduces the full resize exactly only when
+        # strip edges fall on whole source rows, i.e. on multiples of `period`.
+        period = height // math.gcd(height, src.height)
+        if period <= 64:
+            strip_resize = True
+            tile_rows = _round_up(tile_rows, period)
+            halo = _round_up(halo, period)
+            sy = height / float(src.height)
+        else:
+            src = src.resize((width, height), resample=Image.LANCZOS)
+    channels = len(src.getbands())
+    # always RGBA so the final image wraps this buffer without another conversion
+    out = np.empty((height, width, 4), dtype=np.uint8)
+    if channels == 3:
+        out[..., 3] = 255
+    hist = np.zeros((3, 256), dtype=np.int64)
+    sharpen = ImageFilter.UnsharpMask(radius=cfg.unsharp_radius, percent=cfg.unsharp_percent, threshold=cfg.unsharp_threshold)
+
+    for y0 in range(0, height, tile_rows):
+        y1 = min(height, y0 + tile_rows)
+        e0, e1 = max(0, y0 - halo), min(height, y1 + halo)
+        if strip_resize:
+            strip = src.resize((width, e1 - e0), resample=Image.LANCZOS, box=(0, e0 / sy, src.width, e1 / sy))
+        else:
+            strip = src.crop((0, e0, width, e1))
+        # blur + sharpen in one native pass over the strip; the halo rows are dropped
+        sharp = strip.filter(sharpen).crop((0, y0 - e0, width, y1 - e0))
+        out[y0:y1, :, :channels] = np.asarray(sharp)
+        if cfg.autocontrast:
+            hist += np.asarray(sharp.histogram()[:768], dtype=np.int64).reshape(3, 256)
+
+    if cfg.autocontrast:
+        # colour channels only; alpha keeps its values
+        luts = [np.asarray(_autocontrast_lut(hist[c]), dtype=np.uint8) for c in range(3)]
+        if any(not np.array_equal(lut, np.arange(256)) for lut in luts):
+            for y0 in range(0, height, tile_rows):
+                block = out[y0:y0 + tile_rows]
+                for c, lut in enumerate(luts):
+                    block[..., c] = lut[block[..., c]]
+
+    return Image.fromarray(out, 'RGBA')
+
+
+def _postprocess_pil(img, cfg: PostprocessConfig):
+    out = img.convert('RGBA') if img.mode != 'RGBA' else img
+    if cfg.upscale > 1.01:
+        out = out.resize(_target_size(out, cfg), resample=Image.LANCZOS)
+    out = out.filter(ImageFilter.UnsharpMask(radius=cfg.unsharp_radius, percent=cfg.unsharp_percent, threshold=cfg.unsharp_threshold))
+    if cfg.autocontrast:
+        rgb = ImageOps.autocontrast(out.convert('RGB'))
+        out = Image.merge('RGBA', (*rgb.split(), out.getchannel('A')))
+    return out
+
+
+def postprocess_image(img, cfg: Optional[PostprocessConfig] = None):
+    """Postprocess one PIL image; returns an RGBA image (the input when disabled)."""
+    cfg = cfg or POSTPROCESS_CONFIG
+    if not cfg.enabled:
+        return img
+    if not PIL_AVAILABLE:
+        raise RuntimeError('Pillow required for postprocessing')
+    np = load_backend('numpy')
+    if np is None:
+        return _postprocess_pil(img, cfg)
+    return _postprocess_tiled(img, cfg, np)
+
+
+_EXECUTOR = None
+
+
+def postprocess_batch(images: list, cfg: Optional[PostprocessConfig] = None) -> List:
+    """Postprocess every candidate in one call with one resolved config.
+    Images run in parallel on a small thread pool (Pillow and NumPy release the GIL).
+    """
+    global _EXECUTOR
+    cfg = cfg or POSTPROCESS_CONFIG
+    if len(images) <= 1:
+        return [postprocess_image(img, cfg) for img in images]
+    if _EXECUTOR is None:
+        workers = _env_num('POSTPROCESS_WORKERS', 0, int) or min(4, os.cpu_count() or 1)
+        _EXECUTOR = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix='postprocess')
+    return list(_EXECUTOR.map(lambda img: postprocess_image(img, cfg), images))
@@ -0,0 +1,366 @@
+"""Adaptive provider routing with per-route circuit breakers.
+
+A route is one provider endpoint: `hf:<model>` for each Hugging Face model,
+`stability:v2beta` and `stability:v1` for the Stability APIs. HF calls for
+other tasks (text, img2img refine, SR, embeddings) name their own route, e.g.
+`hf-refine:<model>`, so they never skew or trip the generation route even
+when they share its model. `RouterTransport`
+sits under the shared provider clients (http_clients.py) and feeds every
+outbound call into `ROUTER`:
+
+- success: 2xx; neutral (not the provider's fault): 400, 413, 422; anything
+  else, timeouts and connection errors count as failures
+- a rolling success rate and the latency of successful calls are kept as EWMAs
+- neutral calls and calls cancelled by the caller (e.g. a hedge won) are no
+  verdict on either: they only free a half-open route's probe slot
+
+A route's circuit opens after ROUTER_FAILURE_THRESHOLD consecutive failures,
+or when its success EWMA drops below ROUTER_MIN_SUCCESS once it has seen
+ROUTER_MIN_CALLS calls. An open route is skipped for ROUTER_OPEN_SECONDS.
+After that it is half-open: a single request is let through as a probe. A
+successful probe closes the circuit. A failed probe reopens it for twice as
+long, up to ROUTER_MAX_OPEN_SECONDS.
+
+Callers ask `ROUTER.order(routes)` for the routes usable right now: probes
+come first, then healthy routes from fastest to slowest, and routes without
+any latency yet last (in the order given). The first given route is the
+preferred one: another route only ranks ahead of it when it is faster by
+ROUTER_SWITCH_MARGIN. A healthy route that has not been called for
+ROUTER_EXPLORE_SECONDS is put first once, so a route that lost the lead gets
+re-measured and can win it back; a latency estimate that old is replaced by
+the next sample instead of blended into it. Open routes are left out. An empty
+list means every candidate is open, so the caller should fail fast; see
+`CircuitOpen` and `ROUTER.retry_after()`.
+
+Env configuration:
+- ROUTER_ENABLED (default 1): 0 keeps recording but always returns the given order
+- ROUTER_FAILURE_THRESHOLD (default 5), ROUTER_MIN_SUCCESS (default 0.5), ROUTER_MIN_CALLS (default 10)
+- ROUTER_OPEN_SECONDS (default 30), ROUTER_MAX_OPEN_SECONDS (default 300)
+- ROUTER_PROBE_TIMEOUT (default 300): seconds after which an unanswered probe slot is handed out again
+- ROUTER_EWMA_ALPHA (default 0.2): weight of the newest call in both EWMAs
+- ROUTER_SWITCH_MARGIN (default 1.25): latency factor by which a route must beat the preferred one to lead
+- ROUTER_EXPLORE_SECONDS (default 60): idle time after which a healthy non-leading route is tried again (0 = never)
+"""
+import os
+import time
+import asyncio
+import threading
+from typing import Dict, List, Optional, Sequence
+
+try:
+    from .metrics import CIRCUIT_STATE, CIRCUIT_TRANSITIONS
+except Exception:
+    from metrics import CIRCUIT_STATE, CIRCUIT_TRANSITIONS
+
+CLOSED, HALF_OPEN, OPEN = 'closed', 'half_open', 'open'
+_STATE_VALUE = { CLOSED: 0, HALF_OPEN: 1, OPEN: 2 }
+
+NEUTRAL_STATUSES = frozenset((400, 413, 422))
+
+STABILITY_V2BETA = 'stability:v2beta'
+STABILITY_V1 = 'stability:v1'
+
+
+def hf_route(model: str) -> str:
+    return f'hf:{model}'
+
+
+def hf_task_route(task: str, model: str) -> str:
+    """Route for a non-generation HF call ('text', 'refine', 'sr', 'embed') on `model`."""
+    return f'hf-{task}:{model}'
+
+
+def route_for_path(path: str) -> Optional[str]:
+    """Route name for an outbound provider URL path (None when untracked)."""
+    # HF bases may carry a prefix (e.g. https://router.huggingface.co/hf-inference)
+    head, sep, model = path.rpartition('/models/')
+    if sep:
+        return hf_route(model.strip('/'))
+    if '/v2beta/' in path:
+        return STABILITY_V2BETA
+    if '/v1/generation/' in path:
+        return STABILITY_V1
+    return None
+
+
+def _env_num(name: str, default, cast=float):
+    try:
+        return cast(os.environ.get(name, default))
+    except Exception:
+        return default
+
+
+class CircuitOpen(Exception):
+    """Every candidate route is open; `retry_after` is seconds until one half-opens."""
+
+    def __init__(self, routes: Sequence[str], retry_after: float):
+        self.routes = list(routes)
+        self.retry_after = retry_after
+        super().__init__(f'circuit open for {", ".join(self.routes)}; retry in {retry_after:.0f}s')
+
+
+class RouterConfig:
+    __slots__ = ('enabled', 'failure_threshold', 'min_success', 'min_calls', 'open_seconds',
+                 'max_open_seconds', 'probe_timeout', 'alpha', 'switch_margin', 'explore_seconds')
+
+    def __init__(self, enabled=True, failure_threshold=5, min_success=0.5, min_calls=10, open_seconds=30.0,
+                 max_open_seconds=300.0, probe_timeout=300.0, alpha=0.2, switch_margin=1.25, explore_seconds=60.0):
+        self.enabled = bool(enabled)
+        self.failure_threshold = max(1, int(failure_threshold))
+        self.min_success = float(min_success)
+        self.min_calls = max(1, int(min_calls))
+        self.open_seconds = max(0.0, float(open_seconds))
+        self.max_open_seconds = max(self.open_seconds, float(max_open_seconds))
+        self.probe_timeout = max(1.0, float(probe_timeout))
+        self.alpha = min(1.0, max(0.01, float(alpha)))
+        self.switch_margin = max(1.0, float(switch_margin))
+        self.explore_seconds = max(0.0, float(explore_seconds))
+
+    @classmethod
+    def from_env(cls) -> 'RouterConfig':
+        return cls(
+            enabled=str(os.environ.get('ROUTER_ENABLED', '1')).lower() not in ('0', 'false', 'no'),
+            failure_threshold=_env_num('ROUTER_FAILURE_THRESHOLD', 5, int),
+            min_success=_env_num('ROUTER_MIN_SUCCESS', 0.5),
+            min_calls=_env_num('ROUTER_MIN_CALLS', 10, int),
+            open_seconds=_env_num('ROUTER_OPEN_SECONDS', 30.0),
+            max_open_seconds=_env_num('ROUTER_MAX_OPEN_SECONDS', 300.0),
+            probe_timeout=_env_num('ROUTER_PROBE_TIMEOUT', 300.0),
+            alpha=_env_num('ROUTER_EWMA_ALPHA', 0.2),
+            switch_margin=_env_num('ROUTER_SWITCH_MARGIN', 1.25),
+            explore_seconds=_env_num('ROUTER_EXPLORE_SECONDS', 60.0),
+        )
+
+    def merged(self, **overrides) -> 'RouterConfig':
+        """Copy with every non-None override applied."""
+        values = { k: getattr(self, k) for k in self.__slots__ }
+        values.update({ k: v for k, v in overrides.items() if v is not None })
+        return RouterConfig(**values)
+
+
+class _Route:
+    __slots__ = ('name', 'state', 'latency', 'success', 'calls', 'successes', 'failures', 'consecutive_failures',
+                 'open_until', 'open_for', 'probe_started', 'explore_started', 'last_call', 'last_status',
+                 'last_failure', 'changed_at')
+
+    def __init__(self, name: str):
+        self.name = name
+        self.state = CLOSED
+        self.latency = None  # EWMA seconds of successful calls
+        self.success = 1.0  # EWMA of call outcomes (1 ok, 0 failed)
+        self.calls = 0
+        self.successes = 0
+        self.failures = 0
+        self.consecutive_failures = 0
+        self.open_until = 0.0
+        self.open_for = 0.0
+        self.probe_started = None
+        self.explore_started = None
+        self.last_call = None  # monotonic time of the last recorded outcome
+        self.last_status = None
+        self.last_failure = None
+        self.changed_at = time.time()
+
+
+class ProviderRouter:
+    def __init__(self, config: Optional[RouterConfig] = None):
+        self.config = config or RouterConfig.from_env()
+        self._routes = {}
+        self._lock = threading.Lock()
+
+    def _route(self, name: str) -> _Route:
+        # callers hold self._lock
+        route = self._routes.get(name)
+        if route is None:
+            route = self._routes[name] = _Route(name)
+        return route
+
+    def _set_state(self, route: _Route, state: str):
+        if route.state != state:
+            CIRCUIT_TRANSITIONS.inc(route.name, state)
+            print(f'Provider route {route.name}: {route.state} -> {state}')
+            route.state = state
+            route.changed_at = time.time()
+        CIRCUIT_STATE.set(_STATE_VALUE[state], route.name)
+
+    def _open(self, route: _Route, now: float):
+        cfg = self.config
+        # a failed probe doubles the wait; a fresh trip starts from the base
+        route.open_for = min(cfg.max_open_seconds, route.open_for * 2) if route.state == HALF_OPEN and route.open_for else cfg.open_seconds
+        route.open_until = now + route.open_for
+        route.probe_started = None
+        self._set_state(route, OPEN)
+
+    def _refresh(self, route: _Route, now: float):
+        if route.state == OPEN and now >= route.open_until:
+            self._set_state(route, HALF_OPEN)
+
+    def record(self, name: str, status, seconds: float):
+        """Feed one call outcome: an HTTP status, 'timeout' / 'error', or 'cancelled'."""
+        cfg = self.config
+        now = time.monotonic()
+        with self._lock:
+            route = self._route(name)
+            route.last_status = str(status)
+            stale = route.last_call is not None and cfg.explore_seconds and now - route.last_call >= cfg.explore_seconds
+            route.last_call = now
+            route.explore_started = None
+            if status == 'cancelled':
+                # no verdict: the caller stopped waiting, which says nothing about the provider
+                if route.state == HALF_OPEN:
+                    route.probe_started = None
+                return
+            if isinstance(status, int) and status in NEUTRAL_STATUSES:
+                # a malformed request says nothing about the provider: let the next one probe
+                if route.state == HALF_OPEN:
+                    route.probe_started = None
+                return
+            ok = isinstance(status, int) and 200 <= status < 400
+            route.calls += 1
+            route.success += cfg.alpha * ((1.0 if ok else 0.0) - route.success)
+            if ok:
+                route.successes += 1
+                route.consecutive_failures = 0
+                route.latency = seconds if route.latency is None or stale else route.latency + cfg.alpha * (seconds - route.latency)
+                if route.state != CLOSED:
+                    route.success = 1.0
+                    route.open_for = 0.0
+                    route.probe_started = None
+                    self._set_state(route, CLOSED)
+                return
+            route.failures += 1
+            route.consecutive_failures += 1
+            route.last_failure = { 'status': str(status), 'at': time.time() }
+            if route.state == HALF_OPEN:
+                self._open(route, now)
+            elif route.state == CLOSED and (route.consecutive_failures >= cfg.failure_threshold
+                                             or (route.calls >= cfg.min_calls and route.success < cfg.min_success)):
+                self._open(route, now)
+
+    def allows(self, name: str) -> bool:
+        """True unless the route's circuit is open (a half-open route allows its probe)."""
+        if not self.config.enabled:
+            return True
+        with self._lock:
+            route = self._route(name)
+            self._refresh(route, time.monotonic())
+            return route.state != OPEN
+
+    def order(self, names: Sequence[str]) -> List[str]:
+        """Routes usable now: half-open probes first, then fastest healthy, then unmeasured.
+        Handing out a half-open route claims its probe slot; an idle healthy route
+        moved to the front claims an exploration slot the same way.
+        """
+        cfg = self.config
+        if not cfg.enabled:
+            return list(names)
+        now = time.monotonic()
+        ranked = []
+        with self._lock:
+            for i, name in enumerate(names):
+                route = self._route(name)
+                self._refresh(route, now)
+                if route.state == OPEN:
+                    continue
+                if route.state == HALF_OPEN:
+                    if route.probe_started is not None and now - route.probe_started < cfg.probe_timeout:
+                        continue
+                    route.probe_started = now
+                    ranked.append(((0, 0.0, i), name))
+                elif route.latency is None:
+                    ranked.append(((2, 0.0, i), name))
+                else:
+                    # routes after the first given one must win by the switch margin
+                    ranked.append(((1, route.latency * (cfg.switch_margin if i else 1.0), i), name))
+            ranked.sort(key=lambda item: item[0])
+            if cfg.explore_seconds and ranked and ranked[0][0][0] == 1:
+                for pos, (_, name) in enumerate(ranked[1:], 1):
+                    route = self._routes[name]
+                    if route.last_call is None or now - route.last_call < cfg.explore_seconds:
+                        continue
+                    if route.explore_started is not None and now - route.explore_started < cfg.probe_timeout:
+                        continue
+                    route.explore_started = now
+                    ranked.insert(0, ranked.pop(pos))
+                    break
+        return [name for _, name in ranked]
+
+    def retry_after(self, names: Sequence[str]) -> float:
+        """Seconds until the first of `names` half-opens (0 when one is usable)."""
+        now = time.monotonic()
+        with self._lock:
+            waits = [max(0.0, r.open_until - now) if r.state == OPEN else 0.0 for r in (self._route(n) for n in names)]
+        return min(waits) if waits else 0.0
+
+    def reset(self, name: Optional[str] = None):
+        with self._lock:
+            names = [name] if name else list(self._routes)
+            for n in names:
+                if n in self._routes:
+                    CIRCUIT_STATE.set(0, n)
+                    self._routes[n] = _Route(n)
+
+    def snapshot(self) -> Dict:
+        now = time.monotonic()
+        routes = {}
+        with self._lock:
+            for name, r in sorted(self._routes.items()):
+                self._refresh(r, now)
+                routes[name] = {
+                    'state': r.state,
+                    'latency_ewma_ms': round(r.latency * 1000.0, 1) if r.latency is not None else None,
+                    'success_ewma': round(r.success, 3),
+                    'calls': r.calls,
+                    'successes': r.successes,
+                    'failures': r.failures,
+                    'consecutive_failures': r.consecutive_failures,
+                    'open_remaining_s': round(max(0.0, r.open_until - now), 1) if r.state == OPEN else None,
+                    'probe_in_flight': r.probe_started is not None,
+                    'explore_in_flight': r.explore_started is not None,
+                    'idle_s': round(now - r.last_call, 1) if r.last_call is not None else None,
+                    'last_status': r.last_status,
+                    'last_failure': r.last_failure,
+                    'state_since': r.changed_at,
+                }
+        cfg = { k: getattr(self.config, k) for k in RouterConfig.__slots__ }
+        return { 'config': cfg, 'routes': routes }
+
+
+ROUTER = ProviderRouter()
+
+
+try:
+    import httpx
+
+    class RouterTransport(httpx.AsyncBaseTransport):
+        """httpx transport wrapper reporting every provider call to `ROUTER`.
+        A request may name its route explicitly with `extensions={'route': ...}`.
+        """
+
+        def __init__(self, transport: httpx.AsyncBaseTransport, router: ProviderRouter = ROUTER):
+            self._transport = transport
+            self._router = router
+
+        async def handle_async_request(self, request):
+            name = request.extensions.get('route') or route_for_path(request.url.path)
+            if name is None:
+                return await self._transport.handle_async_request(request)
+            t0 = time.monotonic()
+            status = 'error'
+            try:
+                response = await self._transport.handle_async_request(request)
+                status = response.status_code
+                return response
+            except httpx.TimeoutException:
+                status = 'timeout'
+                raise
+            except asyncio.CancelledError:
+                status = 'cancelled'
+                raise
+            finally:
+                self._router.record(name, status, time.monotonic() - t0)
+
+        async def aclose(self):
+            await self._transport.aclose()
+except Exception:
+    RouterTransport = None
@@ -0,0 +1,393 @@
+"""Raster-to-vector engine for logo marks.
+
+An image is reduced to a small palette (fast octree), cleaned with a majority
+filter so anti-aliased edges do not turn into slivers, and each palette colour
+is traced as one layer. Layer outlines are split at corners, smoothed, and
+fitted with cubic Bezier curves within `curve_tolerance` pixels (straight runs
+become single line segments); with curves disabled, outlines are simplified
+with Douglas-Peucker instead. Each layer is written as one `evenodd` path, so
+holes need no extra elements.
+
+Tracing is CPU-bound, so the async entry points run it in a process pool;
+`vectorize_batch` traces several images concurrently.
+
+Env configuration (per-request values override these):
+- VECTORIZE_COLORS palette size, 1 = monochrome threshold (default 4)
+- VECTORIZE_THRESHOLD monochrome luminance threshold (default 250)
+- VECTORIZE_CURVE_TOLERANCE Bezier fit error in px, 0 = polygons (default 1.0)
+- VECTORIZE_SIMPLIFY Douglas-Peucker epsilon for polygons in px (default 1.0)
+- VECTORIZE_CORNER_ANGLE turning angle in degrees treated as a corner (default 60)
+- VECTORIZE_MIN_AREA speckle filter in px^2 (default 16)
+- VECTORIZE_MAX_SIDE trace resolution cap (default 1024)
+- VECTORIZE_PRECISION decimals in path data (default 1)
+- VECTORIZE_WORKERS trace processes (default min(4, cpu_count); 0 = threads)
+"""
+import os
+import asyncio
+import threading
+import multiprocessing
+from io import BytesIO
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import List, Optional
+
+try:
+    from PIL import Image
+    PIL_AVAILABLE = True
+except Exception:
+    PIL_AVAILABLE = False
+
+try:
+    from .backends import require as require_backend
+except Exception:
+    from backends import require as require_backend
+
+try:
+    from .metrics import stage as metric_stage
+except Exception:
+    from metrics import stage as metric_stage
+
+
+def _env_num(name: str, default, cast=float):
+    try:
+        return cast(os.environ.get(name, default))
+    except Exception:
+        return default
+
+
+class VectorizeOptions:
+    __slots__ = ('colors', 'threshold', 'curve_tolerance', 'simplify', 'corner_angle', 'min_area',
+                 'max_side', 'precision', 'keep_background')
+
+    def __init__(self, colors=4, threshold=250, curve_tolerance=1.0, simplify=1.0, corner_angle=60.0,
+                 min_area=16.0, max_side=1024, precision=1, keep_background=False):
+        self.colors = max(1, min(16, int(colors)))
+        self.threshold = max(0, min(255, int(threshold)))
+        self.curve_tolerance = max(0.0, float(curve_tolerance))
+        self.simplify = max(0.0, float(simplify))
+        self.corner_angle = max(1.0, min(179.0, float(corner_angle)))
+        self.min_area = max(0.0, float(min_area))
+        self.max_side = max(16, int(max_side))
+        self.precision = max(0, min(4, int(precision)))
+        self.keep_background = bool(keep_background)
+
+    @classmethod
+    def from_env(cls) -> 'VectorizeOptions':
+        return cls(
+            colors=_env_num('VECTORIZE_COLORS', 4, int),
+            threshold=_env_num('VECTORIZE_THRESHOLD', 250, int),
+            curve_tolerance=_env_num('VECTORIZE_CURVE_TOLERANCE', 1.0),
+            simplify=_env_num('VECTORIZE_SIMPLIFY', 1.0),
+            corner_angle=_env_num('VECTORIZE_CORNER_ANGLE', 60.0),
+            min_area=_env_num('VECTORIZE_MIN_AREA', 16.0),
+            max_side=_env_num('VECTORIZE_MAX_SIDE', 1024, int),
+            precision=_env_num('VECTORIZE_PRECISION', 1, int),
+        )
+
+    def merged(self, **overrides) -> 'VectorizeOptions':
+        """Copy with every non-None override applied."""
+        values = { k: getattr(self, k) for k in self.__slots__ }
+        values.update({ k: v for k, v in overrides.items() if v is not None })
+        return VectorizeOptions(**values)
+
+
+VECTORIZE_OPTIONS = VectorizeOptions.from_env()
+
+
+# --- quantization -----------------------------------------------------------
+
+def _load_rgb(data: bytes, max_side: int):
+    img = Image.open(BytesIO(data))
+    img.load()
+    if img.mode in ('RGBA', 'LA', 'P'):
+        # transparent areas become white background
+        rgba = img.convert('RGBA')
+        bg = Image.new('RGBA', rgba.size, (255, 255, 255, 255))
+        img = Image.alpha_composite(bg, rgba)
+    img = img.convert('RGB')
+    full_size = img.size
+    if max(img.size) > max_side:
+        scale = max_side / float(max(img.size))
+        img = img.resize((max(1, round(img.width * scale)), max(1, round(img.height * scale))), resample=Image.LANCZOS)
+    return img, full_size
+
+
+def _majority_filter(labels, count: int, np, cv2):
+    # 3x3 mode filter: removes one-pixel slivers left by anti-aliased edges
+    best = np.full(labels.shape, -1, dtype=np.int16)
+    out = labels.copy()
+    for k in range(count):
+        votes = cv2.boxFilter((labels == k).astype(np.uint8), -1, (3, 3), normalize=False)
+        win = votes > best
+        out[win] = k
+        best = np.where(win, votes, best)
+    return out
+
+
+def _layers(img, opts: VectorizeOptions, np, cv2):
+    """[(hex colour, mask)] largest first, plus the background colour."""
+    if opts.colors == 1:
+        gray = np.asarray(img.convert('L'))
+        return [('#000000', (gray <= opts.threshold).astype(np.uint8))], '#ffffff'
+    pal_img = img.quantize(colors=opts.colors, method=getattr(Image, 'Quantize', Image).FASTOCTREE)
+    palette = pal_img.getpalette()[:3 * opts.colors]
+    labels = np.asarray(pal_img, dtype=np.uint8)
+    used = int(labels.max()) + 1
+    labels = _majority_filter(labels, used, np, cv2)
+    counts = np.bincount(labels.ravel(), minlength=used)
+    border = np.concatenate([labels[0], labels[-1], labels[:, 0], labels[:, -1]])
+    bg = int(np.bincount(border, minlength=used).argmax())
+    out = []
+    for k in np.argsort(-counts):
+        if counts[k] == 0 or k == bg:
+            continue
+        r, g, b = palette[3 * k:3 * k + 3]
+        out.append((f'#{r:02x}{g:02x}{b:02x}', (labels == k).astype(np.uint8)))
+    r, g, b = palette[3 * bg:3 * bg + 3]
+    return out, f'#{r:02x}{g:02x}{b:02x}'
+
+
+# --- curve fitting (Schneider, "An Algorithm for Automatically Fitting Digitized Curves") ---
+
+def _unit(v, np):
+    n = np.hypot(v[0], v[1])
+    return v / n if n > 1e-9 else v
+
+
+def _bezier(ctrl, u, np):
+    mt = 1.0 - u
+    return (np.outer(mt ** 3, ctrl[0]) + np.outer(3 * mt * mt * u, ctrl[1])
+            + np.outer(3 * mt * u * u, ctrl[2]) + np.outer(u ** 3, ctrl[3]))
+
+
+def _chord_params(pts, np):
+    d = np.concatenate([[0.0], np.cumsum(np.hypot(*np.diff(pts, axis=0).T))])
+    return d / d[-1] if d[-1] > 0 else np.linspace(0.0, 1.0, len(pts))
+
+
+def _generate(pts, u, t1, t2, np):
+    p0, p3 = pts[0], pts[-1]
+    mt = 1.0 - u
+    b0, b1, b2, b3 = mt ** 3, 3 * mt * mt * u, 3 * mt * u * u, u ** 3
+    a1 = np.outer(b1, t1)
+    a2 = np.outer(b2, t2)
+    c00, c01, c11 = (a1 * a1).sum(), (a1 * a2).sum(), (a2 * a2).sum()
+    rest = pts - np.outer(b0 + b1, p0) - np.outer(b2 + b3, p3)
+    x0, x1 = (a1 * rest).sum(), (a2 * rest).sum()
+    det = c00 * c11 - c01 * c01
+    seg = np.hypot(*(p3 - p0))
+    al = ar = 0.0
+    if abs(det) > 1e-12:
+        al, ar = (x0 * c11 - x1 * c01) / det, (c00 * x1 - c01 * x0) / det
+    if al < 1e-6 * seg or ar < 1e-6 * seg:
+        al = ar = seg / 3.0
+    return np.array([p0, p0 + t1 * al, p3 + t2 * ar, p3])
+
+
+def _reparameterize(ctrl, pts, u, np):
+    q = _bezier(ctrl, u, np) - pts
+    d1 = 3 * np.diff(ctrl, axis=0)
+    d2 = 2 * np.diff(d1, axis=0)
+    mt = 1.0 - u
+    q1 = np.outer(mt * mt, d1[0]) + np.outer(2 * mt * u, d1[1]) + np.outer(u * u, d1[2])
+    q2 = np.outer(mt, d2[0]) + np.outer(u, d2[1])
+    num = (q * q1).sum(axis=1)
+    den = (q1 * q1).sum(axis=1) + (q * q2).sum(axis=1)
+    step = np.divide(num, den, out=np.zeros_like(num), where=np.abs(den) > 1e-12)
+    return np.clip(u - step, 0.0, 1.0)
+
+
+def _fit_cubic(pts, t1, t2, tol: float, out: list, np, depth: int = 0):
+    if len(pts) < 3:
+        seg = np.hypot(*(pts[-1] - pts[0])) / 3.0
+        out.append(('C', np.array([pts[0] + t1 * seg, pts[-1] + t2 * seg, pts[-1]])))
+        return
+    u = _chord_params(pts, np)
+    ctrl = _generate(pts, u, t1, t2, np)
+    err = np.hypot(*(_bezier(ctrl, u, np) - pts).T)
+    if err.max() > tol and err.max() < 4 * tol:
+        for _ in range(4):
+            u = _reparameterize(ctrl, pts, u, np)
+            ctrl = _generate(pts, u, t1, t2, np)
+            err = np.hypot(*(_bezier(ctrl, u, np) - pts).T)
+            if err.max() <= tol:
+                break
+    if err.max() <= tol or depth >= 12 or len(pts) < 4:
+        out.append(('C', ctrl[1:]))
+        return
+    split = int(np.clip(err.argmax(), 1, len(pts) - 2))
+    center = _unit(pts[split - 1] - pts[split + 1], np)
+    _fit_cubic(pts[:split + 1], t1, center, tol, out, np, depth + 1)
+    _fit_cubic(pts[split:], -center, t2, tol, out, np, depth + 1)
+
+
+def _is_straight(pts, tol: float, np) -> bool:
+    chord = pts[-1] - pts[0]
+    length = np.hypot(*chord)
+    if length < 1e-9:
+        return False
+    rel = pts - pts[0]
+    dist = np.abs(rel[:, 0] * chord[1] - rel[:, 1] * chord[0]) / length
+    return float(dist.max()) <= tol
+
+
+def _corners(pts, max_angle: float, np):
+    """Indices where the outline turns by more than `max_angle` degrees."""
+    n = len(pts)
+    k = 3 if n >= 12 else 1
+    a = pts - np.roll(pts, k, axis=0)
+    b = np.roll(pts, -k, axis=0) - pts
+    cos = (a * b).sum(axis=1) / np.maximum(np.hypot(*a.T) * np.hypot(*b.T), 1e-9)
+    turn = np.degrees(np.arccos(np.clip(cos, -1.0, 1.0)))
+    # non-maximum suppression over the same window
+    local = turn.copy()
+    for s in range(1, k + 1):
+        local = np.maximum(local, np.maximum(np.roll(turn, s), np.roll(turn, -s)))
+    idx = np.nonzero((turn > max_angle) & (turn >= local))[0]
+    # plateaus keep their first index only
+    return [int(i) for j, i in enumerate(idx) if j == 0 or i - idx[j - 1] > k]
+
+
+def _fit_outline(pts, opts: VectorizeOptions, np) -> list:
+    """Closed outline -> ('L', [pt]) / ('C', [c1, c2, pt]) segments starting at pts[0]."""
+    corners = _corners(pts, opts.corner_angle, np)
+    smooth = pts.copy()
+    for _ in range(2):
+        smooth = (np.roll(smooth, 1, axis=0) + 2 * smooth + np.roll(smooth, -1, axis=0)) / 4.0
+        smooth[corners] = pts[corners]
+    breaks = corners or [0]
+    if breaks[0] != 0:
+        smooth = np.roll(smooth, -breaks[0], axis=0)
+        breaks = [b - breaks[0] for b in breaks]
+    n = len(smooth)
+    closed = np.vstack([smooth, smooth[:1]])
+    out = [('M', smooth[:1])]
+    for i, start in enumerate(breaks):
+        end = breaks[i + 1] if i + 1 < len(breaks) else n
+        seg = closed[start:end + 1]
+        if len(seg) < 2:
+            continue
+        if _is_straight(seg, opts.curve_tolerance, np):
+            out.append(('L', seg[-1:]))
+            continue
+        if corners:
+            t1 = _unit(seg[min(3, len(seg) - 1)] - seg[0], np)
+            t2 = _unit(seg[max(-4, -len(seg))] - seg[-1], np)
+        else:
+            # smooth closed loop: one shared tangent at the join
+            t1 = _unit(smooth[1] - smooth[-1], np)
+            t2 = -t1
+        _fit_cubic(seg, t1, t2, opts.curve_tolerance, out, np)
+    return out
+
+
+def _fmt(v: float, precision: int) -> str:
+    s = f'{v:.{precision}f}'
+    if '.' in s:
+        s = s.rstrip('0').rstrip('.')
+    return '0' if s in ('-0', '') else s
+
+
+def _path_data(segments: list, precision: int) -> str:
+    parts = []
+    for cmd, pts in segments:
+        parts.append(cmd + ' '.join(f'{_fmt(x, precision)} {_fmt(y, precision)}' for x, y in pts))
+    return ''.join(parts) + 'Z'
+
+
+def _trace_layer(mask, opts: VectorizeOptions, np, cv2):
+    mode = cv2.CHAIN_APPROX_NONE if opts.curve_tolerance > 0 else cv2.CHAIN_APPROX_SIMPLE
+    contours, _ = cv2.findContours(mask, cv2.RETR_CCOMP, mode)
+    paths = []
+    for cnt in contours:
+        if abs(cv2.contourArea(cnt)) < opts.min_area or len(cnt) < 3:
+            continue
+        if opts.curve_tolerance > 0:
+            pts = cnt.reshape(-1, 2).astype(np.float64) + 0.5
+            paths.append(_path_data(_fit_outline(pts, opts, np), opts.precision))
+        else:
+            poly = cv2.approxPolyDP(cnt, opts.simplify, True).reshape(-1, 2).astype(np.float64) + 0.5
+            if len(poly) >= 3:
+                paths.append(_path_data([('M', poly[:1]), ('L', poly[1:])], opts.precision))
+    return paths
+
+
+def trace_bytes(data: bytes, opts: Optional[VectorizeOptions] = None) -> dict:
+    """Trace an encoded image into SVG. Runs in the calling process."""
+    opts = opts or VECTORIZE_OPTIONS
+    if not PIL_AVAILABLE:
+        raise RuntimeError('Pillow required for vectorization')
+    np = require_backend('numpy')
+    cv2 = require_backend('cv2')
+    img, (full_w, full_h) = _load_rgb(data, opts.max_side)
+    w, h = img.size
+    layers, bg = _layers(img, opts, np, cv2)
+    kernel = np.ones((3, 3), np.uint8)
+    body = []
+    if opts.keep_background:
+        body.append(f'<rect width="{w}" height="{h}" fill="{bg}"/>')
+    stats = []
+    for i, (color, mask) in enumerate(layers):
+        if i > 0:
+            # later layers overlap the earlier ones by a pixel so no seams show between colours
+            mask = cv2.dilate(mask, kernel)
+        paths = _trace_layer(mask, opts, np, cv2)
+        if not paths:
+            continue
+        body.append(f'<path fill="{color}" fill-rule="evenodd" d="{"".join(paths)}"/>')
+        stats.append({ 'color': color, 'contours': len(paths) })
+    svg = (
+        f'<svg xmlns="http://www.w3.org/2000/svg" width="{full_w}" height="{full_h}" viewBox="0 0 {w} {h}">'
+        + ''.join(body) + '</svg>'
+    )
+    return { 'svg': svg, 'width': full_w, 'height': full_h, 'layers': stats, 'background': bg, 'bytes': len(svg) }
+
+
+# --- process pool -------------------------------------------------------------
+
+_POOL = None
+_POOL_LOCK = threading.Lock()
+
+
+def _pool():
+    global _POOL
+    with _POOL_LOCK:
+        if _POOL is None:
+            workers = _env_num('VECTORIZE_WORKERS', min(4, os.cpu_count() or 1), int)
+            if workers <= 0:
+                return None
+            # spawn: forking a process that already runs event-loop and pool threads is unsafe
+            _POOL = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'))
+        return _POOL
+
+
+async def vectorize(data: bytes, opts: Optional[VectorizeOptions] = None) -> dict:
+    """Trace one image off the event loop (process pool, or a thread when VECTORIZE_WORKERS=0)."""
+    global _POOL
+    opts = opts or VECTORIZE_OPTIONS
+    pool = _pool()
+    try:
+        with metric_stage('vectorize'):
+            if pool is None:
+                return await asyncio.to_thread(trace_bytes, data, opts)
+            return await asyncio.get_running_loop().run_in_executor(pool, trace_bytes, data, opts)
+    except BrokenProcessPool:
+        # a crashed worker poisons the pool; start a fresh one for the next call
+        with _POOL_LOCK:
+            if _POOL is pool:
+                _POOL = None
+        raise RuntimeError('vectorize worker crashed')
+
+
+async def vectorize_batch(images: List[bytes], opts: Optional[VectorizeOptions] = None) -> List[dict]:
+    """Trace several images concurrently; a failed image yields {'error': ...} in its slot."""
+    results = await asyncio.gather(*(vectorize(data, opts) for data in images), return_exceptions=True)
+    return [{ 'error': str(r) } if isinstance(r, Exception) else r for r in results]
+
+
+def shutdown():
+    global _POOL
+    with _POOL_LOCK:
+        pool, _POOL = _POOL, None
+    if pool is not None:
+        pool.shutdown(wait=False, cancel_futures=True)
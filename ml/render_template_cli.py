@@ -1,25 +1,23 @@
 #!/usr/bin/env python3
+"""Thin client for the ML service's template renderer (POST /templates/render).
+
+Reads a JSON payload on stdin ({template_name, fields} or {template_name,
+field_sets}) and prints {images: [data URLs], template} on stdout. Templates,
+fonts and layout stay loaded in the service; this script only does one HTTP
+round trip. The service URL comes from TEMPLATE_RENDER_URL, PY_IMAGE_SERVICE_URL
+or ML_BASE_URL (default http://127.0.0.1:8000).
+"""
+import os
 import sys
 import json
-from pathlib import Path
-from io import BytesIO
-import base64
-try:
-    from local_templates import render_template, list_templates
-except Exception:
-    # try relative import when executed from repo root
-    from ml.local_templates import render_template, list_templates
+import urllib.error
+import urllib.request
+
+
+def service_url() -> str:
+    base = os.environ.get('TEMPLATE_RENDER_URL') or os.environ.get('PY_IMAGE_SERVICE_URL') or os.environ.get('ML_BASE_URL') or 'http://127.0.0.1:8000'
+    return base.rstrip('/') + '/templates/render'
 
-def calc_font_size(img_bytes):
-    # simple heuristic: scale font by image width
-    try:
-        from PIL import Image
-        img = Image.open(BytesIO(img_bytes))
-        w, h = img.size
-        # base size relative to width
-        return max(16, int(w / 30))
-    except Exception:
-        return 24
 
 def main():
     # read JSON payload from stdin
@@ -28,37 +26,34 @@ def main():
     except Exception:
         payload = {}
 
-    template_name = payload.get('template_name') or payload.get('name')
-    fields = payload.get('fields') or payload.get('fields', {}) or payload
-
-    if not template_name:
-        # try pick first template
-        templates = list_templates()
-        if not templates:
-            print(json.dumps({'error':'no templates available'}))
-            sys.exit(1)
-        template_name = templates[0]
-
-    # load template bytes to compute font size
+    body = {
+        'template_name': payload.get('template_name') or payload.get('name'),
+        'text_color': payload.get('text_color'),
+    }
+    if payload.get('field_sets') is not None:
+        body['field_sets'] = payload['field_sets']
+    else:
+        # legacy payloads may put the fields at the top level
+        skip = ('template_name', 'text_color') if payload.get('template_name') else ('template_name', 'text_color', 'name')
+        body['fields'] = payload.get('fields') or { k: v for k, v in payload.items() if k not in skip }
+
+    req = urllib.request.Request(service_url(), data=json.dumps(body).encode('utf-8'),
+                                 headers={ 'Content-Type': 'application/json', 'Accept': 'application/json' })
     try:
-        from ml.local_templates import load_template_bytes
-        img_bytes = load_template_bytes(template_name)
-    except Exception:
+        with urllib.request.urlopen(req, timeout=float(os.environ.get('TEMPLATE_RENDER_TIMEOUT', 60))) as resp:
+            out = json.load(resp)
+    except urllib.error.HTTPError as e:
         try:
-            img_bytes = None
+            detail = json.load(e).get('detail')
         except Exception:
-            img_bytes = None
-
-    font_size = calc_font_size(img_bytes) if img_bytes else 24
-
-    try:
-        out = render_template(template_name, fields, font_size=font_size)
-        b64 = base64.b64encode(out).decode('ascii')
-        data_url = f'data:image/png;base64,{b64}'
-        print(json.dumps({'images':[data_url], 'template': template_name}))
+            detail = None
+        print(json.dumps({'error': detail or f'HTTP {e.code}'}))
+        sys.exit(1 if e.code == 404 else 2)
     except Exception as e:
         print(json.dumps({'error': str(e)}))
         sys.exit(2)
+    print(json.dumps({'images': out.get('images') or [], 'template': out.get('template')}))
+
 
 if __name__ == '__main__':
     main()
@@ -0,0 +1,197 @@
+"""Content-addressed cache for generation results.
+
+Entries are keyed on a sha256 of the canonical JSON of the request parameters
+that affect the output (prompt, dimensions, steps, guidance, postprocess
+flags, model). A size-bounded in-memory LRU sits in front of an on-disk store
+of one JSON file per key; the disk store evicts least-recently-used files when
+it exceeds its byte budget, and both tiers honour a TTL.
+
+Env configuration:
+- RESULT_CACHE_ENABLED (1/0, default 1)
+- RESULT_CACHE_MAX_ITEMS in-memory entries (default 128)
+- RESULT_CACHE_DIR (default ml/.cache/results)
+- RESULT_CACHE_MAX_BYTES disk budget (default 512 MiB)
+- RESULT_CACHE_TTL seconds (default 86400; <= 0 disables expiry)
+"""
+import os
+import json
+import time
+import asyncio
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Optional
+
+
+def make_key(namespace: str, params: dict) -> str:
+    canonical = json.dumps(params, sort_keys=True, separators=(',', ':'), default=str)
+    return hashlib.sha256(f'{namespace}:{canonical}'.encode('utf-8')).hexdigest()
+
+
+def _copy_result(value: dict) -> dict:
+    # callers annotate results with setdefault(); never hand out the cached dict
+    return { k: (list(v) if isinstance(v, list) else v) for k, v in value.items() }
+
+
+class ResultCache:
+    def __init__(self, max_items: int = 128, disk_dir: Optional[str] = None,
+                 max_bytes: int = 512 * 1024 * 1024, ttl: float = 86400.0):
+        self.max_items = max(0, int(max_items))
+        self.disk_dir = disk_dir
+        self.max_bytes = int(max_bytes)
+        self.ttl = float(ttl)
+        self.stats = { 'hits': 0, 'misses': 0, 'memory_hits': 0, 'disk_hits': 0, 'evictions': 0 }
+        self._mem = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _expired(self, created: float) -> bool:
+        return self.ttl > 0 and (time.time() - created) > self.ttl
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.disk_dir, key + '.json')
+
+    def _mem_get(self, key: str) -> Optional[dict]:
+        with self._lock:
+            entry = self._mem.get(key)
+            if entry is None:
+                return None
+            created, value = entry
+            if self._expired(created):
+                del self._mem[key]
+                return None
+            self._mem.move_to_end(key)
+            return value
+
+    def _mem_put(self, key: str, value: dict, created: float):
+        if self.max_items <= 0:
+            return
+        with self._lock:
+            self._mem[key] = (created, value)
+            self._mem.move_to_end(key)
+            while len(self._mem) > self.max_items:
+                self._mem.popitem(last=False)
+
+    def _disk_get(self, key: str):
+        if not self.disk_dir:
+            return None
+        path = self._path(key)
+        try:
+            with open(path, 'r', encoding='utf-8') as fh:
+                entry = json.load(fh)
+        except Exception:
+            return None
+        created = float(entry.get('created', 0))
+        if self._expired(created):
+            self._disk_remove(path)
+            return None
+        try:
+            # mtime doubles as last-access time for LRU eviction
+            os.utime(path, None)
+        except Exception:
+            pass
+        return created, entry.get('value')
+
+    def _disk_remove(self, path: str):
+        try:
+            os.remove(path)
+        except Exception:
+            pass
+
+    def _scan_disk(self):
+        files = []
+        for name in os.listdir(self.disk_dir):
+            if not name.endswith('.json'):
+                continue
+            path = os.path.join(self.disk_dir, name)
+            try:
+                st = os.stat(path)
+            except Exception:
+                continue
+            files.append((st.st_mtime, st.st_size, path))
+        return files
+
+    def _disk_put(self, key: str, value: dict, created: float):
+        if not self.disk_dir or self.max_bytes <= 0:
+            return
+        try:
+            os.makedirs(self.disk_dir, exist_ok=True)
+            path = self._path(key)
+            tmp = path + '.tmp'
+            with open(tmp, 'w', encoding='utf-8') as fh:
+                json.dump({ 'created': created, 'value': value }, fh)
+            os.replace(tmp, path)
+        except Exception as e:
+            print('Result cache write failed:', e)
+            return
+        self._evict_disk()
+
+    def _evict_disk(self):
+        files = self._scan_disk()
+        total = sum(size for _, size, _ in files)
+        if total <= self.max_bytes:
+            return
+        files.sort()
+        for _, size, path in files:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+                total -= size
+                self.stats['evictions'] += 1
+            except Exception:
+                pass
+
+    def get(self, key: str) -> Optional[dict]:
+        value = self._mem_get(key)
+        if value is not None:
+            self.stats['hits'] += 1
+            self.stats['memory_hits'] += 1
+            return _copy_result(value)
+        found = self._disk_get(key)
+        if found and found[1] is not None:
+            created, value = found
+            self._mem_put(key, value, created)
+            self.stats['hits'] += 1
+            self.stats['disk_hits'] += 1
+            return _copy_result(value)
+        self.stats['misses'] += 1
+        return None
+
+    def put(self, key: str, value: dict):
+        created = time.time()
+        value = _copy_result(value)
+        self._mem_put(key, value, created)
+        self._disk_put(key, value, created)
+
+    async def aget(self, key: str) -> Optional[dict]:
+        # memory hits stay on the event loop; only disk reads hop to a thread
+        value = self._mem_get(key)
+        if value is not None:
+            self.stats['hits'] += 1
+            self.stats['memory_hits'] += 1
+            return _copy_result(value)
+        return await asyncio.to_thread(self.get, key)
+
+    async def aput(self, key: str, value: dict):
+        await asyncio.to_thread(self.put, key, value)
+
+
+def _env_float(name: str, default: float) -> float:
+    try:
+        return float(os.environ.get(name, default))
+    except Exception:
+        return default
+
+
+def cache_enabled() -> bool:
+    return str(os.environ.get('RESULT_CACHE_ENABLED', '1')).lower() not in ('0', 'false', 'no')
+
+
+_DEFAULT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.cache', 'results')
+
+RESULT_CACHE = ResultCache(
+    max_items=int(_env_float('RESULT_CACHE_MAX_ITEMS', 128)),
+    disk_dir=os.environ.get('RESULT_CACHE_DIR') or _DEFAULT_DIR,
+    max_bytes=int(_env_float('RESULT_CACHE_MAX_BYTES', 512 * 1024 * 1024)),
+    ttl=_env_float('RESULT_CACHE_TTL', 86400.0),
+)
@@ -1,6 +1,9 @@
-from fastapi import FastAPI, HTTPException
+import time
+_IMPORT_T0 = time.perf_counter()
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import JSONResponse, Response, StreamingResponse
 from pydantic import BaseModel
-from typing import List, Optional
+from typing import Any, Dict, List, Optional
 import math
 import os
 import base64
@@ -8,33 +11,62 @@ import json
 import httpx
 import httpcore
 import asyncio
-from io import BytesIO
+import threading
 try:
     from PIL import Image, ImageFilter, ImageOps
     PIL_AVAILABLE = True
 except Exception:
     PIL_AVAILABLE = False
 try:
-    from .sr import super_resolve, ocr_text_from_bytes, _decode_data_url
+    from .sr import super_resolve, super_resolve_image, ocr_text_from_bytes, ocr_text_async, _decode_data_url
 except Exception:
     try:
-        from sr import super_resolve, ocr_text_from_bytes, _decode_data_url
+        from sr import super_resolve, super_resolve_image, ocr_text_from_bytes, ocr_text_async, _decode_data_url
     except Exception:
         super_resolve = None
+        super_resolve_image = None
         ocr_text_from_bytes = None
+        ocr_text_async = None
         _decode_data_url = None
 
 # Attempt to import inpaint helpers regardless of whether sr imported successfully.
 try:
-    from .inpaint import detect_text_bboxes, make_mask_from_boxes, expand_boxes_by_ratio
+    from .inpaint import detect_text_bboxes, detect_text_bboxes_async, make_mask_from_boxes, make_mask_image, expand_boxes_by_ratio
 except Exception:
     try:
-        from inpaint import detect_text_bboxes, make_mask_from_boxes, expand_boxes_by_ratio
+        from inpaint import detect_text_bboxes, detect_text_bboxes_async, make_mask_from_boxes, make_mask_image, expand_boxes_by_ratio
     except Exception:
         detect_text_bboxes = None
+        detect_text_bboxes_async = None
         make_mask_from_boxes = None
+        make_mask_image = None
         expand_boxes_by_ratio = None
 
+try:
+    from .image_handle import ImageHandle, as_handle, encode_images
+except Exception:
+    from image_handle import ImageHandle, as_handle, encode_images
+
+try:
+    from .negotiation import negotiate
+except Exception:
+    from negotiation import negotiate
+
+try:
+    from .jobs import make_job_manager
+except Exception:
+    from jobs import make_job_manager
+
+try:
+    from .ocr_pool import OCR_POOL
+except Exception:
+    from ocr_pool import OCR_POOL
+
+try:
+    from .http_clients import get_client, startup_clients, shutdown_clients, provider_url, hf_model_url
+except Exception:
+    from http_clients import get_client, startup_clients, shutdown_clients, provider_url, hf_model_url
+
 # Stability.ai fallback configuration (set STABILITY_API_KEY in environment; do NOT hardcode keys)
 STABILITY_API_KEY = os.environ.get('STABILITY_API_KEY')
 # Prefer an explicit STABILITY_MODEL; if absent, allow using HUGGINGFACE_MODEL
@@ -72,6 +104,63 @@ except Exception:
         # best-effort; do not crash if dotenv not present
         print('Warning: could not load ml/.env — ensure env vars are set')
 
+try:
+    from .result_cache import RESULT_CACHE, make_key, cache_enabled
+except Exception:
+    from result_cache import RESULT_CACHE, make_key, cache_enabled
+try:
+    from .singleflight import SingleFlight
+except Exception:
+    from singleflight import SingleFlight
+try:
+    from .hedging import LatencyTracker, hedged
+except Exception:
+    from hedging import LatencyTracker, hedged
+try:
+    from .micro_batch import MicroBatcher
+except Exception:
+    from micro_batch import MicroBatcher
+try:
+    from .postprocess import POSTPROCESS_CONFIG, postprocess_image, postprocess_batch
+except Exception:
+    from postprocess import POSTPROCESS_CONFIG, postprocess_image, postprocess_batch
+try:
+    from .raster_to_vector import VECTORIZE_OPTIONS, vectorize as vectorize_image, vectorize_batch as vectorize_images, shutdown as shutdown_vectorize
+except Exception:
+    from raster_to_vector import VECTORIZE_OPTIONS, vectorize as vectorize_image, vectorize_batch as vectorize_images, shutdown as shutdown_vectorize
+try:
+    from .icon_index import ICON_INDEX
+except Exception:
+    from icon_index import ICON_INDEX
+try:
+    from .contrast import contrast_matrix, pair_contrast
+except Exception:
+    from contrast import contrast_matrix, pair_contrast
+try:
+    from .layout_suggestion import suggest_layout, suggest_layouts, prompt_layouts
+except Exception:
+    from layout_suggestion import suggest_layout, suggest_layouts, prompt_layouts
+try:
+    from .template_renderer import TEMPLATES, TemplateNotFound
+except Exception:
+    from template_renderer import TEMPLATES, TemplateNotFound
+try:
+    from .metrics import MetricsMiddleware, render as render_metrics, stage as metric_stage, CONTENT_TYPE as METRICS_CONTENT_TYPE, ENABLED as METRICS_ENABLED, PROVIDER_RETRIES, PROVIDER_FALLBACKS, CACHE_REQUESTS
+except Exception:
+    from metrics import MetricsMiddleware, render as render_metrics, stage as metric_stage, CONTENT_TYPE as METRICS_CONTENT_TYPE, ENABLED as METRICS_ENABLED, PROVIDER_RETRIES, PROVIDER_FALLBACKS, CACHE_REQUESTS
+try:
+    from .provider_router import ROUTER, CircuitOpen, hf_route, hf_task_route, STABILITY_V1
+except Exception:
+    from provider_router import ROUTER, CircuitOpen, hf_route, hf_task_route, STABILITY_V1
+try:
+    from .tracing import TracingMiddleware, current_trace
+except Exception:
+    from tracing import TracingMiddleware, current_trace
+try:
+    from .backends import report as backends_report, preload as preload_backends, require as require_backend
+except Exception:
+    from backends import report as backends_report, preload as preload_backends, require as require_backend
+
 # Optional local Diffusers backend
 USE_LOCAL_DIFFUSION = os.environ.get('USE_LOCAL_DIFFUSION', '') in ('1', 'true', 'True')
 LOCAL_BASE_MODEL = os.environ.get('LOCAL_BASE_MODEL') or 'stabilityai/stable-diffusion-xl-base-1.0'
@@ -79,16 +168,26 @@ LOCAL_REFINER_MODEL = os.environ.get('LOCAL_REFINER_MODEL') or 'stabilityai/stab
 
 # Cache pipelines to avoid reloading every request
 _LOCAL_PIPELINES = {}
+# the load runs once even when several first requests (or the warm-up) race for it
+_LOCAL_PIPELINES_LOCK = threading.Lock()
+# warm-up progress reported by /health: disabled | loading | ready | failed
+_LOCAL_WARMUP = { 'state': 'disabled', 'error': None, 'elapsed_s': None }
 
 def _load_local_pipelines(device='cuda'):
-    global _LOCAL_PIPELINES
     if _LOCAL_PIPELINES.get('loaded'):
         return _LOCAL_PIPELINES['base'], _LOCAL_PIPELINES['refiner']
+    with _LOCAL_PIPELINES_LOCK:
+        if not _LOCAL_PIPELINES.get('loaded'):
+            _load_local_pipelines_locked(device)
+    return _LOCAL_PIPELINES['base'], _LOCAL_PIPELINES['refiner']
+
+
+def _load_local_pipelines_locked(device):
 
     try:
-        # Local imports to keep server lightweight when not used
-        from diffusers import DiffusionPipeline
-        import torch
+        # imported on first use to keep server import lightweight
+        DiffusionPipeline = require_backend('diffusers').DiffusionPipeline
+        torch = require_backend('torch')
     except Exception as e:
         raise RuntimeError('diffusers/torch not available: ' + str(e))
 
@@ -115,17 +214,31 @@ def _load_local_pipelines(device='cuda'):
     _LOCAL_PIPELINES['base'] = base
     _LOCAL_PIPELINES['refiner'] = refiner
     _LOCAL_PIPELINES['loaded'] = True
-    return base, refiner
 
-def _generate_local_image_sync(prompt, steps=40, high_noise_frac=0.8, width=512, height=512, device='cuda'):
-    # synchronous helper using the provided two-stage pipeline
-    from io import BytesIO
+
+def _warm_local_pipelines():
+    """Load the pipelines and run one small inference at the configured size so
+    weights, kernels and allocator pools are ready before the first real request."""
+    device = os.environ.get('LOCAL_DEVICE','cuda')
+    _load_local_pipelines(device=device)
+    if str(os.environ.get('LOCAL_WARMUP_INFERENCE', '1')).lower() in ('0', 'false', 'no'):
+        return
+    width = int(os.environ.get('LOCAL_WARMUP_WIDTH', 512))
+    height = int(os.environ.get('LOCAL_WARMUP_HEIGHT', 512))
+    steps = int(os.environ.get('LOCAL_WARMUP_STEPS', 4))
+    high_noise_frac = float(os.environ.get('LOCAL_HIGH_NOISE_FRAC', 0.8))
+    _generate_local_batch_sync(['warm-up'], steps, high_noise_frac, width, height, device)
+
+def _generate_local_batch_sync(prompts, steps=40, high_noise_frac=0.8, width=512, height=512, device='cuda', pipelines=None):
+    # synchronous helper: one batched base+refiner pass over `prompts`; returns one
+    # ImageHandle per prompt, in order. `pipelines` overrides the loaded (base, refiner).
     from PIL import Image
-    base, refiner = _load_local_pipelines(device=device)
+    base, refiner = pipelines or _load_local_pipelines(device=device)
+    prompts = list(prompts)
 
     # run base to latents
     latents = base(
-        prompt=prompt,
+        prompt=prompts,
         num_inference_steps=steps,
         denoising_end=high_noise_frac,
         output_type='latent',
@@ -133,134 +246,277 @@ def _generate_local_image_sync(prompt, steps=40, high_noise_frac=0.8, width=512,
         height=height,
     ).images
 
-    # refine latents into final image
-    out = refiner(
-        prompt=prompt,
+    # refine latents into final images
+    outs = refiner(
+        prompt=prompts,
         num_inference_steps=steps,
         denoising_start=high_noise_frac,
         image=latents,
-    ).images[0]
+    ).images
+
+    handles = []
+    for out in list(outs)[:len(prompts)]:
+        # ensure PIL image; PNG encoding is deferred to the response boundary
+        if not isinstance(out, Image.Image):
+            # attempt to convert tensor/array
+            out = Image.fromarray(out)
+        handles.append(ImageHandle.from_pil(out))
+    return handles
+
+
+def _generate_local_image_sync(prompt, steps=40, high_noise_frac=0.8, width=512, height=512, device='cuda'):
+    return _generate_local_batch_sync([prompt], steps, high_noise_frac, width, height, device)[0]
+
+
+def _run_local_batch(key, prompts):
+    width, height, steps, high_noise_frac = key
+    return _generate_local_batch_sync(prompts, steps, high_noise_frac, width, height, os.environ.get('LOCAL_DEVICE','cuda'))
+
 
-    # ensure PIL image and convert to PNG bytes
-    buf = BytesIO()
-    if not isinstance(out, Image.Image):
-        # attempt to convert tensor/array
-        out = Image.fromarray(out)
-    out.save(buf, format='PNG')
-    buf.seek(0)
-    return buf.read()
+# Concurrent local requests with the same size/steps are gathered into one batched
+# pipeline call; all local pipeline work runs on the batcher's single thread.
+LOCAL_BATCHER = MicroBatcher(_run_local_batch)
 
 
-def _postprocess_image_bytes(
-    img_bytes: bytes,
+def _postprocess_image(
+    img: ImageHandle,
     enabled: Optional[bool] = None,
     upscale: Optional[float] = None,
     unsharp_radius: Optional[float] = None,
     unsharp_percent: Optional[float] = None,
     unsharp_threshold: Optional[int] = None,
     autocontrast: Optional[bool] = None,
-) -> bytes:
+) -> ImageHandle:
     """Lightweight post-processing to improve legibility of small card text.
-    Parameters are per-call and if left None, fall back to environment defaults.
-    Returns PNG bytes.
+    Parameters are per-call and if left None, fall back to the env config
+    resolved once at startup (see postprocess.py).
+    Returns a new ImageHandle (or the input handle when disabled/failed).
     """
-    # resolve enabled flag
-    if enabled is None:
-        enabled_raw = os.environ.get('POSTPROCESS_ENABLED', '1')
-        enabled = not (str(enabled_raw).lower() in ('0', 'false', 'no'))
-    if not enabled:
-        return img_bytes
+    cfg = POSTPROCESS_CONFIG.merged(
+        enabled=enabled,
+        upscale=upscale,
+        unsharp_radius=unsharp_radius,
+        unsharp_percent=unsharp_percent,
+        unsharp_threshold=unsharp_threshold,
+        autocontrast=autocontrast,
+    )
+    if not cfg.enabled:
+        return img
     if not PIL_AVAILABLE:
         print('Pillow not available; skipping post-processing')
-        return img_bytes
-
+        return img
     try:
-        # resolve numeric params with env fallbacks
-        try:
-            if upscale is None:
-                upscale = float(os.environ.get('POSTPROCESS_UPSCALE', 1.5))
-        except Exception:
-            upscale = 1.5
-        try:
-            if unsharp_radius is None:
-                unsharp_radius = float(os.environ.get('POSTPROCESS_UNSHARP_RADIUS', 1.0))
-        except Exception:
-            unsharp_radius = 1.0
-        try:
-            if unsharp_percent is None:
-                unsharp_percent = float(os.environ.get('POSTPROCESS_UNSHARP_PERCENT', 150.0))
-        except Exception:
-            unsharp_percent = 150.0
-        try:
-            if unsharp_threshold is None:
-                unsharp_threshold = int(os.environ.get('POSTPROCESS_UNSHARP_THRESHOLD', 3))
-        except Exception:
-            unsharp_threshold = 3
-        if autocontrast is None:
-            ac_raw = os.environ.get('POSTPROCESS_AUTOCONTRAST', '1')
-            autocontrast = not (str(ac_raw).lower() in ('0', 'false', 'no'))
+        with metric_stage('postprocess'):
+            return ImageHandle.from_pil(postprocess_image(img.rgba(), cfg))
+    except Exception as e:
+        print('Post-processing failed:', e)
+        return img
 
-        buf = BytesIO(img_bytes)
-        img = Image.open(buf).convert('RGBA')
 
-        # upscale preserving aspect ratio
-        if upscale and float(upscale) > 1.01:
-            new_w = int(img.width * float(upscale))
-            new_h = int(img.height * float(upscale))
-            img = img.resize((new_w, new_h), resample=Image.LANCZOS)
+def _postprocess_batch(imgs: List[ImageHandle], **params) -> List[ImageHandle]:
+    """Postprocess several candidates with one resolved config (see `_postprocess_image`)."""
+    cfg = POSTPROCESS_CONFIG.merged(**params)
+    if not cfg.enabled or not PIL_AVAILABLE or not imgs:
+        return list(imgs)
+    try:
+        with metric_stage('postprocess'):
+            return [ImageHandle.from_pil(out) for out in postprocess_batch([h.rgba() for h in imgs], cfg)]
+    except Exception as e:
+        print('Post-processing failed:', e)
+        return list(imgs)
+
+
+def _postprocess_image_bytes(img_bytes: bytes, **params) -> bytes:
+    """Bytes-in/PNG-bytes-out wrapper around `_postprocess_image`."""
+    img = ImageHandle.from_bytes(img_bytes)
+    out = _postprocess_image(img, **params)
+    return img_bytes if out is img else out.png_bytes()
+
+
+def _postprocess_params(req) -> dict:
+    """Per-request postprocess flags as `_postprocess_image` keyword arguments."""
+    do_post_flag = getattr(req, 'postprocess', None)
+    return dict(
+        enabled=None if do_post_flag is None else bool(do_post_flag),
+        upscale=getattr(req, 'postprocess_upscale', None),
+        unsharp_radius=getattr(req, 'postprocess_unsharp_radius', None),
+        unsharp_percent=getattr(req, 'postprocess_unsharp_percent', None),
+        unsharp_threshold=getattr(req, 'postprocess_unsharp_threshold', None),
+        autocontrast=getattr(req, 'postprocess_autocontrast', None),
+    )
 
-        # apply unsharp mask to emphasize text edges
-        try:
-            img = img.filter(ImageFilter.UnsharpMask(radius=float(unsharp_radius), percent=int(unsharp_percent), threshold=int(unsharp_threshold)))
-        except Exception as e:
-            print('Unsharp failed:', e)
 
-        # optional autocontrast to improve contrast on low-contrast renders
-        try:
-            if autocontrast:
-                img = ImageOps.autocontrast(img)
-        except Exception:
-            pass
+def _postprocess_from_request(img: ImageHandle, req) -> ImageHandle:
+    """Apply `_postprocess_image` with the per-request postprocess flags (env fallback)."""
+    return _postprocess_image(img, **_postprocess_params(req))
 
-        out_buf = BytesIO()
-        img.save(out_buf, format='PNG')
-        out_buf.seek(0)
-        return out_buf.read()
-    except Exception as e:
-        print('Post-processing failed:', e)
-        return img_bytes
 
+def _sr_requested(req) -> bool:
+    do_sr = getattr(req, 'postprocess_sr', None)
+    if do_sr is None:
+        do_sr = str(os.environ.get('POSTPROCESS_SR', '0')).lower() in ('1', 'true', 'yes')
+    return bool(do_sr and super_resolve_image)
 
-def _local_text_boost(img_bytes: bytes) -> bytes:
+
+async def _postprocess_candidates(results: list, params_by_provider: dict):
+    """Postprocess the fan-out's HF / local candidates in one `_postprocess_batch` call
+    per distinct config (in place; result dicts are per-request copies).
+    """
+    groups = {}
+    for res in results:
+        if not isinstance(res, dict) or res.get('provider') not in params_by_provider:
+            continue
+        # an HF request that fell back to Stability was never going to be postprocessed
+        if res.get('source') not in ('huggingface', 'local'):
+            continue
+        params = params_by_provider[res['provider']]
+        images = res.get('images') or []
+        for i, img in enumerate(images):
+            if isinstance(img, ImageHandle):
+                groups.setdefault(tuple(sorted(params.items())), []).append((images, i))
+    for key, slots in groups.items():
+        out = await asyncio.to_thread(_postprocess_batch, [images[i] for images, i in slots], **dict(key))
+        for (images, i), img in zip(slots, out):
+            images[i] = img
+
+
+def _local_text_boost_image(img: ImageHandle) -> ImageHandle:
     """Lightweight local enhancement to improve small text legibility without ML models.
     Uses PIL autocontrast, binarization, and max-filter dilation to thicken strokes.
-    Returns PNG bytes.
+    Returns a new ImageHandle.
     """
     if not PIL_AVAILABLE:
-        return img_bytes
+        return img
     try:
-        buf = BytesIO(img_bytes)
-        img = Image.open(buf).convert('L')
-        # increase contrast
-        img = ImageOps.autocontrast(img)
-        # simple threshold to b/w
-        img = img.point(lambda p: 255 if p > 128 else 0)
-        # apply a couple of MaxFilter passes to thicken strokes
-        try:
-            img = img.filter(ImageFilter.MaxFilter(3))
-            img = img.filter(ImageFilter.MaxFilter(3))
-        except Exception:
-            pass
-        out = img.convert('RGBA')
-        out_buf = BytesIO()
-        out.save(out_buf, format='PNG')
-        out_buf.seek(0)
-        return out_buf.read()
+        with metric_stage('text_boost'):
+            # increase contrast on the shared grayscale view
+            out = ImageOps.autocontrast(img.gray())
+            # simple threshold to b/w
+            out = out.point(lambda p: 255 if p > 128 else 0)
+            # apply a couple of MaxFilter passes to thicken strokes
+            try:
+                out = out.filter(ImageFilter.MaxFilter(3))
+                out = out.filter(ImageFilter.MaxFilter(3))
+            except Exception:
+                pass
+            return ImageHandle.from_pil(out.convert('RGBA'))
     except Exception as e:
         print('local_text_boost failed:', e)
-        return img_bytes
+        return img
+
+
+def _local_text_boost(img_bytes: bytes) -> bytes:
+    """Bytes-in/PNG-bytes-out wrapper around `_local_text_boost_image`."""
+    img = ImageHandle.from_bytes(img_bytes)
+    out = _local_text_boost_image(img)
+    return img_bytes if out is img else out.png_bytes()
 
 app = FastAPI(title='CardGEN ML PoC Service')
+app.add_middleware(MetricsMiddleware, router=app.router)
+# outermost: X-Request-Id / Server-Timing cover the whole request, metrics included
+app.add_middleware(TracingMiddleware)
+
+# set at the bottom of this module; time spent importing server.py and its helpers
+_IMPORT_MS = None
+_BACKEND_PRELOAD = { 'task': None }
+
+
+@app.on_event('startup')
+async def _startup_backends():
+    print(f'ML service imported in {_IMPORT_MS} ms')
+    names = [n.strip() for n in os.environ.get('BACKEND_PRELOAD', '').split(',') if n.strip()]
+    if not names:
+        return
+
+    async def _preload():
+        # off the startup path: the server takes traffic while heavy modules import
+        report = await asyncio.to_thread(preload_backends, names)
+        for name in names:
+            info = report.get(name) or {}
+            print(f"Backend {name}: available={info.get('available')} import_ms={info.get('import_ms')}", info.get('error') or '')
+
+    _BACKEND_PRELOAD['task'] = asyncio.ensure_future(_preload())
+
+
+@app.get('/backends')
+async def backends():
+    """Import budget: server import time plus per-backend availability and import timings."""
+    return { 'import_ms': _IMPORT_MS, 'backends': backends_report() }
+
+
+@app.on_event('startup')
+async def _startup_http_clients():
+    await startup_clients()
+
+
+@app.on_event('shutdown')
+async def _shutdown_http_clients():
+    await shutdown_clients()
+
+
+@app.on_event('startup')
+async def _startup_ocr_pool():
+    # load the Tesseract model into every OCR worker before taking traffic
+    try:
+        if OCR_POOL.mode() == 'fork-per-call':
+            print('OCR pool: tesserocr not installed, pytesseract forks tesseract per call (no warm model)')
+        await asyncio.to_thread(OCR_POOL.warm)
+    except Exception as e:
+        print('OCR pool warm-up failed:', e)
+
+
+@app.on_event('shutdown')
+async def _shutdown_ocr_pool():
+    await asyncio.to_thread(OCR_POOL.shutdown)
+
+
+@app.on_event('startup')
+async def _startup_local_pipelines():
+    if not USE_LOCAL_DIFFUSION or str(os.environ.get('LOCAL_EAGER_LOAD', '1')).lower() in ('0', 'false', 'no'):
+        return
+    _LOCAL_WARMUP['state'] = 'loading'
+
+    async def _warm():
+        t0 = time.perf_counter()
+        try:
+            # on the pipeline thread, so queued local requests simply wait behind it
+            await LOCAL_BATCHER.run_exclusive(_warm_local_pipelines)
+            _LOCAL_WARMUP['state'] = 'ready'
+        except Exception as e:
+            print('Local pipeline warm-up failed:', e)
+            _LOCAL_WARMUP['state'] = 'failed'
+            _LOCAL_WARMUP['error'] = str(e)
+        _LOCAL_WARMUP['elapsed_s'] = round(time.perf_counter() - t0, 2)
+        print('Local pipeline warm-up', _LOCAL_WARMUP['state'], f"in {_LOCAL_WARMUP['elapsed_s']}s")
+
+    # run in the background so the server (and /health) answers while loading
+    _LOCAL_WARMUP['task'] = asyncio.ensure_future(_warm())
+
+
+@app.on_event('shutdown')
+async def _shutdown_local_batcher():
+    await asyncio.to_thread(LOCAL_BATCHER.shutdown)
+
+
+@app.get('/metrics')
+async def metrics():
+    # Prometheus text format: request / provider / stage histograms, retries, fallbacks, cache ratios
+    if not METRICS_ENABLED:
+        raise HTTPException(status_code=404, detail='metrics disabled (METRICS_ENABLED=0)')
+    return Response(content=render_metrics(), media_type=METRICS_CONTENT_TYPE)
+
+
+@app.get('/providers/router')
+async def providers_router():
+    # circuit state, success / latency EWMAs and counts per provider route
+    return ROUTER.snapshot()
+
+
+@app.post('/providers/router/reset')
+async def providers_router_reset(route: Optional[str] = None):
+    # close one route's circuit (or all) and forget its history, e.g. after fixing credentials
+    ROUTER.reset(route)
+    return ROUTER.snapshot()
 
 
 @app.get('/health')
@@ -270,8 +526,18 @@ async def health():
         'status': 'ok',
         'service': 'cardgen-ml',
         'use_local_diffusion': bool(USE_LOCAL_DIFFUSION),
-        'model': os.environ.get('STABILITY_MODEL') or os.environ.get('HUGGINGFACE_MODEL') or ''
+        'model': os.environ.get('STABILITY_MODEL') or os.environ.get('HUGGINGFACE_MODEL') or '',
+        # 'fork-per-call' means pytesseract: no warm Tesseract model (install tesserocr)
+        'ocr': OCR_POOL.info(),
     }
+    if USE_LOCAL_DIFFUSION:
+        info['local_pipelines'] = { k: v for k, v in _LOCAL_WARMUP.items() if k != 'task' }
+        if _LOCAL_WARMUP['state'] == 'loading':
+            # not ready until the eager load + warm-up finishes
+            info['status'] = 'loading'
+            return JSONResponse(status_code=503, content=info)
+        if _LOCAL_WARMUP['state'] == 'failed':
+            info['status'] = 'degraded'
     return info
 
 
@@ -311,6 +577,12 @@ class GenerateLogoRequest(BaseModel):
     postprocess_unsharp_percent: Optional[float] = None
     postprocess_unsharp_threshold: Optional[int] = None
     postprocess_autocontrast: Optional[bool] = None
+    # skip the result-cache lookup for this request (the fresh result is still stored)
+    cache_bypass: Optional[bool] = None
+    # /generate/multi only: 'all' | 'first' | 'first_n', plus per-provider deadlines in seconds
+    mode: Optional[str] = None
+    first_n: Optional[int] = None
+    provider_deadlines: Optional[Dict[str, float]] = None
 
 
 class ComposePromptRequest(BaseModel):
@@ -356,7 +628,7 @@ async def compose_prompt(req: ComposePromptRequest):
 
     # Call HF text-generation endpoint for a richer prompt
     try:
-        url = f'https://api-inference.huggingface.co/models/{hf_model}'
+        url = hf_model_url(hf_model)
         headers = {'Authorization': f'Bearer {hf_token}'}
         # craft a short instruction
         instr = (
@@ -367,72 +639,138 @@ async def compose_prompt(req: ComposePromptRequest):
             "Provide a single concise prompt optimized for image generation with emphasis on legibility."
         )
         payload = { 'inputs': instr, 'options': { 'wait_for_model': True }, 'parameters': { 'max_new_tokens': 200 } }
-        async with httpx.AsyncClient(timeout=httpx.Timeout(30.0, connect=10.0)) as client:
-            r = await client.post(url, headers=headers, json=payload)
-            if r.status_code == 200:
-                data = r.json()
-                # HF text endpoints sometimes return a list of generations
-                if isinstance(data, list) and data:
-                    text = data[0].get('generated_text') or data[0].get('text') or str(data[0])
-                elif isinstance(data, dict):
-                    text = data.get('generated_text') or data.get('text') or str(data)
-                else:
-                    text = str(data)
-                return { 'prompt': text.strip(), 'source': 'huggingface' }
+        client = get_client('hf')
+        r = await client.post(url, headers=headers, json=payload, timeout=httpx.Timeout(30.0, connect=10.0),
+                              extensions={ 'route': hf_task_route('text', hf_model) })
+        if r.status_code == 200:
+            data = r.json()
+            # HF text endpoints sometimes return a list of generations
+            if isinstance(data, list) and data:
+                text = data[0].get('generated_text') or data[0].get('text') or str(data[0])
+            elif isinstance(data, dict):
+                text = data.get('generated_text') or data.get('text') or str(data)
             else:
-                return { 'prompt': template(), 'source': 'template', 'warning': f'HF text-gen status {r.status_code}' }
+                text = str(data)
+            return { 'prompt': text.strip(), 'source': 'huggingface' }
+        else:
+            return { 'prompt': template(), 'source': 'template', 'warning': f'HF text-gen status {r.status_code}' }
     except Exception as e:
         return { 'prompt': template(), 'source': 'template', 'warning': str(e) }
 
 
+def _multi_deadline(req: GenerateLogoRequest, provider: str) -> Optional[float]:
+    """Per-provider deadline: request override, then MULTI_DEADLINE_<PROVIDER>,
+    then MULTI_PROVIDER_DEADLINE (default 600s). Values <= 0 disable the deadline.
+    """
+    raw = (req.provider_deadlines or {}).get(provider)
+    if raw is None:
+        raw = os.environ.get(f'MULTI_DEADLINE_{provider.upper()}') or os.environ.get('MULTI_PROVIDER_DEADLINE', 600)
+    try:
+        val = float(raw)
+    except Exception:
+        return 600.0
+    return val if val > 0 else None
+
+
 @app.post('/generate/multi')
-async def generate_multi(req: GenerateLogoRequest):
+async def generate_multi(req: GenerateLogoRequest, request: Request):
+    return negotiate(request.headers.get('accept'), await _generate_multi(req))
+
+
+async def _generate_multi(req: GenerateLogoRequest):
     """Run the same prompt across available providers: Stability, HuggingFace, and local diffusers.
-    Returns an ordered list of results with metadata.
+    Providers run concurrently, each under its own deadline. `mode` controls when to return:
+    'all' (default) waits for every provider, 'first' returns on the first success and cancels
+    the rest, 'first_n' waits for `first_n` successes. Returns results in provider order plus
+    per-provider timings. Images stay ImageHandles; `generate_multi` encodes them.
     """
-    results = []
-
-    # 1) Try Stability (best-effort)
+    mode = (req.mode or 'all').lower()
+    if mode not in ('all', 'first', 'first_n'):
+        raise HTTPException(status_code=400, detail=f'unknown mode: {req.mode}')
+
+    # HF / local candidates are postprocessed together after the fan-out instead of
+    # once inside each provider path. SR runs after postprocess there, so requests
+    # with SR keep the per-provider order.
+    defer_post = not _sr_requested(req)
+    lreq = GenerateLogoRequest(prompt=req.prompt, width=req.width, height=req.height, steps=req.steps, cache_bypass=req.cache_bypass)
+    post_params = { 'huggingface': _postprocess_params(req), 'local': _postprocess_params(lreq) }
+    hreq = req
+    if defer_post:
+        hreq = GenerateLogoRequest(**{ **req.dict(), 'postprocess': False })
+        lreq = GenerateLogoRequest(**{ **lreq.dict(), 'postprocess': False })
+
+    providers = []
     if generate_stability_image:
-        try:
-            sreq = StabilityRequest(prompt=req.prompt, width=req.width, height=req.height, steps=req.steps)
-            sres = await generate_stability(sreq)
-            if isinstance(sres, dict):
-                sres.setdefault('provider', 'stability')
-            results.append(sres)
-        except Exception as e:
-            results.append({ 'error': 'stability_failed', 'details': str(e), 'provider': 'stability' })
+        def _stability():
+            sreq = StabilityRequest(prompt=req.prompt, width=req.width, height=req.height, steps=req.steps, cache_bypass=req.cache_bypass)
+            return _generate_stability(sreq)
+        providers.append(('stability', 'stability_failed', _stability))
+    providers.append(('huggingface', 'hf_failed', lambda: _generate_logo(hreq)))
+    if USE_LOCAL_DIFFUSION:
+        providers.append(('local', 'local_failed', lambda: _generate_logo(lreq)))
 
-    # 2) Hugging Face
-    try:
-        hres = await generate_logo(req)
-        if isinstance(hres, dict):
-            hres.setdefault('provider', 'huggingface')
-        results.append(hres)
-    except Exception as e:
-        results.append({ 'error': 'hf_failed', 'details': str(e), 'provider': 'huggingface' })
+    if mode == 'first':
+        needed = 1
+    elif mode == 'first_n':
+        needed = max(1, int(req.first_n or 1))
+    else:
+        needed = len(providers)
 
-    # 3) local diffusers
-    if USE_LOCAL_DIFFUSION:
+    timings = {}
+
+    async def _run(provider, error_name, make):
+        deadline = _multi_deadline(req, provider)
+        t0 = time.perf_counter()
         try:
-            lreq = GenerateLogoRequest(prompt=req.prompt, width=req.width, height=req.height, steps=req.steps)
-            lres = await generate_logo(lreq)
-            if isinstance(lres, dict):
-                lres.setdefault('provider', 'local')
-            results.append(lres)
+            res = await asyncio.wait_for(make(), timeout=deadline)
+            if isinstance(res, dict):
+                res.setdefault('provider', provider)
+            status = 'ok'
+        except asyncio.TimeoutError:
+            res = { 'error': error_name, 'details': f'deadline of {deadline}s exceeded', 'provider': provider }
+            status = 'timeout'
         except Exception as e:
-            results.append({ 'error': 'local_failed', 'details': str(e), 'provider': 'local' })
-
-    return { 'results': results }
+            res = { 'error': error_name, 'details': str(e), 'provider': provider }
+            status = 'error'
+        timings[provider] = { 'status': status, 'elapsed_ms': round((time.perf_counter() - t0) * 1000.0, 1), 'deadline_s': deadline }
+        return res
+
+    tasks = { asyncio.ensure_future(_run(*p)): p[0] for p in providers }
+    done_results = {}
+    successes = 0
+    pending = set(tasks)
+    try:
+        while pending and successes < needed:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for t in done:
+                res = t.result()
+                done_results[tasks[t]] = res
+                if isinstance(res, dict) and res.get('images'):
+                    successes += 1
+    finally:
+        for t in pending:
+            t.cancel()
+            timings.setdefault(tasks[t], { 'status': 'cancelled' })
+        if pending:
+            await asyncio.gather(*pending, return_exceptions=True)
+
+    results = [done_results[name] for name, _, _ in providers if name in done_results]
+    if defer_post:
+        await _postprocess_candidates(results, post_params)
+    return { 'results': results, 'mode': mode, 'timings': timings }
 
 
 @app.post('/generate/with-score')
-async def generate_with_score(req: GenerateLogoRequest):
+async def generate_with_score(req: GenerateLogoRequest, request: Request):
     """Run multi-provider generation, optionally super-resolve each image, perform OCR scoring,
     and return all results plus the best-picked image according to OCR length.
     """
-    # Run multi-provider generation to get candidate images
-    multi = await generate_multi(req)
+    return negotiate(request.headers.get('accept'), await _generate_with_score(req))
+
+
+async def _generate_with_score(req: GenerateLogoRequest):
+    # Run multi-provider generation to get candidate images (kept as ImageHandles)
+    multi = await _generate_multi(req)
     results = multi.get('results', []) if isinstance(multi, dict) else []
 
     scored = []
@@ -442,8 +780,7 @@ async def generate_with_score(req: GenerateLogoRequest):
             scored.append({ 'provider': item.get('provider') if isinstance(item, dict) else 'unknown', 'error': item.get('error') if isinstance(item, dict) else 'invalid' })
             continue
         try:
-            img_dataurl = item['images'][0]
-            img_bytes = _decode_data_url(img_dataurl) if img_dataurl.startswith('data:') else base64.b64decode(img_dataurl)
+            img = as_handle(item['images'][0])
         except Exception as e:
             scored.append({ 'provider': item.get('provider','unknown'), 'error': 'invalid_image', 'details': str(e) })
             continue
@@ -455,10 +792,10 @@ async def generate_with_score(req: GenerateLogoRequest):
             if do_sr is None:
                 do_sr_env = os.environ.get('POSTPROCESS_SR', '0')
                 do_sr = str(do_sr_env).lower() in ('1', 'true', 'yes')
-            if do_sr and super_resolve:
+            if do_sr and super_resolve_image:
                 try:
                     sr_mode = meta.get('postprocess_sr_mode') or os.environ.get('POSTPROCESS_SR_MODE','hf')
-                    img_bytes = await super_resolve(img_bytes, mode=sr_mode)
+                    img = await super_resolve_image(img, mode=sr_mode)
                 except Exception as e:
                     print('SR failed for provider', item.get('provider'), str(e))
         except Exception:
@@ -467,16 +804,16 @@ async def generate_with_score(req: GenerateLogoRequest):
         # OCR scoring
         score = 0
         text = ''
-        if ocr_text_from_bytes:
+        if ocr_text_async:
             try:
-                text = ocr_text_from_bytes(img_bytes)
+                text = await ocr_text_async(img)
                 score = len(text.strip())
             except Exception as e:
                 print('OCR failed:', e)
 
         scored.append({
             'provider': item.get('provider','unknown'),
-            'image': 'data:image/png;base64,' + base64.b64encode(img_bytes).decode('utf-8'),
+            'image': img,
             'ocr_text': text,
             'score': score,
             'meta': { k: v for k, v in item.items() if k != 'images' }
@@ -575,16 +912,16 @@ def contrast_ratio(a, b):
 
 @app.post('/check-accessibility')
 async def check_accessibility(req: AccessibilityRequest):
+    els = req.elements
+    checked = pair_contrast([el.textColor or '#000000' for el in els], [el.bgColor or '#ffffff' for el in els])
     results = []
-    for el in req.elements:
-        ratio = contrast_ratio(el.textColor or '#000000', el.bgColor or '#ffffff')
-        passAA = ratio >= 4.5
-        passLarge = ratio >= 3.0
+    for i, el in enumerate(els):
+        passAA = bool(checked['passAA'][i])
         results.append({
             'id': el.id,
-            'contrast': round(ratio, 2),
+            'contrast': round(float(checked['ratios'][i]), 2),
             'passAA': passAA,
-            'passLarge': passLarge,
+            'passLarge': bool(checked['passLarge'][i]),
             'recommendation': 'OK' if passAA else 'Increase contrast: use darker text or lighter background',
             'textColor': el.textColor,
             'bgColor': el.bgColor
@@ -592,22 +929,105 @@ async def check_accessibility(req: AccessibilityRequest):
     return { 'results': results }
 
 
+class ContrastMatrixRequest(BaseModel):
+    # any one of: foregrounds x backgrounds, every colour against every other, or a card's elements
+    foregrounds: Optional[List[str]] = None
+    backgrounds: Optional[List[str]] = None
+    colors: Optional[List[str]] = None
+    elements: Optional[List[Element]] = None
+    decimals: Optional[int] = 2
+    # matrix modes: return only the [fg, bg, ratio] pairs passing this mask instead of full matrices
+    only: Optional[str] = None
+
+
+CONTRAST_MAX_CELLS = int(os.environ.get('CONTRAST_MAX_CELLS', 4_000_000))
+
+
+@app.post('/check-accessibility/matrix')
+async def check_accessibility_matrix(req: ContrastMatrixRequest):
+    """Bulk WCAG check in one vectorized pass. Matrix modes return ratios and
+    passAA / passAAA / passLarge / passLargeAAA masks with rows = foregrounds;
+    element mode returns the same per element plus `pass` (large text by fontSize).
+    """
+    decimals = max(0, min(4, req.decimals if req.decimals is not None else 2))
+    if req.only is not None and req.only not in ('passAA', 'passAAA', 'passLarge', 'passLargeAAA'):
+        raise HTTPException(status_code=400, detail='only must be one of passAA, passAAA, passLarge, passLargeAAA')
+    if req.elements is not None:
+        els = req.elements
+        checked = pair_contrast(
+            [el.textColor or '#000000' for el in els],
+            [el.bgColor or '#ffffff' for el in els],
+            [el.fontSize for el in els],
+        )
+        out = { 'ids': [el.id for el in els] }
+    else:
+        fg = req.foregrounds if req.foregrounds is not None else req.colors
+        bg = req.backgrounds if req.backgrounds is not None else req.colors
+        if fg is None or bg is None:
+            raise HTTPException(status_code=400, detail='provide foregrounds and backgrounds, colors, or elements')
+        if len(fg) * len(bg) > CONTRAST_MAX_CELLS:
+            raise HTTPException(status_code=400, detail=f'matrix too large ({len(fg)}x{len(bg)}); limit is {CONTRAST_MAX_CELLS} cells')
+        checked = await asyncio.to_thread(contrast_matrix, fg, bg)
+        out = { 'foregrounds': checked.pop('foregrounds'), 'backgrounds': checked.pop('backgrounds') }
+    ratios = checked.pop('ratios')
+    out['summary'] = { 'pairs': int(ratios.size), **{ k: int(v.sum()) for k, v in checked.items() } }
+    if req.only is not None and req.elements is None:
+        rows, cols = checked[req.only].nonzero()
+        out['pairs'] = [[int(i), int(j), round(float(ratios[i, j]), decimals)] for i, j in zip(rows, cols)]
+    else:
+        out['contrast'] = ratios.round(decimals).tolist()
+        out.update({ k: v.tolist() for k, v in checked.items() })
+    # plain lists only: skip the per-value jsonable_encoder walk on large matrices
+    return JSONResponse(content=out)
+
+
+def _decode_ocr_image(image_b64: str) -> bytes:
+    header, b64 = (image_b64.split(',', 1) + [''])[:2]
+    return base64.b64decode(b64 or image_b64)
+
+
+_OCR_UNAVAILABLE = 'OCR not available or failed to run. Install tesserocr or pytesseract and the Tesseract OCR binary.'
+
+
 @app.post('/ocr')
 async def ocr_endpoint(req: OCRRequest):
-    # Try pytesseract if available, otherwise return informative message
+    # Run on the shared OCR worker pool, otherwise return informative message
     try:
-        import base64
-        from io import BytesIO
-        from PIL import Image
-        import pytesseract
-
-        header, b64 = (req.imageBase64.split(',', 1) + [''])[:2]
-        data = base64.b64decode(b64 or req.imageBase64)
-        img = Image.open(BytesIO(data))
-        text = pytesseract.image_to_string(img)
+        data = _decode_ocr_image(req.imageBase64)
+        text = await OCR_POOL.text(data)
         return { 'text': text }
     except Exception as e:
-        return { 'error': 'pytesseract not available or failed to run. Install pytesseract and Tesseract OCR binary.', 'details': str(e) }
+        return { 'error': _OCR_UNAVAILABLE, 'details': str(e) }
+
+
+class OCRBatchRequest(BaseModel):
+    images: List[str] = []
+
+
+@app.post('/ocr/batch')
+async def ocr_batch_endpoint(req: OCRBatchRequest):
+    """OCR many images in one request. Results keep input order; each entry has
+    either `text` or `error`/`details`.
+    """
+    decoded = []
+    for b64 in req.images:
+        try:
+            decoded.append(_decode_ocr_image(b64))
+        except Exception as e:
+            decoded.append(e)
+    pending = [d for d in decoded if not isinstance(d, Exception)]
+    texts = iter(await OCR_POOL.text_batch(pending))
+    results = []
+    for d in decoded:
+        if isinstance(d, Exception):
+            results.append({ 'error': 'invalid_image', 'details': str(d) })
+            continue
+        t = next(texts)
+        if isinstance(t, Exception):
+            results.append({ 'error': _OCR_UNAVAILABLE, 'details': str(t) })
+        else:
+            results.append({ 'text': t })
+    return { 'results': results, 'backend': OCR_POOL.backend() }
 
 
 
@@ -617,88 +1037,259 @@ class SRRequest(BaseModel):
 
 
 @app.post('/super-resolve')
-async def super_resolve_endpoint(req: SRRequest):
-    if not super_resolve:
+async def super_resolve_endpoint(req: SRRequest, request: Request):
+    if not super_resolve_image:
         raise HTTPException(status_code=501, detail='Super-resolution helper not available on this server')
     try:
-        img_b = _decode_data_url(req.imageBase64) if req.imageBase64.startswith('data:') else base64.b64decode(req.imageBase64)
+        img = ImageHandle.from_base64(req.imageBase64)
+        img.encoded_bytes()
     except Exception:
         raise HTTPException(status_code=400, detail='invalid imageBase64')
     try:
-        out_bytes = await super_resolve(img_b, mode=req.mode or 'auto')
-        return { 'image': 'data:image/png;base64,' + base64.b64encode(out_bytes).decode('utf-8') }
+        out = await super_resolve_image(img, mode=req.mode or 'auto')
     except Exception as e:
         raise HTTPException(status_code=502, detail='Super-resolve failed: ' + str(e))
+    return negotiate(request.headers.get('accept'), { 'image': out })
 
 
 @app.post('/score')
 async def score_endpoint(req: SRRequest):
     # returns OCR text and a naive score (length of extracted text)
-    if not ocr_text_from_bytes:
+    if not ocr_text_async:
         raise HTTPException(status_code=501, detail='OCR helper not available')
     try:
-        img_b = _decode_data_url(req.imageBase64) if req.imageBase64.startswith('data:') else base64.b64decode(req.imageBase64)
+        img = ImageHandle.from_base64(req.imageBase64)
+        img.encoded_bytes()
     except Exception:
         raise HTTPException(status_code=400, detail='invalid imageBase64')
     try:
-        text = ocr_text_from_bytes(img_b)
+        text = await ocr_text_async(img)
         score = len(text.strip())
         return { 'text': text, 'score': score }
     except Exception as e:
         raise HTTPException(status_code=502, detail='OCR failed: ' + str(e))
 
 
+# Request fields that determine the generated image; anything else (e.g.
+# cache_bypass) must not change the cache key.
+_CACHE_KEY_FIELDS = (
+    'prompt', 'style', 'count', 'width', 'height', 'steps', 'guidance_scale', 'cfg_scale', 'samples',
+    'postprocess', 'postprocess_sr', 'postprocess_upscale', 'postprocess_unsharp_radius',
+    'postprocess_unsharp_percent', 'postprocess_unsharp_threshold', 'postprocess_autocontrast',
+)
+
+
+def _generation_cache_key(namespace: str, req) -> str:
+    params = { f: getattr(req, f) for f in _CACHE_KEY_FIELDS if hasattr(req, f) }
+    params['prompt'] = (params.get('prompt') or '').strip()
+    # provider configuration changes the output just as much as the prompt
+    params['hf_model'] = os.environ.get('HUGGINGFACE_MODEL') or ''
+    params['stability_model'] = STABILITY_MODEL
+    params['local'] = bool(USE_LOCAL_DIFFUSION)
+    # and so do the env defaults behind unset postprocess / SR flags (the disk tier outlives restarts)
+    post = POSTPROCESS_CONFIG.merged(**_postprocess_params(req))
+    params['postprocess_config'] = { k: getattr(post, k) for k in post.__slots__ if k != 'tile_rows' }
+    params['sr'] = _sr_requested(req)
+    if params['sr']:
+        params['sr_mode'] = getattr(req, 'postprocess_sr_mode', None) or os.environ.get('POSTPROCESS_SR_MODE', 'hf')
+    return make_key(namespace, params)
+
+
+# Identical generation requests in flight at the same time share one provider call.
+_GENERATION_FLIGHTS = SingleFlight()
+
+
+async def _cached_generation(namespace: str, req, run):
+    """Serve `run(req)` through the result cache and single-flight coalescing.
+    Annotates the response with `cache`: 'hit' | 'miss' | 'bypass', and with
+    `coalesced: True` when it was served by another caller's in-flight run.
+    Only image results are stored.
+    """
+    use_cache = cache_enabled()
+    key = _generation_cache_key(namespace, req)
+    bypass = bool(getattr(req, 'cache_bypass', None))
+    if use_cache and not bypass:
+        hit = await RESULT_CACHE.aget(key)
+        if hit is not None:
+            # cached entries hold data URLs; wrap them without decoding
+            hit['images'] = [as_handle(u) for u in hit.get('images') or []]
+            hit['cache'] = 'hit'
+            CACHE_REQUESTS.inc(namespace, 'hit')
+            return hit
+
+    async def _run_and_store():
+        result = await run(req)
+        if use_cache and isinstance(result, dict) and result.get('images'):
+            # handles memoize their data URL, so the response reuses this encoding
+            await RESULT_CACHE.aput(key, encode_images(result))
+        return result
+
+    result, shared = await _GENERATION_FLIGHTS.do(key, _run_and_store)
+    if not isinstance(result, dict):
+        return result
+    # every waiter gets its own copy; callers annotate results in place
+    result = { k: (list(v) if isinstance(v, list) else v) for k, v in result.items() }
+    if shared:
+        result['coalesced'] = True
+    if use_cache:
+        if result.get('images'):
+            result['cache'] = 'bypass' if bypass else 'miss'
+        CACHE_REQUESTS.inc(namespace, 'coalesced' if shared else 'bypass' if bypass else 'miss')
+    return result
+
+
 @app.post('/generate/logo')
-async def generate_logo(req: GenerateLogoRequest):
+async def generate_logo(req: GenerateLogoRequest, request: Request):
+    return negotiate(request.headers.get('accept'), await _generate_logo(req))
+
+
+async def _generate_logo(req: GenerateLogoRequest):
+    """Internal entry point: like `generate_logo` but images stay ImageHandles."""
+    return await _cached_generation('logo', req, _generate_logo_uncached)
+
+
+async def _generate_logo_uncached(req: GenerateLogoRequest):
     # If local diffusers is requested and available, prefer it
     if USE_LOCAL_DIFFUSION:
         try:
-            # run CPU->GPU-suitable synchronous code in threadpool
+            # batched with other compatible pending requests on the pipeline thread
             steps = req.steps or 40
             high_noise_frac = float(os.environ.get('LOCAL_HIGH_NOISE_FRAC', 0.8))
-            img_bytes = await asyncio.to_thread(_generate_local_image_sync, req.prompt, steps, high_noise_frac, req.width, req.height, os.environ.get('LOCAL_DEVICE','cuda'))
-            # apply postprocess if requested in payload
+            img = await LOCAL_BATCHER.submit((req.width, req.height, steps, high_noise_frac), req.prompt)
+            # apply postprocess with request-provided params (fallback to env inside helper)
             try:
-                do_post_flag = req.postprocess if req.postprocess is not None else None
-                # call per-request postprocess with request-provided params (fallback to env inside helper)
-                if do_post_flag is None:
-                    # determine enabled state from env inside helper
-                    img_bytes = _postprocess_image_bytes(
-                        img_bytes,
-                        enabled=None,
-                        upscale=req.postprocess_upscale,
-                        unsharp_radius=req.postprocess_unsharp_radius,
-                        unsharp_percent=req.postprocess_unsharp_percent,
-                        unsharp_threshold=req.postprocess_unsharp_threshold,
-                        autocontrast=req.postprocess_autocontrast,
-                    )
-                else:
-                    img_bytes = _postprocess_image_bytes(
-                        img_bytes,
-                        enabled=bool(do_post_flag),
-                        upscale=req.postprocess_upscale,
-                        unsharp_radius=req.postprocess_unsharp_radius,
-                        unsharp_percent=req.postprocess_unsharp_percent,
-                        unsharp_threshold=req.postprocess_unsharp_threshold,
-                        autocontrast=req.postprocess_autocontrast,
-                    )
+                img = await asyncio.to_thread(_postprocess_from_request, img, req)
             except Exception as e:
                 print('Local postprocess failed:', e)
 
-            b64 = base64.b64encode(img_bytes).decode('utf-8')
-            data_url = f'data:image/png;base64,{b64}'
             print('Returning image from local diffusers')
-            return { 'images': [data_url], 'source': 'local' }
+            return { 'images': [img], 'source': 'local' }
         except Exception as e:
             # If local generation fails, surface informative error and fall back to HF inference path below
             raise HTTPException(status_code=500, detail='Local diffusion failed: ' + str(e))
 
     hf_token = os.environ.get('HUGGINGFACE_API_TOKEN') or os.environ.get('HF_TOKEN')
-    model = os.environ.get('HUGGINGFACE_MODEL') or 'runwayml/stable-diffusion-v1-5'
     if not hf_token:
         raise HTTPException(status_code=400, detail='HUGGINGFACE_API_TOKEN not configured in environment')
 
-    url = f'https://api-inference.huggingface.co/models/{model}'
+    # The router drops providers whose circuit is open and ranks the rest by
+    # observed latency; Stability has to be clearly faster to take the lead, and
+    # an idle HF route is retried periodically so it can win it back.
+    hf = hf_route(_hf_model())
+    candidates = [hf, STABILITY_V1] if STABILITY_API_KEY else [hf]
+    routes = ROUTER.order(candidates)
+    if not routes:
+        retry_after = ROUTER.retry_after(candidates)
+        raise HTTPException(status_code=503, detail=f'All providers unavailable (circuit open for {", ".join(candidates)})',
+                            headers={ 'Retry-After': str(int(math.ceil(retry_after))) })
+    stability_ok = STABILITY_V1 in routes
+    if routes[0] == STABILITY_V1:
+        try:
+            result = await _stability_fallback(req)
+            result.pop('fallback_from', None)
+            result['routed'] = True
+            return result
+        except Exception as e:
+            if hf not in routes:
+                raise HTTPException(status_code=502, detail=f'Stability generation failed: {str(e)[:500]}')
+            print(f'Routed Stability call failed, trying HF: {e}')
+            PROVIDER_FALLBACKS.inc('stability', 'hf', 'error')
+            return await _hf_generate(req, hf_token, stability_fallback=False)
+
+    # Hedge slow HF calls with a parallel Stability request once HF has been
+    # silent for the hedge delay; the first success wins.
+    hedge_delay = _hf_hedge_delay()
+    if stability_ok and hedge_delay is not None:
+        result, winner = await hedged(
+            lambda: _hf_generate(req, hf_token, stability_fallback=False),
+            lambda: _stability_fallback(req),
+            hedge_delay,
+        )
+        if winner == 'hedge':
+            print(f'Stability hedge won after HF exceeded {hedge_delay:.1f}s')
+            PROVIDER_FALLBACKS.inc('hf', 'stability', 'hedge')
+            result['hedged'] = True
+        return result
+    return await _hf_generate(req, hf_token, stability_fallback=stability_ok)
+
+
+# Observed HF generation latencies (successful calls), used for adaptive hedging.
+HF_LATENCY = LatencyTracker()
+
+
+def _hf_hedge_delay() -> Optional[float]:
+    """Seconds to wait on HF before hedging with Stability, or None to disable.
+    HF_FALLBACK_AFTER is the base delay (<= 0 disables hedging). With
+    HF_HEDGE_ADAPTIVE=1 and at least HF_HEDGE_MIN_SAMPLES observations, the delay
+    follows the HF_HEDGE_PERCENTILE (default 95) of observed HF latency, bounded
+    below by HF_HEDGE_MIN_DELAY and above by HF_FALLBACK_AFTER.
+    """
+    if HF_FALLBACK_AFTER <= 0:
+        return None
+    if str(os.environ.get('HF_HEDGE_ADAPTIVE', '0')).lower() not in ('1', 'true', 'yes'):
+        return HF_FALLBACK_AFTER
+    try:
+        min_samples = int(os.environ.get('HF_HEDGE_MIN_SAMPLES', 20))
+        pct = float(os.environ.get('HF_HEDGE_PERCENTILE', 95))
+        min_delay = float(os.environ.get('HF_HEDGE_MIN_DELAY', 2.0))
+    except Exception:
+        min_samples, pct, min_delay = 20, 95.0, 2.0
+    if HF_LATENCY.count() < min_samples:
+        return HF_FALLBACK_AFTER
+    observed = HF_LATENCY.percentile(pct)
+    return min(HF_FALLBACK_AFTER, max(min_delay, observed))
+
+
+async def _stability_fallback(req: GenerateLogoRequest) -> dict:
+    """Generate via the Stability v1 text-to-image endpoint as a stand-in for HF."""
+    s_url = provider_url('stability', f'v1/generation/{STABILITY_MODEL}/text-to-image')
+    s_headers = {
+        'Authorization': f'Bearer {STABILITY_API_KEY}',
+        'Content-Type': 'application/json'
+    }
+    s_payload = {
+        'text_prompts': [{ 'text': req.prompt }],
+        'width': req.width or 512,
+        'height': req.height or 512,
+        'steps': req.steps or 20,
+        'samples': 1,
+        'cfg_scale': req.guidance_scale or 7.5
+    }
+    # give Stability a generous timeout
+    sclient = get_client('stability')
+    sr = await sclient.post(s_url, headers=s_headers, json=s_payload, timeout=httpx.Timeout(600.0, connect=10.0))
+    if sr.status_code not in (200, 201):
+        raise Exception(f'Stability API error: {sr.status_code} {sr.text[:500]}')
+    data = sr.json()
+    # extract base64 artifact (defensive)
+    b64 = None
+    if isinstance(data, dict):
+        arts = data.get('artifacts') or data.get('artifacts', [])
+        if arts and isinstance(arts, list):
+            art0 = arts[0]
+            b64 = art0.get('base64') or art0.get('b64') or art0.get('b64_data')
+    if not b64:
+        # try common alternative key
+        try:
+            # some responses encode base64 in nested fields
+            b64 = data['artifacts'][0]['base64']
+        except Exception:
+            raise Exception('Unexpected Stability response payload: ' + str(data)[:500])
+    return { 'images': [ImageHandle(mime='image/png', b64=b64)], 'source': 'stability', 'fallback_from': 'huggingface' }
+
+
+def _hf_model() -> str:
+    return os.environ.get('HUGGINGFACE_MODEL') or 'runwayml/stable-diffusion-v1-5'
+
+
+async def _hf_generate(req: GenerateLogoRequest, hf_token: str, stability_fallback: bool = False):
+    """HF inference with retries. When `stability_fallback` is set, a read
+    timeout triggers a single Stability attempt (not one per retry). Retries
+    stop early once the model's circuit opens (see provider_router.py).
+    """
+    model = _hf_model()
+    url = hf_model_url(model)
+    route = hf_route(model)
     headers = {'Authorization': f'Bearer {hf_token}'}
 
     # Ensure HF-friendly dimensions: round/upscale to HF_DIM_STEP (default 64)
@@ -754,170 +1345,126 @@ async def generate_logo(req: GenerateLogoRequest):
     # Use keyword args so we can pass None to disable read/total timeouts.
     timeout = httpx.Timeout(timeout=hf_total, connect=10.0, read=hf_read, write=30.0)
     last_exc = None
-    async with httpx.AsyncClient(timeout=timeout) as client:
-        for attempt in range(1, max_retries + 1):
-            try:
-                print(f"HF attempt {attempt}/{max_retries} for model {model} (prompt len={len(req.prompt or '')})")
-                # Respect an initial fallback threshold: if HF takes longer than
-                # HF_FALLBACK_AFTER seconds (read timeout), treat as a timeout and
-                # attempt the Stability.ai fallback if configured.
-                # We'll perform the POST with the same client but rely on the
-                # client's configured read timeout.
-                r = await client.post(url, headers=headers, json=payload)
-
-                # surface transient HF statuses as retryable (include 504)
-                if r.status_code in (429, 502, 503, 504, 524):
-                    # capture response text for diagnostics (may be truncated)
-                    try:
-                        resp_text = r.text[:1000]
-                    except Exception:
-                        resp_text = '<unavailable>'
-                    last_exc = Exception(f'Transient HF status {r.status_code}: {resp_text}')
-                    if attempt < max_retries:
-                        wait = backoff_base ** attempt
-                        print(f"Transient HF status {r.status_code}, retrying in {wait}s; resp_excerpt={resp_text}")
-                        await asyncio.sleep(wait)
-                        continue
-                    raise HTTPException(status_code=502, detail=f'HuggingFace transient error: {r.status_code}')
-
-                if r.status_code != 200:
-                    try:
-                        data = r.json()
-                        raise HTTPException(status_code=502, detail=str(data))
-                    except Exception:
-                        raise HTTPException(status_code=502, detail=f'HF inference error: {r.status_code}')
-
-                content_type = r.headers.get('content-type', '')
-                if content_type.startswith('application/json'):
-                    data = r.json()
-                    if isinstance(data, dict) and 'error' in data:
-                        raise HTTPException(status_code=502, detail=data['error'])
-                    # Best-effort: log and mark source for JSON responses
-                    print('Returning JSON response from Hugging Face (application/json)')
-                    if isinstance(data, dict):
-                        data.setdefault('source', 'huggingface')
-                    return data
-
-                img_bytes = r.content
-                # inspect incoming request-level postprocess flags (fall back to env)
+    stability_tried = False
+    client = get_client('hf')
+    for attempt in range(1, max_retries + 1):
+        try:
+            print(f"HF attempt {attempt}/{max_retries} for model {model} (prompt len={len(req.prompt or '')})")
+            # Slow HF calls are hedged by the caller (see HF_FALLBACK_AFTER);
+            # here we rely on the per-call read timeout.
+            # time this attempt only: backoff sleeps and failed attempts would skew the hedge percentile
+            started = time.perf_counter()
+            r = await client.post(url, headers=headers, json=payload, timeout=timeout, extensions={ 'route': route })
+
+            # surface transient HF statuses as retryable (include 504)
+            if r.status_code in (429, 502, 503, 504, 524):
+                # capture response text for diagnostics (may be truncated)
                 try:
-                    # per-request postprocess
-                    do_post_flag = getattr(req, 'postprocess', None)
-                    if do_post_flag is None:
-                        img_bytes = _postprocess_image_bytes(
-                            img_bytes,
-                            enabled=None,
-                            upscale=getattr(req, 'postprocess_upscale', None),
-                            unsharp_radius=getattr(req, 'postprocess_unsharp_radius', None),
-                            unsharp_percent=getattr(req, 'postprocess_unsharp_percent', None),
-                            unsharp_threshold=getattr(req, 'postprocess_unsharp_threshold', None),
-                            autocontrast=getattr(req, 'postprocess_autocontrast', None),
-                        )
-                    else:
-                        img_bytes = _postprocess_image_bytes(
-                            img_bytes,
-                            enabled=bool(do_post_flag),
-                            upscale=getattr(req, 'postprocess_upscale', None),
-                            unsharp_radius=getattr(req, 'postprocess_unsharp_radius', None),
-                            unsharp_percent=getattr(req, 'postprocess_unsharp_percent', None),
-                            unsharp_threshold=getattr(req, 'postprocess_unsharp_threshold', None),
-                            autocontrast=getattr(req, 'postprocess_autocontrast', None),
-                        )
-                except Exception as e:
-                    print('Postprocess failed:', e)
+                    resp_text = r.text[:1000]
+                except Exception:
+                    resp_text = '<unavailable>'
+                last_exc = Exception(f'Transient HF status {r.status_code}: {resp_text}')
+                if attempt < max_retries and ROUTER.allows(route):
+                    wait = backoff_base ** attempt
+                    print(f"Transient HF status {r.status_code}, retrying in {wait}s; resp_excerpt={resp_text}")
+                    PROVIDER_RETRIES.inc('hf', str(r.status_code))
+                    await asyncio.sleep(wait)
+                    continue
+                if stability_fallback and not stability_tried and not ROUTER.allows(route):
+                    # HF just tripped its circuit: this request moves over like the ones after it
+                    stability_tried = True
+                    try:
+                        PROVIDER_FALLBACKS.inc('hf', 'stability', 'circuit_open')
+                        return await _stability_fallback(req)
+                    except Exception as se:
+                        print(f"Stability fallback failed: {se}")
+                raise HTTPException(status_code=502, detail=f'HuggingFace transient error: {r.status_code}')
 
-                # optional super-resolution (request-level then env)
+            if r.status_code != 200:
                 try:
-                    do_sr = getattr(req, 'postprocess_sr', None)
-                    if do_sr is None:
-                        do_sr_env = os.environ.get('POSTPROCESS_SR', '0')
-                        do_sr = str(do_sr_env).lower() in ('1', 'true', 'yes')
-                    if do_sr and super_resolve:
-                        try:
-                            sr_mode = getattr(req, 'postprocess_sr_mode', None) or os.environ.get('POSTPROCESS_SR_MODE','hf')
-                            img_bytes = await super_resolve(img_bytes, mode=sr_mode)
-                        except Exception as e:
-                            print('Super-resolve failed:', e)
+                    data = r.json()
+                    raise HTTPException(status_code=502, detail=str(data))
                 except Exception:
-                    pass
-                b64 = base64.b64encode(img_bytes).decode('utf-8')
-                data_url = f'data:image/png;base64,{b64}'
-                print('Returning image from Hugging Face')
-                return { 'images': [data_url], 'source': 'huggingface' }
+                    raise HTTPException(status_code=502, detail=f'HF inference error: {r.status_code}')
 
+            HF_LATENCY.record(time.perf_counter() - started)
+            content_type = r.headers.get('content-type', '')
+            if content_type.startswith('application/json'):
+                data = r.json()
+                if isinstance(data, dict) and 'error' in data:
+                    raise HTTPException(status_code=502, detail=data['error'])
+                # Best-effort: log and mark source for JSON responses
+                print('Returning JSON response from Hugging Face (application/json)')
+                if isinstance(data, dict):
+                    data.setdefault('source', 'huggingface')
+                return data
+
+            # decode once; every later stage shares this handle
+            img = ImageHandle.from_bytes(r.content)
+            # inspect incoming request-level postprocess flags (fall back to env)
+            try:
+                img = await asyncio.to_thread(_postprocess_from_request, img, req)
+            except Exception as e:
+                print('Postprocess failed:', e)
 
-    # end of HF-based generate_logo
-            except (httpx.ReadTimeout, httpcore.ReadTimeout) as e:
-                last_exc = e
-                print(f"HF read timeout on attempt {attempt}: {e}")
-                # If a Stability.ai API key is available, try fallback generation.
-                if STABILITY_API_KEY:
+            # optional super-resolution (request-level then env)
+            try:
+                do_sr = getattr(req, 'postprocess_sr', None)
+                if do_sr is None:
+                    do_sr_env = os.environ.get('POSTPROCESS_SR', '0')
+                    do_sr = str(do_sr_env).lower() in ('1', 'true', 'yes')
+                if do_sr and super_resolve_image:
                     try:
-                        print("Attempting Stability.ai fallback...")
-                        # call stability fallback with reasonable internal timeout
-                        async def _stability_call():
-                            s_url = f'https://api.stability.ai/v1/generation/{STABILITY_MODEL}/text-to-image'
-                            s_headers = {
-                                'Authorization': f'Bearer {STABILITY_API_KEY}',
-                                'Content-Type': 'application/json'
-                            }
-                            s_payload = {
-                                'text_prompts': [{ 'text': req.prompt }],
-                                'width': req.width or 512,
-                                'height': req.height or 512,
-                                'steps': req.steps or 20,
-                                'samples': 1,
-                                'cfg_scale': req.guidance_scale or 7.5
-                            }
-                            # give Stability a generous timeout
-                            async with httpx.AsyncClient(timeout=httpx.Timeout(600.0, connect=10.0)) as sclient:
-                                sr = await sclient.post(s_url, headers=s_headers, json=s_payload)
-                                if sr.status_code not in (200, 201):
-                                    raise Exception(f'Stability API error: {sr.status_code} {sr.text[:500]}')
-                                data = sr.json()
-                                # extract base64 artifact (defensive)
-                                b64 = None
-                                if isinstance(data, dict):
-                                    arts = data.get('artifacts') or data.get('artifacts', [])
-                                    if arts and isinstance(arts, list):
-                                        art0 = arts[0]
-                                        b64 = art0.get('base64') or art0.get('b64') or art0.get('b64_data')
-                                if not b64:
-                                    # try common alternative key
-                                    try:
-                                        # some responses encode base64 in nested fields
-                                        b64 = data['artifacts'][0]['base64']
-                                    except Exception:
-                                        raise Exception('Unexpected Stability response payload: ' + str(data)[:500])
-                                data_url = f'data:image/png;base64,{b64}'
-                                return { 'images': [data_url] }
-
-                        stability_result = await _stability_call()
-                        return stability_result
-                    except Exception as se:
-                        print(f"Stability fallback failed: {se}")
-                        last_exc = se
-                        # fall through to retry logic / final failure
-                if attempt < max_retries:
-                    wait = backoff_base ** attempt
-                    await asyncio.sleep(wait)
-                    continue
-                raise HTTPException(status_code=504, detail=f'HuggingFace request timed out after {max_retries} attempts; last_err={str(last_exc)[:300]}')
-            except httpx.HTTPError as e:
-                last_exc = e
-                print(f"HF HTTPError: {e}")
-                raise HTTPException(status_code=502, detail=f'Error contacting HuggingFace inference API: {str(e)}')
+                        sr_mode = getattr(req, 'postprocess_sr_mode', None) or os.environ.get('POSTPROCESS_SR_MODE','hf')
+                        img = await super_resolve_image(img, mode=sr_mode)
+                    except Exception as e:
+                        print('Super-resolve failed:', e)
+            except Exception:
+                pass
+            print('Returning image from Hugging Face')
+            return { 'images': [img], 'source': 'huggingface' }
+
 
-        # exhausted retries
-        raise HTTPException(status_code=502, detail=f'HuggingFace inference failed: {str(last_exc)}')
+    # end of HF-based generate_logo
+        except (httpx.ReadTimeout, httpcore.ReadTimeout) as e:
+            last_exc = e
+            print(f"HF read timeout on attempt {attempt}: {e}")
+            # Without hedging, fall back to Stability once on the first read timeout.
+            if stability_fallback and not stability_tried:
+                stability_tried = True
+                try:
+                    print("Attempting Stability.ai fallback...")
+                    PROVIDER_FALLBACKS.inc('hf', 'stability', 'timeout')
+                    return await _stability_fallback(req)
+                except Exception as se:
+                    print(f"Stability fallback failed: {se}")
+                    last_exc = se
+                    # fall through to retry logic / final failure
+            if attempt < max_retries and ROUTER.allows(route):
+                wait = backoff_base ** attempt
+                PROVIDER_RETRIES.inc('hf', 'timeout')
+                await asyncio.sleep(wait)
+                continue
+            raise HTTPException(status_code=504, detail=f'HuggingFace request timed out after {attempt} attempts; last_err={str(last_exc)[:300]}')
+        except httpx.HTTPError as e:
+            last_exc = e
+            print(f"HF HTTPError: {e}")
+            raise HTTPException(status_code=502, detail=f'Error contacting HuggingFace inference API: {str(e)}')
+
+    # exhausted retries
+    raise HTTPException(status_code=502, detail=f'HuggingFace inference failed: {str(last_exc)}')
 
 
 @app.post('/generate/card')
-async def generate_card(req: GenerateLogoRequest):
+async def generate_card(req: GenerateLogoRequest, request: Request):
     """Compatibility endpoint: generate a full business-card raster image using the
     same HF inference code as `/generate/logo`. We keep a separate route so the
     backend can clearly request "card" images (not logos).
     """
+    return negotiate(request.headers.get('accept'), await _generate_card(req))
+
+
+async def _generate_card(req: GenerateLogoRequest):
     # Enforce card-specific defaults server-side in case the backend didn't
     # attach them. This ensures card images are generated at sufficient
     # resolution and with legibility-focused prompt hints and postprocess
@@ -939,6 +1486,7 @@ async def generate_card(req: GenerateLogoRequest):
             postprocess_unsharp_percent=getattr(request, 'postprocess_unsharp_percent', None),
             postprocess_unsharp_threshold=getattr(request, 'postprocess_unsharp_threshold', None),
             postprocess_autocontrast=getattr(request, 'postprocess_autocontrast', None),
+            cache_bypass=getattr(request, 'cache_bypass', None),
         )
 
         # Enforce minimums
@@ -977,21 +1525,14 @@ async def generate_card(req: GenerateLogoRequest):
             n.postprocess = True
         if n.postprocess_sr is None:
             n.postprocess_sr = True
-        if n.postprocess_upscale is None:
-            n.postprocess_upscale = float(os.environ.get('POSTPROCESS_UPSCALE', 1.5))
-        if n.postprocess_unsharp_radius is None:
-            n.postprocess_unsharp_radius = float(os.environ.get('POSTPROCESS_UNSHARP_RADIUS', 1.0))
-        if n.postprocess_unsharp_percent is None:
-            n.postprocess_unsharp_percent = float(os.environ.get('POSTPROCESS_UNSHARP_PERCENT', 150.0))
-        if n.postprocess_unsharp_threshold is None:
-            n.postprocess_unsharp_threshold = int(os.environ.get('POSTPROCESS_UNSHARP_THRESHOLD', 3))
+        # upscale / unsharp left unset resolve through POSTPROCESS_CONFIG
         if n.postprocess_autocontrast is None:
             n.postprocess_autocontrast = True
 
         return n
 
     enforced = ensure_card_defaults(req)
-    result = await generate_logo(enforced)
+    result = await _generate_logo(enforced)
     # Normalize the source name for clarity
     if isinstance(result, dict):
         result.setdefault('source', 'hf_card')
@@ -1016,10 +1557,20 @@ class StabilityRequest(BaseModel):
     steps: Optional[int] = 20
     cfg_scale: Optional[float] = 7.5
     samples: Optional[int] = 1
+    cache_bypass: Optional[bool] = None
 
 
 @app.post('/generate/stability')
-async def generate_stability(req: StabilityRequest):
+async def generate_stability(req: StabilityRequest, request: Request):
+    return negotiate(request.headers.get('accept'), await _generate_stability(req))
+
+
+async def _generate_stability(req: StabilityRequest):
+    """Internal entry point: like `generate_stability` but images stay ImageHandles."""
+    return await _cached_generation('stability', req, _generate_stability_uncached)
+
+
+async def _generate_stability_uncached(req: StabilityRequest):
     if not generate_stability_image:
         raise HTTPException(status_code=501, detail='Stability client not available on this server')
     try:
@@ -1049,7 +1600,7 @@ async def generate_stability(req: StabilityRequest):
             cfg_scale=req.cfg_scale or 7.5,
             samples=req.samples or 1,
         )
-        return { 'images': images, 'source': 'stability', 'width': out_w, 'height': out_h }
+        return { 'images': [ImageHandle.from_base64(u) for u in images], 'source': 'stability', 'width': out_w, 'height': out_h }
     except Exception as e:
         # If Stability fails due to payment/engine entitlement errors, fall
         # back to Hugging Face inference (if configured). Be defensive and
@@ -1062,19 +1613,24 @@ async def generate_stability(req: StabilityRequest):
             or ('engine' in low and ('not found' in low or 'notfound' in low))
         )
 
+        # both Stability APIs tripped their circuits: HF is the only way out
+        circuit_open = isinstance(e, CircuitOpen)
+
         hf_token = os.environ.get('HUGGINGFACE_API_TOKEN') or os.environ.get('HF_TOKEN')
-        if is_engine_or_payment and hf_token:
+        if (is_engine_or_payment or circuit_open) and hf_token:
             try:
-                print(f"Stability failed with engine/payment error, falling back to HF: {err_text[:200]}")
+                print(f"Stability failed with engine/payment error or open circuit, falling back to HF: {err_text[:200]}")
+                PROVIDER_FALLBACKS.inc('stability', 'hf', 'circuit_open' if circuit_open else 'payment_or_engine')
                 # Construct a compatible GenerateLogoRequest and call the HF path
                 hf_req = GenerateLogoRequest(
                     prompt=req.prompt,
                     width=req.width or 512,
                     height=req.height or 512,
                     steps=req.steps or 20,
-                    guidance_scale=req.cfg_scale or 7.5
+                    guidance_scale=req.cfg_scale or 7.5,
+                    cache_bypass=req.cache_bypass,
                 )
-                hf_result = await generate_logo(hf_req)
+                hf_result = await _generate_logo(hf_req)
                 # annotate fallback and return
                 if isinstance(hf_result, dict):
                     hf_result.setdefault('fallback_from', 'stability')
@@ -1086,6 +1642,8 @@ async def generate_stability(req: StabilityRequest):
             except Exception as he:
                 raise HTTPException(status_code=502, detail=f'Stability failed: {err_text}; HF fallback exception: {str(he)}')
 
+        if circuit_open:
+            raise HTTPException(status_code=503, detail=f'Stability unavailable: {err_text}', headers={ 'Retry-After': str(int(math.ceil(e.retry_after))) })
         # Not an engine/payment issue or no HF token available — surface original error
         raise HTTPException(status_code=502, detail=f'Stability generation failed: {err_text}')
 
@@ -1096,73 +1654,150 @@ class LayoutRequest(BaseModel):
     name: Optional[str]
     title: Optional[str]
     company: Optional[str]
+    phone: Optional[str] = None
+    email: Optional[str] = None
+    website: Optional[str] = None
+    address: Optional[str] = None
+    contact: Optional[List[str]] = None  # extra detail lines
     logo_preference: Optional[str] = 'left'  # left|center|right
+    layout_id: Optional[int] = None  # id from 100_business_card_text_layout_prompts.json
+    category: Optional[str] = None  # prompt category, e.g. 'Split 50/50'
+
+
+class LayoutBatchRequest(BaseModel):
+    cards: List[LayoutRequest]
 
 
 @app.post('/layout/suggest')
 async def layout_suggest(req: LayoutRequest):
-    # Simple rule-based layout suggestions: return bounding boxes as percentages
-    w = int(req.width or 1050)
-    h = int(req.height or 600)
-    # Normalize to 0..1 box coords
-    boxes = {}
-    # logo box
-    if req.logo_preference == 'left':
-        boxes['logo'] = { 'x': 0.05, 'y': 0.2, 'w': 0.25, 'h': 0.6 }
-        text_x = 0.33
-    elif req.logo_preference == 'right':
-        boxes['logo'] = { 'x': 0.70, 'y': 0.2, 'w': 0.25, 'h': 0.6 }
-        text_x = 0.05
-    else:
-        boxes['logo'] = { 'x': 0.35, 'y': 0.05, 'w': 0.30, 'h': 0.30 }
-        text_x = 0.05
+    # Boxes as fractions of the card with font sizes fitted to real text (see layout_suggestion.py)
+    try:
+        return suggest_layout(req.dict())
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@app.post('/layout/suggest/batch')
+async def layout_suggest_batch(req: LayoutBatchRequest):
+    # one pass over all cards; font metrics are shared, bad cards get an 'error' entry
+    results = await asyncio.to_thread(suggest_layouts, [c.dict() for c in req.cards])
+    return { 'results': results }
+
 
-    # name (prominent)
-    boxes['name'] = { 'x': text_x, 'y': 0.08, 'w': 0.60, 'h': 0.18 }
-    # title/company
-    boxes['title'] = { 'x': text_x, 'y': 0.28, 'w': 0.60, 'h': 0.12 }
-    boxes['company'] = { 'x': text_x, 'y': 0.42, 'w': 0.60, 'h': 0.10 }
-    # contact block bottom-left
-    boxes['contact'] = { 'x': 0.05, 'y': 0.65, 'w': 0.60, 'h': 0.25 }
+@app.get('/layout/prompts')
+async def layout_prompts():
+    return { 'layouts': [{ 'id': e['id'], 'name': e['name'], 'category': e['category'] } for e in prompt_layouts().values()] }
 
-    return { 'width': w, 'height': h, 'boxes': boxes }
 
+class TemplateRenderRequest(BaseModel):
+    template_name: Optional[str] = None  # file in TEMPLATE_DIR; default: first template
+    fields: Optional[Dict[str, Any]] = None  # name, title, company, phone, email, website, address, layout_id, ...
+    field_sets: Optional[List[Dict[str, Any]]] = None  # batch: one card per entry, same template
+    text_color: Optional[str] = None  # default: dark or light per box, from the template underneath
 
-class VectorizeRequest(BaseModel):
+
+@app.get('/templates')
+async def templates_list():
+    return { 'templates': TEMPLATES.list_templates(), 'cached': TEMPLATES.cached() }
+
+
+@app.post('/templates/render')
+async def templates_render(req: TemplateRenderRequest, request: Request):
+    # one template decode (usually a cache hit) for every field set in the call
+    field_sets = req.field_sets if req.field_sets is not None else [req.fields or {}]
+    if not field_sets:
+        raise HTTPException(status_code=400, detail='field_sets is empty')
+    max_batch = int(os.environ.get('TEMPLATE_MAX_BATCH', 64))
+    if len(field_sets) > max_batch:
+        raise HTTPException(status_code=413, detail=f'at most {max_batch} field sets per call')
+    name = req.template_name
+    if not name:
+        names = TEMPLATES.list_templates()
+        if not names:
+            raise HTTPException(status_code=404, detail='no templates available')
+        name = names[0]
+    try:
+        pngs = await asyncio.to_thread(TEMPLATES.render_batch, name, field_sets, req.text_color)
+    except TemplateNotFound:
+        raise HTTPException(status_code=404, detail=f'unknown template: {name}')
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    images = [ImageHandle.from_bytes(png, 'image/png') for png in pngs]
+    return negotiate(request.headers.get('accept'), { 'images': images, 'template': name })
+
+
+@app.on_event('startup')
+async def _startup_templates():
+    # decode templates and load fonts before the first render
+    try:
+        loaded = await asyncio.to_thread(TEMPLATES.preload)
+        if loaded:
+            print(f'Template renderer: {loaded} templates preloaded')
+    except Exception as e:
+        print('Template preload failed:', e)
+
+
+class VectorizeQuality(BaseModel):
+    # per-request overrides of the VECTORIZE_* defaults (see raster_to_vector.py)
+    colors: Optional[int] = None
+    threshold: Optional[int] = None
+    curve_tolerance: Optional[float] = None
+    simplify: Optional[float] = None
+    corner_angle: Optional[float] = None
+    min_area: Optional[float] = None
+    max_side: Optional[int] = None
+    precision: Optional[int] = None
+    keep_background: Optional[bool] = None
+
+
+class VectorizeRequest(VectorizeQuality):
     imageBase64: str
 
 
+class VectorizeBatchRequest(VectorizeQuality):
+    images: List[str]
+
+
+def _vectorize_options(req: VectorizeQuality):
+    return VECTORIZE_OPTIONS.merged(**{ k: getattr(req, k, None) for k in VectorizeQuality.__annotations__ })
+
+
+def _decode_image_b64(data: str) -> bytes:
+    return _decode_data_url(data) if data.startswith('data:') else base64.b64decode(data)
+
+
+_VECTORIZE_NOTE = 'Install opencv-python and numpy for vectorization; or export PNG and run external tracing.'
+
+
 @app.post('/vectorize')
 async def vectorize(req: VectorizeRequest):
-    # Try to call potrace via python bindings or cv2 + skimage fallback.
+    """Trace a raster logo into a layered SVG (palette quantization + Bezier fitting)."""
     try:
-        data = _decode_data_url(req.imageBase64) if req.imageBase64.startswith('data:') else base64.b64decode(req.imageBase64)
+        data = _decode_image_b64(req.imageBase64)
     except Exception:
         raise HTTPException(status_code=400, detail='invalid imageBase64')
 
-    # Try potrace (optional)
     try:
-        import cv2
-        import numpy as np
-        # simple trace using OpenCV thresholds and contours -> convert to SVG path
-        nparr = np.frombuffer(data, np.uint8)
-        img = cv2.imdecode(nparr, cv2.IMREAD_GRAYSCALE)
-        if img is None:
-            raise Exception('cv2 failed to decode image')
-        _, th = cv2.threshold(img, 250, 255, cv2.THRESH_BINARY_INV)
-        contours, _ = cv2.findContours(th, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
-        # build a naive SVG
-        h, w = img.shape[:2]
-        paths = []
-        for cnt in contours:
-            pts = cnt.reshape(-1, 2)
-            d = 'M ' + ' L '.join([f"{int(x)},{int(y)}" for x, y in pts]) + ' Z'
-            paths.append(d)
-        svg = f"<svg xmlns='http://www.w3.org/2000/svg' width='{w}' height='{h}'>" + ''.join([f"<path d='{p}' fill='black'/>" for p in paths]) + '</svg>'
-        return { 'svg': svg }
+        return await vectorize_image(data, _vectorize_options(req))
     except Exception as e:
         # Fallback: return informative message with recommended tools
-        return { 'error': 'vectorize_unavailable', 'details': str(e), 'note': 'Install opencv-python or potrace for vectorization; or export PNG and run external tracing.' }
+        return { 'error': 'vectorize_unavailable', 'details': str(e), 'note': _VECTORIZE_NOTE }
+
+
+@app.post('/vectorize/batch')
+async def vectorize_batch_endpoint(req: VectorizeBatchRequest):
+    """Trace several images with the same quality settings; results keep input order."""
+    try:
+        items = [_decode_image_b64(s) for s in req.images]
+    except Exception:
+        raise HTTPException(status_code=400, detail='invalid image in images')
+    results = await vectorize_images(items, _vectorize_options(req))
+    return { 'results': results }
+
+
+@app.on_event('shutdown')
+async def _shutdown_vectorize():
+    await asyncio.to_thread(shutdown_vectorize)
 
 
 class IconSearchRequest(BaseModel):
@@ -1170,27 +1805,20 @@ class IconSearchRequest(BaseModel):
     top_k: Optional[int] = 6
 
 
-def _load_frontend_icons():
-    # Best-effort parser for frontend/src/data/icons.js to extract id and label
-    try:
-        path = os.path.join(os.path.dirname(__file__), '..', 'frontend', 'src', 'data', 'icons.js')
-        path = os.path.abspath(path)
-        if not os.path.exists(path):
-            return []
-        out = []
-        with open(path, 'r', encoding='utf-8') as fh:
-            txt = fh.read()
-        # crude parsing: find "id: '...'" and "label: '...'" occurrences within ICONS array
-        import re
-        entries = re.findall(r"\{([^}]+)\}", txt, flags=re.DOTALL)
-        for e in entries:
-            m_id = re.search(r"id\s*:\s*['\"]([\w-]+)['\"]", e)
-            m_label = re.search(r"label\s*:\s*['\"]([^'\"]+)['\"]", e)
-            if m_id and m_label:
-                out.append({ 'id': m_id.group(1), 'label': m_label.group(1) })
-        return out
-    except Exception:
-        return []
+async def _hf_embed(texts, hf_token: str, model: str):
+    """Feature-extraction vectors for `texts` from the HF inference API."""
+    url = hf_model_url(model)
+    headers = {'Authorization': f'Bearer {hf_token}'}
+    client = get_client('hf')
+    r = await client.post(url, headers=headers, json={ 'inputs': list(texts) }, timeout=httpx.Timeout(30.0, connect=10.0),
+                          extensions={ 'route': hf_task_route('embed', model) })
+    if r.status_code != 200:
+        raise RuntimeError(f'HF embeddings returned {r.status_code}: {r.text[:200]}')
+    data = r.json()
+    # expect list of vectors
+    if not isinstance(data, list) or len(data) != len(texts):
+        raise RuntimeError('unexpected HF embeddings response')
+    return data
 
 
 @app.post('/icons/search')
@@ -1199,63 +1827,38 @@ async def icons_search(req: IconSearchRequest):
     if not q:
         return { 'results': [] }
 
-    icons = _load_frontend_icons()
+    icons = ICON_INDEX.icons()
     if not icons:
         return { 'results': [], 'warning': 'no frontend icons found' }
+    top_k = len(icons) if req.top_k is None else req.top_k
 
-    # If HF embeddings available, use them to rank; otherwise fallback to substring/fuzzy score
+    # If HF embeddings available, use them to rank; otherwise fall back to the offline lexical index
     hf_token = os.environ.get('HUGGINGFACE_API_TOKEN') or os.environ.get('HF_TOKEN')
-    try:
-        if hf_token:
-            # call embeddings endpoint for query and icon labels
+    if hf_token:
+        try:
+            # label embeddings are cached on disk; only the query is sent for embedding
             model = os.environ.get('HF_EMBEDDING_MODEL') or 'sentence-transformers/all-MiniLM-L6-v2'
-            url = f'https://api-inference.huggingface.co/models/{model}'
-            headers = {'Authorization': f'Bearer {hf_token}'}
-            # prepare inputs: list of texts (first is query)
-            texts = [q] + [i['label'] for i in icons]
-            payload = { 'inputs': texts }
-            async with httpx.AsyncClient(timeout=httpx.Timeout(30.0, connect=10.0)) as client:
-                r = await client.post(url, headers=headers, json=payload)
-                if r.status_code == 200:
-                    data = r.json()
-                    # expect list of vectors
-                    if isinstance(data, list) and len(data) >= 1:
-                        qvec = data[0]
-                        scores = []
-                        from math import sqrt
-                        def dot(a,b):
-                            return sum(x*y for x,y in zip(a,b))
-                        for i, lab in enumerate(icons):
-                            vec = data[i+1]
-                            # cosine similarity
-                            denom = (sqrt(dot(qvec,qvec))*sqrt(dot(vec,vec))) or 1.0
-                            sim = dot(qvec, vec) / denom
-                            scores.append((sim, lab))
-                        scores.sort(key=lambda x: x[0], reverse=True)
-                        results = [ { 'id': l['id'], 'label': l['label'], 'score': float(s) } for s,l in scores[:req.top_k] ]
-                        return { 'results': results }
-    except Exception as e:
-        print('Embeddings search failed:', e)
-
-    # fallback fuzzy substring scoring
-    def fuzzy_score(a, b):
-        a = a.lower(); b = b.lower()
-        if a == b: return 100
-        if a in b: return 80
-        if b in a: return 60
-        # partial match
-        import difflib
-        return int(difflib.SequenceMatcher(None, a, b).ratio() * 100)
+            results = await ICON_INDEX.semantic_search(q, top_k, model, lambda texts: _hf_embed(texts, hf_token, model))
+            return { 'results': results }
+        except Exception as e:
+            print('Embeddings search failed:', e)
 
-    scored = []
-    for ic in icons:
-        s = fuzzy_score(q, ic['label'])
-        scored.append((s, ic))
-    scored.sort(key=lambda x: x[0], reverse=True)
-    results = [ { 'id': ic['id'], 'label': ic['label'], 'score': int(s) } for s, ic in scored[:req.top_k] ]
+    # offline lexical ranking (BM25 over words and prefixes, typos corrected against the vocabulary)
+    results = ICON_INDEX.lexical_search(q, top_k)
+    if results is None:
+        return { 'results': [], 'warning': 'icon index unavailable (numpy required)' }
     return { 'results': results }
 
 
+@app.on_event('startup')
+async def _startup_icon_index():
+    # parse the catalogue and build the lexical index before the first query
+    try:
+        await asyncio.to_thread(ICON_INDEX.icons)
+    except Exception as e:
+        print('Icon index warm-up failed:', e)
+
+
 class RefineRequest(BaseModel):
     imageBase64: str
     style_prompt: str
@@ -1263,10 +1866,11 @@ class RefineRequest(BaseModel):
 
 
 @app.post('/refine-style')
-async def refine_style(req: RefineRequest):
-    # decode image
+async def refine_style(req: RefineRequest, request: Request):
+    # wrap the input once; HF upload and local refine share the decoded copy
     try:
-        img_b = _decode_data_url(req.imageBase64) if req.imageBase64.startswith('data:') else base64.b64decode(req.imageBase64)
+        img = ImageHandle.from_base64(req.imageBase64)
+        img.encoded_bytes()
     except Exception:
         raise HTTPException(status_code=400, detail='invalid imageBase64')
 
@@ -1275,16 +1879,17 @@ async def refine_style(req: RefineRequest):
     hf_model = os.environ.get('HUGGINGFACE_REFINE_MODEL') or os.environ.get('HUGGINGFACE_MODEL')
     if hf_token and hf_model:
         try:
-            url = f'https://api-inference.huggingface.co/models/{hf_model}'
+            url = hf_model_url(hf_model)
             headers = {'Authorization': f'Bearer {hf_token}'}
-            files = { 'image': ('input.png', img_b, 'image/png') }
+            files = { 'image': ('input.png', img.png_bytes(), 'image/png') }
             data = { 'parameters': json.dumps({ 'prompt': req.style_prompt, 'strength': req.strength }) }
-            async with httpx.AsyncClient(timeout=httpx.Timeout(120.0, connect=10.0)) as client:
-                r = await client.post(url, headers=headers, files=files, data=data)
-                if r.status_code == 200:
-                    return { 'image': 'data:image/png;base64,' + base64.b64encode(r.content).decode('utf-8') }
-                else:
-                    raise Exception(f'HF refine status {r.status_code} {r.text[:200]}')
+            client = get_client('hf')
+            r = await client.post(url, headers=headers, files=files, data=data, timeout=httpx.Timeout(120.0, connect=10.0),
+                                  extensions={ 'route': hf_task_route('refine', hf_model) })
+            if r.status_code == 200:
+                return negotiate(request.headers.get('accept'), { 'image': ImageHandle.from_bytes(r.content) })
+            else:
+                raise Exception(f'HF refine status {r.status_code} {r.text[:200]}')
         except Exception as e:
             print('HF refine failed:', e)
 
@@ -1295,17 +1900,11 @@ async def refine_style(req: RefineRequest):
             def _local_refine():
                 # this is a best-effort path; reuse loaded pipelines if available
                 base, refiner = _load_local_pipelines(device=os.environ.get('LOCAL_DEVICE','cuda'))
-                # load image into PIL
-                from PIL import Image
-                from io import BytesIO
-                img = Image.open(BytesIO(img_b)).convert('RGB')
-                out = refiner(image=img, prompt=req.style_prompt, strength=req.strength, num_inference_steps=30).images[0]
-                buf = BytesIO()
-                out.save(buf, format='PNG')
-                return buf.getvalue()
-
-            out_bytes = await asyncio.to_thread(_local_refine)
-            return { 'image': 'data:image/png;base64,' + base64.b64encode(out_bytes).decode('utf-8') }
+                out = refiner(image=img.rgb(), prompt=req.style_prompt, strength=req.strength, num_inference_steps=30).images[0]
+                return ImageHandle.from_pil(out)
+
+            out = await LOCAL_BATCHER.run_exclusive(_local_refine)
+            return negotiate(request.headers.get('accept'), { 'image': out })
         except Exception as e:
             print('local refine failed:', e)
 
@@ -1324,30 +1923,42 @@ class RefineLoopRequest(BaseModel):
     # allow per-request SR control for refine loops
     postprocess_sr: Optional[bool] = None
     postprocess_sr_mode: Optional[str] = None
+    # stream only: longest edge (px) of preview thumbnails attached to progress events
+    preview_size: Optional[int] = None
 
 
 @app.post('/generate/refine-loop')
-async def generate_refine_loop(req: RefineLoopRequest):
+async def generate_refine_loop(req: RefineLoopRequest, request: Request):
     """Orchestrate generate -> SR -> OCR -> inpaint loop to improve legibility.
     Best-effort: will use HF/local refine where available and return final candidates + logs.
     """
     # 1) basic input validation
     if not req.prompt:
         raise HTTPException(status_code=400, detail='prompt required')
+    return negotiate(request.headers.get('accept'), await _refine_loop(req))
+
+
+async def _refine_loop(req: RefineLoopRequest, emit=None):
+    """Body of the refine loop. `emit(event, data)` (async, optional) is called after
+    each stage; `data` may carry the current ImageHandle under 'image'.
+    """
+    async def _emit(event, **data):
+        if emit is not None:
+            await emit(event, data)
 
     try:
         # If an initial image is provided, run the refinement loop on that image
         results = []
         if req.init_imageBase64:
             # Use the provided image as a single 'init' candidate
-            results = [{ 'provider': 'init', 'images': [req.init_imageBase64] }]
+            results = [{ 'provider': 'init', 'images': [ImageHandle.from_base64(req.init_imageBase64)] }]
         else:
             # Compose a GenerateLogoRequest to reuse existing generation paths
             greq = GenerateLogoRequest(prompt=req.prompt, width=req.width, height=req.height, steps=req.steps, guidance_scale=req.guidance_scale)
 
             # Run multi-provider generation to get candidates
             try:
-                multi = await generate_multi(greq)
+                multi = await _generate_multi(greq)
             except Exception as e:
                 raise HTTPException(status_code=502, detail=f'multi generation failed: {str(e)}')
 
@@ -1371,10 +1982,8 @@ async def generate_refine_loop(req: RefineLoopRequest):
         if req.init_imageBase64:
             try:
                 print('No provider images, using init image with local text-boost fallback')
-                init_bytes = _decode_data_url(req.init_imageBase64) if req.init_imageBase64.startswith('data:') else base64.b64decode(req.init_imageBase64)
-                boosted = _local_text_boost(init_bytes)
-                data_url = 'data:image/png;base64,' + base64.b64encode(boosted).decode('utf-8')
-                return { 'candidates': [{ 'provider': 'init_boost', 'result_image': data_url, 'final_ocr_len': 0 }] }
+                boosted = _local_text_boost_image(ImageHandle.from_base64(req.init_imageBase64))
+                return { 'candidates': [{ 'provider': 'init_boost', 'result_image': boosted, 'final_ocr_len': 0 }] }
             except Exception as e:
                 print('Init image boost failed:', e)
 
@@ -1383,7 +1992,7 @@ async def generate_refine_loop(req: RefineLoopRequest):
             if generate_stability_image:
                 print('No images from HF/local; attempting Stability.ai fallback inside refine-loop')
                 sreq = StabilityRequest(prompt=req.prompt, width=req.width or 512, height=req.height or 512, steps=req.steps or 20)
-                stab = await generate_stability(sreq)
+                stab = await _generate_stability(sreq)
                 # normalize into expected results list
                 if isinstance(stab, dict) and stab.get('images'):
                     results = [{ 'provider': 'stability', 'images': stab.get('images') }]
@@ -1392,25 +2001,31 @@ async def generate_refine_loop(req: RefineLoopRequest):
         except Exception as se:
             print('Stability fallback inside refine-loop failed:', se)
 
-    for item in results:
+    await _emit('generated', providers=[it.get('provider') if isinstance(it, dict) else 'unknown' for it in results])
+
+    for idx, item in enumerate(results):
         candidate_log = { 'provider': item.get('provider') if isinstance(item, dict) else 'unknown', 'attempts': [] }
-        # decode image bytes
+        stage_info = { 'candidate': idx, 'provider': candidate_log['provider'] }
+        # wrap the candidate once; every stage below reuses the same handle
         try:
-            img_dataurl = item.get('images', [None])[0] if isinstance(item, dict) else None
-            if not img_dataurl:
+            first = item.get('images', [None])[0] if isinstance(item, dict) else None
+            if not first:
                 candidate_log['error'] = 'no_image'
                 out_candidates.append(candidate_log)
+                await _emit('candidate', **stage_info, error='no_image')
                 continue
-            img_bytes = _decode_data_url(img_dataurl) if img_dataurl.startswith('data:') else base64.b64decode(img_dataurl)
+            img = as_handle(first)
+            img.encoded_bytes()
         except Exception as e:
             candidate_log['error'] = 'invalid_image'
             candidate_log['details'] = str(e)
             out_candidates.append(candidate_log)
+            await _emit('candidate', **stage_info, error='invalid_image')
             continue
 
         # iterative loop
-        cur_bytes = img_bytes
-        final_bytes = cur_bytes
+        cur = img
+        final = cur
         achieved_score = 0
         for itr in range(int(req.max_iters or 1)):
             step_log = { 'iteration': itr+1 }
@@ -1420,100 +2035,100 @@ async def generate_refine_loop(req: RefineLoopRequest):
                 if do_sr is None:
                     do_sr_env = os.environ.get('POSTPROCESS_SR', '0')
                     do_sr = str(do_sr_env).lower() in ('1', 'true', 'yes')
-                if do_sr and super_resolve:
+                if do_sr and super_resolve_image:
                     try:
                         sr_mode = req.postprocess_sr_mode or os.environ.get('POSTPROCESS_SR_MODE','hf')
-                        cur_bytes = await super_resolve(cur_bytes, mode=sr_mode)
+                        cur = await super_resolve_image(cur, mode=sr_mode)
                         step_log['sr'] = 'applied'
                     except Exception as e:
                         step_log['sr_error'] = str(e)
+                    await _emit('stage', **stage_info, iteration=itr+1, stage='sr', status=step_log.get('sr', 'error'), image=cur)
             except Exception:
                 pass
 
             # OCR
             ocr_text = ''
             try:
-                if ocr_text_from_bytes:
-                    ocr_text = ocr_text_from_bytes(cur_bytes)
+                if ocr_text_async:
+                    ocr_text = await ocr_text_async(cur)
                     step_log['ocr_text'] = ocr_text
                     step_log['ocr_len'] = len(ocr_text.strip())
             except Exception as e:
                 step_log['ocr_error'] = str(e)
 
             achieved_score = len((ocr_text or '').strip())
+            await _emit('stage', **stage_info, iteration=itr+1, stage='ocr', ocr_score=achieved_score, image=cur)
             # check threshold
             if achieved_score >= int(req.target_ocr_score or 0):
                 step_log['status'] = 'ok'
                 candidate_log['attempts'].append(step_log)
-                final_bytes = cur_bytes
+                final = cur
                 break
 
             # else attempt inpainting refinement around low-confidence text boxes
-            if detect_text_bboxes and make_mask_from_boxes:
-                try:
-                    boxes = detect_text_bboxes(cur_bytes, min_confidence=15)
-                    if boxes:
-                        boxes = expand_boxes_by_ratio(boxes, ratio=0.25)
-                        mask_png = make_mask_from_boxes(cur_bytes, boxes, pad=8)
-                        # call HF image-to-image refine if available
-                        hf_token = os.environ.get('HUGGINGFACE_API_TOKEN') or os.environ.get('HF_TOKEN')
-                        hf_model = os.environ.get('HUGGINGFACE_REFINE_MODEL') or os.environ.get('HUGGINGFACE_MODEL')
-                        refined = None
-                        if hf_token and hf_model:
-                            try:
-                                url = f'https://api-inference.huggingface.co/models/{hf_model}'
-                                headers = {'Authorization': f'Bearer {hf_token}'}
-                                files = {
-                                    'image': ('input.png', cur_bytes, 'image/png'),
-                                    'mask': ('mask.png', mask_png, 'image/png')
-                                }
-                                data = { 'parameters': json.dumps({ 'prompt': req.prompt + ' Improve text legibility and make text crisp and high-contrast.', 'strength': 0.8 }) }
-                                async with httpx.AsyncClient(timeout=httpx.Timeout(120.0, connect=10.0)) as client:
-                                    r = await client.post(url, headers=headers, files=files, data=data)
+            if detect_text_bboxes_async and make_mask_image:
+                with metric_stage('inpaint'):
+                    try:
+                        boxes = await detect_text_bboxes_async(cur, min_confidence=15)
+                        if boxes:
+                            boxes = expand_boxes_by_ratio(boxes, ratio=0.25)
+                            mask = ImageHandle.from_pil(make_mask_image(cur.size, boxes, pad=8))
+                            # call HF image-to-image refine if available
+                            hf_token = os.environ.get('HUGGINGFACE_API_TOKEN') or os.environ.get('HF_TOKEN')
+                            hf_model = os.environ.get('HUGGINGFACE_REFINE_MODEL') or os.environ.get('HUGGINGFACE_MODEL')
+                            refined = None
+                            if hf_token and hf_model:
+                                try:
+                                    url = hf_model_url(hf_model)
+                                    headers = {'Authorization': f'Bearer {hf_token}'}
+                                    files = {
+                                        'image': ('input.png', cur.png_bytes(), 'image/png'),
+                                        'mask': ('mask.png', mask.png_bytes(), 'image/png')
+                                    }
+                                    data = { 'parameters': json.dumps({ 'prompt': req.prompt + ' Improve text legibility and make text crisp and high-contrast.', 'strength': 0.8 }) }
+                                    client = get_client('hf')
+                                    r = await client.post(url, headers=headers, files=files, data=data, timeout=httpx.Timeout(120.0, connect=10.0),
+                                                          extensions={ 'route': hf_task_route('refine', hf_model) })
                                     if r.status_code == 200:
-                                        refined = r.content
+                                        refined = ImageHandle.from_bytes(r.content)
                                         step_log['inpaint'] = 'hf'                    
-                            except Exception as e:
-                                step_log['inpaint_error'] = f'hf:{str(e)}'
-
-                        # Attempt local refine fallback
-                        if refined is None and USE_LOCAL_DIFFUSION:
-                            try:
-                                def _local_inpaint():
-                                    base, refiner = _load_local_pipelines(device=os.environ.get('LOCAL_DEVICE','cuda'))
-                                    from PIL import Image
-                                    from io import BytesIO
-                                    img = Image.open(BytesIO(cur_bytes)).convert('RGB')
-                                    mask = Image.open(BytesIO(mask_png)).convert('L')
-                                    out = refiner(image=img, mask_image=mask, prompt=req.prompt + ' Improve text legibility and make text crisp and high-contrast.', strength=0.8, num_inference_steps=25).images[0]
-                                    buf = BytesIO()
-                                    out.save(buf, format='PNG')
-                                    return buf.getvalue()
-
-                                refined = await asyncio.to_thread(_local_inpaint)
-                                step_log['inpaint'] = 'local'
-                            except Exception as e:
-                                step_log['inpaint_error_local'] = str(e)
-
-                        if refined:
-                            cur_bytes = refined
-                            step_log['inpaint_applied'] = True
+                                except Exception as e:
+                                    step_log['inpaint_error'] = f'hf:{str(e)}'
+
+                            # Attempt local refine fallback
+                            if refined is None and USE_LOCAL_DIFFUSION:
+                                try:
+                                    def _local_inpaint():
+                                        base, refiner = _load_local_pipelines(device=os.environ.get('LOCAL_DEVICE','cuda'))
+                                        out = refiner(image=cur.rgb(), mask_image=mask.gray(), prompt=req.prompt + ' Improve text legibility and make text crisp and high-contrast.', strength=0.8, num_inference_steps=25).images[0]
+                                        return ImageHandle.from_pil(out)
+
+                                    refined = await LOCAL_BATCHER.run_exclusive(_local_inpaint)
+                                    step_log['inpaint'] = 'local'
+                                except Exception as e:
+                                    step_log['inpaint_error_local'] = str(e)
+
+                            if refined is not None:
+                                cur = refined
+                                step_log['inpaint_applied'] = True
+                            else:
+                                step_log['inpaint_applied'] = False
                         else:
-                            step_log['inpaint_applied'] = False
-                    else:
-                        step_log['inpaint'] = 'no_boxes'
-                except Exception as e:
-                    step_log['inpaint_error'] = str(e)
+                            step_log['inpaint'] = 'no_boxes'
+                    except Exception as e:
+                        step_log['inpaint_error'] = str(e)
+                await _emit('stage', **stage_info, iteration=itr+1, stage='inpaint', applied=bool(step_log.get('inpaint_applied')), ocr_score=achieved_score, image=cur)
 
             candidate_log['attempts'].append(step_log)
-            final_bytes = cur_bytes
+            final = cur
 
         # end iterations for this candidate
         candidate_log['final_ocr_len'] = achieved_score
-        candidate_log['result_image'] = 'data:image/png;base64,' + base64.b64encode(final_bytes).decode('utf-8')
+        candidate_log['result_image'] = final
         out_candidates.append(candidate_log)
+        await _emit('candidate', **stage_info, ocr_score=achieved_score, image=final)
 
-    # Normalize output: include a top-level 'images' list (data-urls) for callers that expect it.
+    # Normalize output: include a top-level 'images' list for callers that expect it.
     images = []
     try:
         for c in out_candidates:
@@ -1530,3 +2145,190 @@ async def generate_refine_loop(req: RefineLoopRequest):
         # also include a convenience 'best' pointing to first image
         out['best'] = images[0]
     return out
+
+
+def _sse(event: str, data: dict, seq: int) -> bytes:
+    return f'id: {seq}\nevent: {event}\ndata: {json.dumps(data, default=str)}\n\n'.encode('utf-8')
+
+
+async def _preview_data_url(img: ImageHandle, size: int) -> str:
+    def _thumb():
+        thumb = img.rgb().copy()
+        thumb.thumbnail((size, size))
+        return ImageHandle.from_pil(thumb).data_url()
+    return await asyncio.to_thread(_thumb)
+
+
+def _refine_loop_summary(out: dict) -> dict:
+    """Final stream event: the best-scoring candidate's image plus per-candidate logs
+    (without repeating every image)."""
+    candidates = out.get('candidates') if isinstance(out, dict) else None
+    if not candidates:
+        return encode_images(out)
+    best = None
+    for c in candidates:
+        if isinstance(c, dict) and c.get('result_image') is not None:
+            if best is None or (c.get('final_ocr_len') or 0) > (best.get('final_ocr_len') or 0):
+                best = c
+    summary = { 'candidates': [{ k: v for k, v in c.items() if k != 'result_image' } for c in candidates] }
+    if best is not None:
+        summary['best'] = encode_images(best['result_image'])
+        summary['best_provider'] = best.get('provider')
+        summary['best_ocr_score'] = best.get('final_ocr_len', 0)
+    return summary
+
+
+@app.post('/generate/refine-loop/stream')
+async def generate_refine_loop_stream(req: RefineLoopRequest):
+    """Server-Sent Events variant of /generate/refine-loop.
+    Emits 'generated', then a 'stage' event per SR/OCR/inpaint step and a 'candidate'
+    event per finished candidate (with a thumbnail when `preview_size` is set), and
+    finally 'done' carrying the best image, or 'error'. Disconnecting cancels the loop.
+    """
+    if not req.prompt:
+        raise HTTPException(status_code=400, detail='prompt required')
+    queue = asyncio.Queue()
+    preview = int(req.preview_size or 0)
+    last_preview = { 'image': None, 'url': None }
+
+    async def emit(event, data):
+        img = data.pop('image', None)
+        if preview > 0 and img is not None:
+            try:
+                # consecutive stages often report the same unchanged image
+                if last_preview['image'] is not img:
+                    last_preview['url'] = await _preview_data_url(img, preview)
+                    last_preview['image'] = img
+                data['preview'] = last_preview['url']
+            except Exception as e:
+                data['preview_error'] = str(e)
+        await queue.put((event, data))
+
+    async def run():
+        try:
+            out = await _refine_loop(req, emit)
+            summary = _refine_loop_summary(out)
+            trace = current_trace()
+            if trace is not None:
+                # headers went out with the first event; timings ride on the last one
+                summary['server_timing'] = trace.server_timing()
+                if trace.debug:
+                    summary['_timing'] = trace.as_dict()
+            await queue.put(('done', summary))
+        except HTTPException as e:
+            await queue.put(('error', { 'status': e.status_code, 'detail': e.detail }))
+        except Exception as e:
+            await queue.put(('error', { 'detail': str(e) }))
+        finally:
+            await queue.put(None)
+
+    async def events():
+        task = asyncio.ensure_future(run())
+        seq = 0
+        try:
+            while True:
+                item = await queue.get()
+                if item is None:
+                    break
+                seq += 1
+                yield _sse(item[0], item[1], seq)
+        finally:
+            # client went away (or we finished): stop any remaining refinement work
+            if not task.done():
+                task.cancel()
+                await asyncio.gather(task, return_exceptions=True)
+
+    return StreamingResponse(events(), media_type='text/event-stream', headers={ 'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no' })
+
+
+# Durable async jobs: POST /jobs returns immediately, workers run the same internal
+# entry points as the synchronous endpoints and persist results to SQLite.
+class JobRequest(BaseModel):
+    kind: str
+    payload: Dict[str, Any]
+
+
+async def _refine_loop_job(req: RefineLoopRequest, progress):
+    iters = max(1, int(req.max_iters or 1))
+    state = { 'total': 1 }
+
+    async def emit(event, data):
+        # generation is ~20% of the work; the rest is split evenly across candidates
+        if event == 'generated':
+            state['total'] = max(1, len(data.get('providers') or []))
+            progress(0.2)
+        elif event == 'stage':
+            done = data['candidate'] + min(data['iteration'], iters) / float(iters + 1)
+            progress(0.2 + 0.8 * done / state['total'])
+        elif event == 'candidate':
+            progress(0.2 + 0.8 * (data['candidate'] + 1) / state['total'])
+
+    return await _refine_loop(req, emit)
+
+
+_JOB_KINDS = {
+    'logo': (GenerateLogoRequest, lambda req, progress: _generate_logo(req)),
+    'card': (GenerateLogoRequest, lambda req, progress: _generate_card(req)),
+    'stability': (StabilityRequest, lambda req, progress: _generate_stability(req)),
+    'multi': (GenerateLogoRequest, lambda req, progress: _generate_multi(req)),
+    'with-score': (GenerateLogoRequest, lambda req, progress: _generate_with_score(req)),
+    'refine-loop': (RefineLoopRequest, _refine_loop_job),
+}
+
+
+def _job_runner(model, run):
+    async def _runner(payload, progress):
+        return encode_images(await run(model(**payload), progress))
+    return _runner
+
+
+JOBS = make_job_manager({ kind: _job_runner(model, run) for kind, (model, run) in _JOB_KINDS.items() })
+
+
+def _job_view(job: dict) -> dict:
+    return { k: job.get(k) for k in ('id', 'kind', 'status', 'progress', 'result', 'error', 'created', 'updated') }
+
+
+@app.on_event('startup')
+async def _startup_jobs():
+    await JOBS.start()
+
+
+@app.on_event('shutdown')
+async def _shutdown_jobs():
+    await JOBS.stop()
+
+
+@app.post('/jobs', status_code=202)
+async def submit_job(req: JobRequest):
+    """Queue a generation (`kind`: logo, card, stability, multi, with-score, refine-loop)
+    with the same payload its synchronous endpoint takes. Poll GET /jobs/{id}.
+    """
+    spec = _JOB_KINDS.get(req.kind)
+    if spec is None:
+        raise HTTPException(status_code=400, detail=f'unknown job kind: {req.kind} (expected one of {", ".join(_JOB_KINDS)})')
+    try:
+        # validate now so bad payloads fail fast instead of in the worker
+        spec[0](**req.payload)
+    except Exception as e:
+        raise HTTPException(status_code=422, detail=f'invalid payload for {req.kind}: {str(e)}')
+    return _job_view(await JOBS.submit(req.kind, req.payload))
+
+
+@app.get('/jobs/{job_id}')
+async def get_job(job_id: str):
+    job = await JOBS.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail='job not found')
+    return _job_view(job)
+
+
+@app.delete('/jobs/{job_id}')
+async def cancel_job(job_id: str):
+    job = await JOBS.cancel(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail='job not found')
+    return _job_view(job)
+
+
+_IMPORT_MS = round((time.perf_counter() - _IMPORT_T0) * 1000.0, 1)
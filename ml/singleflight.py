@@ -0,0 +1,53 @@
+"""Single-flight coalescing of identical in-flight async calls.
+
+Concurrent callers asking for the same key share one underlying task: only
+the first caller starts `fn()`, every waiter receives its result or its
+exception. A waiter that is cancelled detaches without affecting the shared
+task; the task itself is only cancelled once no waiters remain.
+"""
+import asyncio
+
+
+class SingleFlight:
+    def __init__(self):
+        self._calls = {}
+
+    def inflight(self) -> int:
+        return len(self._calls)
+
+    async def do(self, key: str, fn):
+        """Run `fn()` once per key among concurrent callers.
+        Returns (result, shared) where `shared` is True for callers that joined
+        a call started by someone else.
+        """
+        call = self._calls.get(key)
+        if call is not None and call['task'].cancelled():
+            # the last waiter gave up on it: never hand a cancelled task to a newcomer
+            call = None
+        shared = call is not None
+        if call is None:
+            task = asyncio.ensure_future(fn())
+            call = { 'task': task, 'waiters': 0 }
+            self._calls[key] = call
+            task.add_done_callback(lambda t, k=key, c=call: self._finish(k, c, t))
+        call['waiters'] += 1
+        try:
+            result = await asyncio.shield(call['task'])
+            return result, shared
+        except asyncio.CancelledError:
+            task = call['task']
+            if call['waiters'] <= 1 and not task.done():
+                # forget the key first so a caller arriving now starts a fresh call
+                if self._calls.get(key) is call:
+                    del self._calls[key]
+                task.cancel()
+            raise
+        finally:
+            call['waiters'] -= 1
+
+    def _finish(self, key, call, task):
+        if self._calls.get(key) is call:
+            del self._calls[key]
+        # mark the exception retrieved even when every waiter went away
+        if not task.cancelled():
+            task.exception()
@@ -1,12 +1,34 @@
 import os
 import base64
-import httpx
-from io import BytesIO
 try:
-    from PIL import Image
+    import PIL  # noqa: F401  (local SR works on PIL images)
     PIL_AVAILABLE = True
 except Exception:
     PIL_AVAILABLE = False
+try:
+    from .http_clients import get_client, hf_model_url
+except Exception:
+    from http_clients import get_client, hf_model_url
+try:
+    from .provider_router import hf_task_route
+except Exception:
+    from provider_router import hf_task_route
+try:
+    from .ocr_pool import OCR_POOL
+except Exception:
+    from ocr_pool import OCR_POOL
+try:
+    from .image_handle import ImageHandle, as_handle
+except Exception:
+    from image_handle import ImageHandle, as_handle
+try:
+    from .backends import load as load_backend, require as require_backend
+except Exception:
+    from backends import load as load_backend, require as require_backend
+try:
+    from .metrics import stage as metric_stage
+except Exception:
+    from metrics import stage as metric_stage
 
 
 def _decode_data_url(data_url: str) -> bytes:
@@ -28,72 +50,84 @@ async def super_resolve_via_hf(img_bytes: bytes, hf_token: str, hf_model: str =
     if not hf_token:
         raise RuntimeError('Hugging Face token not configured')
     model = hf_model or os.environ.get('HF_SR_MODEL') or 'timbrooks/instruct-pix2pix'
-    url = f'https://api-inference.huggingface.co/models/{model}'
+    url = hf_model_url(model)
     headers = {'Authorization': f'Bearer {hf_token}'}
     files = {'image': ('input.png', img_bytes, 'image/png')}
     data = {}
-    async with httpx.AsyncClient(timeout=60.0) as client:
-        r = await client.post(url, headers=headers, files=files, data=data)
-        if r.status_code != 200:
-            raise RuntimeError(f'HF SR failed: {r.status_code} {r.text[:200]}')
-        return r.content
+    client = get_client('hf')
+    r = await client.post(url, headers=headers, files=files, data=data, timeout=60.0, extensions={ 'route': hf_task_route('sr', model) })
+    if r.status_code != 200:
+        raise RuntimeError(f'HF SR failed: {r.status_code} {r.text[:200]}')
+    return r.content
 
 
-def super_resolve_local(img_bytes: bytes, scale: int = 2) -> bytes:
+def super_resolve_local_image(img: ImageHandle, scale: int = 2) -> ImageHandle:
     """Attempt local Real-ESRGAN-based super-resolution if installed.
     This is a best-effort function and raises if dependencies are missing.
     """
     try:
-        from realesrgan import RealESRGAN
+        RealESRGAN = require_backend('realesrgan').RealESRGAN
     except Exception as e:
         raise RuntimeError('local Real-ESRGAN not available: ' + str(e))
 
     if not PIL_AVAILABLE:
         raise RuntimeError('Pillow required for local SR')
 
-    img = Image.open(BytesIO(img_bytes)).convert('RGB')
     # default device; try cuda then cpu
     try:
-        import torch
-        device = 'cuda' if torch.cuda.is_available() else 'cpu'
+        torch = load_backend('torch')
+        device = 'cuda' if torch is not None and torch.cuda.is_available() else 'cpu'
     except Exception:
         device = 'cpu'
 
     model = RealESRGAN(device, scale=scale)
     model.load_weights('RealESRGAN_x2plus.pth', download=True)
-    out = model.predict(img)
-    buf = BytesIO()
-    out.save(buf, format='PNG')
-    return buf.getvalue()
+    out = model.predict(img.rgb())
+    return ImageHandle.from_pil(out)
 
 
-async def super_resolve(img_bytes: bytes, mode: str = 'hf') -> bytes:
+def super_resolve_local(img_bytes: bytes, scale: int = 2) -> bytes:
+    return super_resolve_local_image(as_handle(img_bytes), scale=scale).png_bytes()
+
+
+async def super_resolve_image(img: ImageHandle, mode: str = 'hf') -> ImageHandle:
     """Public helper: try local SR first (if mode=='local'), then HF fallback.
     mode: 'local' | 'hf' | 'auto'
     """
+    with metric_stage('sr'):
+        return await _super_resolve_image(img, mode)
+
+
+async def _super_resolve_image(img: ImageHandle, mode: str) -> ImageHandle:
     if mode == 'local':
-        return super_resolve_local(img_bytes)
+        return super_resolve_local_image(img)
 
     # default: prefer HF inference
     hf_token = os.environ.get('HUGGINGFACE_API_TOKEN') or os.environ.get('HF_TOKEN')
     try:
-        return await super_resolve_via_hf(img_bytes, hf_token)
+        return ImageHandle.from_bytes(await super_resolve_via_hf(img.png_bytes(), hf_token))
     except Exception:
         # fallback to local if available
         try:
-            return super_resolve_local(img_bytes)
+            return super_resolve_local_image(img)
         except Exception as e:
             raise RuntimeError('Super-resolve failed (HF+local): ' + str(e))
 
 
-def ocr_text_from_bytes(img_bytes: bytes) -> str:
-    """Best-effort OCR using pytesseract if available."""
-    try:
-        from PIL import Image
-        import pytesseract
-    except Exception as e:
-        raise RuntimeError('pytesseract not available: ' + str(e))
+async def super_resolve(img_bytes: bytes, mode: str = 'hf') -> bytes:
+    """Bytes-in/bytes-out wrapper around `super_resolve_image`."""
+    return (await super_resolve_image(as_handle(img_bytes), mode=mode)).encoded_bytes()
+
+
+def ocr_text_from_bytes(img_bytes) -> str:
+    """Best-effort OCR via the shared OCR pool backend, run in the calling thread.
+    Async callers should use `ocr_text_async` instead.
+    """
+    return OCR_POOL.text_sync(img_bytes)
+
 
-    img = Image.open(BytesIO(img_bytes)).convert('RGB')
-    txt = pytesseract.image_to_string(img)
-    return txt
+async def ocr_text_async(img) -> str:
+    """OCR on the shared worker pool without blocking the event loop.
+    Accepts PNG bytes or an ImageHandle (decoded at most once).
+    """
+    return await OCR_POOL.text(img)
@@ -3,6 +3,18 @@ import httpx
 import asyncio
 import base64
 from typing import List, Optional
+try:
+    from .http_clients import get_client, provider_url
+except Exception:
+    from http_clients import get_client, provider_url
+try:
+    from .metrics import PROVIDER_FALLBACKS
+except Exception:
+    from metrics import PROVIDER_FALLBACKS
+try:
+    from .provider_router import ROUTER, CircuitOpen, STABILITY_V2BETA, STABILITY_V1
+except Exception:
+    from provider_router import ROUTER, CircuitOpen, STABILITY_V2BETA, STABILITY_V1
 
 STABILITY_API_KEY = os.environ.get('STABILITY_API_KEY')
 STABILITY_MODEL = os.environ.get('STABILITY_MODEL') or os.environ.get('HUGGINGFACE_MODEL', '').split('/')[-1] or 'stable-diffusion-xl-base-1.0'
@@ -21,16 +33,53 @@ async def generate_stability_image(
 ) -> List[str]:
     """Call Stability Platform text-to-image endpoint and return list of data URLs.
 
+    The v2beta and v1 APIs are tried in the order the provider router ranks
+    them (v2beta first until there is latency data); an API whose circuit is
+    open is skipped, and `CircuitOpen` is raised when both are.
+
     Returns list of strings like 'data:image/png;base64,...'. Raises Exception on error.
     """
     key = api_key or STABILITY_API_KEY
     if not key:
         raise Exception('STABILITY_API_KEY not configured')
 
-    # First try the v2beta /stable-image/generate/ultra endpoint which returns
-    # raw image bytes when Accept: image/* is used. This avoids parsing JSON
-    # artifacts and works with the newer Stability API surface.
-    v2_url = os.environ.get('STABILITY_V2_URL', 'https://api.stability.ai/v2beta/stable-image/generate/ultra')
+    candidates = [STABILITY_V2BETA, STABILITY_V1]
+    routes = ROUTER.order(candidates)
+    if not routes:
+        raise CircuitOpen(candidates, ROUTER.retry_after(candidates))
+
+    client = get_client('stability')
+    timeout = httpx.Timeout(timeout_seconds, connect=10.0)
+    errors = []
+    for i, route in enumerate(routes):
+        if i:
+            PROVIDER_FALLBACKS.inc(routes[i - 1].replace(':', '-'), route.replace(':', '-'), errors[-1][1])
+        try:
+            if route == STABILITY_V2BETA:
+                return await _generate_v2beta(client, key, prompt, width, height, steps, samples, timeout)
+            return await _generate_v1(client, key, prompt, width, height, steps, cfg_scale, samples, model, timeout)
+        except _StabilityError as e:
+            errors.append((route, e.reason, str(e)))
+        except Exception as e:
+            errors.append((route, 'error', str(e)))
+
+    if len(errors) == 1:
+        raise Exception(errors[0][2])
+    # include every API's error for diagnostics
+    raise Exception(' ; '.join(f'{route.split(":")[1]}_err={msg}' for route, _, msg in errors))
+
+
+class _StabilityError(Exception):
+    def __init__(self, message: str, reason: str):
+        super().__init__(message)
+        self.reason = reason
+
+
+async def _generate_v2beta(client, key, prompt, width, height, steps, samples, timeout) -> List[str]:
+    # The v2beta /stable-image/generate/ultra endpoint returns raw image bytes
+    # when Accept: image/* is used. This avoids parsing JSON artifacts and
+    # works with the newer Stability API surface.
+    v2_url = os.environ.get('STABILITY_V2_URL') or provider_url('stability', 'v2beta/stable-image/generate/ultra')
     headers_v2 = {
         'Authorization': f'Bearer {key}',
         'Accept': 'image/*'
@@ -50,27 +99,24 @@ async def generate_stability_image(
     except Exception:
         pass
 
-    async with httpx.AsyncClient(timeout=httpx.Timeout(timeout_seconds, connect=10.0)) as client:
-        try:
-            # Use multipart form as in Stability examples; files param is required
-            # by some Stability endpoints even if empty.
-            files = { 'none': '' }
-            r = await client.post(v2_url, headers=headers_v2, files=files, data=data_v2)
-            if r.status_code == 200:
-                # infer mime type from response header
-                ct = r.headers.get('content-type', 'image/png')
-                b64 = base64.b64encode(r.content).decode('utf-8')
-                return [f'data:{ct};base64,{b64}']
-            # if non-200, fall through to platform endpoint below
-            # capture response for diagnostics
-            v2_err = f'v2beta error {r.status_code}: {r.text[:1000]}'
-        except Exception as e:
-            v2_err = str(e)
+    # Use multipart form as in Stability examples; files param is required
+    # by some Stability endpoints even if empty. The route is named explicitly
+    # since STABILITY_V2_URL may point anywhere.
+    files = { 'none': '' }
+    r = await client.post(v2_url, headers=headers_v2, files=files, data=data_v2, timeout=timeout,
+                          extensions={ 'route': STABILITY_V2BETA })
+    if r.status_code == 200:
+        # infer mime type from response header
+        ct = r.headers.get('content-type', 'image/png')
+        b64 = base64.b64encode(r.content).decode('utf-8')
+        return [f'data:{ct};base64,{b64}']
+    raise _StabilityError(f'v2beta error {r.status_code}: {r.text[:1000]}', str(r.status_code))
+
 
-    # Fallback to older Stability Platform text-to-image endpoint if v2beta
-    # didn't work or is not available for this account.
+async def _generate_v1(client, key, prompt, width, height, steps, cfg_scale, samples, model, timeout) -> List[str]:
+    # Older Stability Platform text-to-image endpoint, for accounts without v2beta.
     model_id = model or STABILITY_MODEL
-    url = f'https://api.stability.ai/v1/generation/{model_id}/text-to-image'
+    url = provider_url('stability', f'v1/generation/{model_id}/text-to-image')
     headers = {
         'Authorization': f'Bearer {key}',
         'Content-Type': 'application/json'
@@ -85,15 +131,10 @@ async def generate_stability_image(
         'cfg_scale': cfg_scale
     }
 
-    async with httpx.AsyncClient(timeout=httpx.Timeout(timeout_seconds, connect=10.0)) as client:
-        r = await client.post(url, headers=headers, json=payload)
-        if r.status_code not in (200, 201):
-            # include body for diagnostics, prefer v2 error if available
-            msg = r.text[:1000]
-            if 'v2_err' in locals():
-                msg = f'v2_err={v2_err} ; platform_err={msg}'
-            raise Exception(f'Stability API error {r.status_code}: {msg}')
-        data = r.json()
+    r = await client.post(url, headers=headers, json=payload, timeout=timeout)
+    if r.status_code not in (200, 201):
+        raise _StabilityError(f'Stability API error {r.status_code}: {r.text[:1000]}', str(r.status_code))
+    data = r.json()
 
     # extract base64 artifacts defensively (same as before)
     images = []
@@ -0,0 +1,171 @@
+"""Long-lived business-card template renderer.
+
+Templates are the card background images in `TEMPLATE_DIR` (the same
+`ml/scraped_images_bcards` folder the Node backend lists). Decoded templates
+are kept in a bounded LRU keyed by file name and mtime, and fonts come from the
+layout engine's bounded `FontBook`, so a render only pays for layout, drawing
+and PNG encoding. A batch renders many field sets against one template: it is
+decoded (or found in the cache) once and copied per card.
+
+Text placement comes from `layout_suggestion.text_boxes` (fitted font sizes per
+line); each box is drawn dark or light depending on the luminance of the
+template underneath it.
+
+Env configuration:
+- TEMPLATE_DIR template images (default ml/scraped_images_bcards)
+- TEMPLATE_CACHE_SIZE decoded templates kept in memory (default 16)
+- TEMPLATE_PRELOAD templates decoded at startup (default: TEMPLATE_CACHE_SIZE; 0 disables)
+- TEMPLATE_MAX_BATCH field sets per batch call (default 64)
+"""
+import io
+import os
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+try:
+    from PIL import Image, ImageDraw, ImageStat
+    PIL_AVAILABLE = True
+except Exception:
+    PIL_AVAILABLE = False
+
+try:
+    from .layout_suggestion import FONTS, LINE_GAP, text_boxes
+    from .contrast import relative_luminance
+except Exception:
+    from layout_suggestion import FONTS, LINE_GAP, text_boxes
+    from contrast import relative_luminance
+
+_HERE = os.path.dirname(os.path.abspath(__file__))
+_EXTENSIONS = ('.png', '.jpg', '.jpeg')
+DARK_TEXT = '#111111'
+LIGHT_TEXT = '#ffffff'
+
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return int(os.environ.get(name, default))
+    except Exception:
+        return default
+
+
+class TemplateNotFound(KeyError):
+    pass
+
+
+class TemplateRenderer:
+    """Bounded template cache plus drawing; safe to share between threads."""
+
+    def __init__(self, directory: Optional[str] = None, cache_size: Optional[int] = None, fonts=None):
+        self.directory = directory or os.environ.get('TEMPLATE_DIR') or os.path.join(_HERE, 'scraped_images_bcards')
+        self.cache_size = max(1, cache_size if cache_size is not None else _env_int('TEMPLATE_CACHE_SIZE', 16))
+        self.fonts = fonts or FONTS
+        self._cache = OrderedDict()  # name -> (mtime, RGB image)
+        self._lock = threading.Lock()
+
+    def list_templates(self) -> List[str]:
+        try:
+            return sorted(f for f in os.listdir(self.directory) if f.lower().endswith(_EXTENSIONS))
+        except OSError:
+            return []
+
+    def _path(self, name: str) -> str:
+        # plain file names only; never follow a path out of the template folder
+        if not name or os.path.basename(name) != name or not name.lower().endswith(_EXTENSIONS):
+            raise TemplateNotFound(name)
+        path = os.path.join(self.directory, name)
+        if not os.path.isfile(path):
+            raise TemplateNotFound(name)
+        return path
+
+    def template(self, name: str):
+        """Decoded RGB template; re-read when the file changes on disk."""
+        path = self._path(name)
+        mtime = os.stat(path).st_mtime
+        with self._lock:
+            hit = self._cache.get(name)
+            if hit is not None and hit[0] == mtime:
+                self._cache.move_to_end(name)
+                return hit[1]
+        with Image.open(path) as im:
+            img = im.convert('RGB')
+        with self._lock:
+            self._cache[name] = (mtime, img)
+            self._cache.move_to_end(name)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return img
+
+    def preload(self, limit: Optional[int] = None) -> int:
+        """Decode up to `limit` templates and warm the font cache; returns templates loaded."""
+        if not PIL_AVAILABLE:
+            return 0
+        limit = min(_env_int('TEMPLATE_PRELOAD', self.cache_size) if limit is None else limit, self.cache_size)
+        loaded = 0
+        for name in self.list_templates()[:limit]:
+            try:
+                self.template(name)
+                loaded += 1
+            except Exception as e:
+                print('Template preload failed for', name, e)
+        # one throwaway layout loads the fonts and glyph advances for common sizes
+        text_boxes({ 'name': 'Name Surname', 'title': 'Title', 'company': 'Company', 'email': 'name@example.com' }, self.fonts)
+        return loaded
+
+    def cached(self) -> int:
+        return len(self._cache)
+
+    def _text_color(self, base, box: dict, W: int, H: int) -> str:
+        x0, y0 = int(box['x'] * W), int(box['y'] * H)
+        x1, y1 = max(x0 + 1, int((box['x'] + box['w']) * W)), max(y0 + 1, int((box['y'] + box['h']) * H))
+        r, g, b = (int(c) for c in ImageStat.Stat(base.crop((x0, y0, x1, y1))).mean[:3])
+        bg = relative_luminance('#%02x%02x%02x' % (r, g, b))
+        # pick whichever text colour has the higher WCAG contrast on the region
+        return DARK_TEXT if (bg + 0.05) / (relative_luminance(DARK_TEXT) + 0.05) >= 1.05 / (bg + 0.05) else LIGHT_TEXT
+
+    def _draw(self, base, canvas, boxes: List[dict], text_color: Optional[str]):
+        W, H = canvas.size
+        draw = ImageDraw.Draw(canvas)
+        for box in boxes:
+            style = 'bold' if box['font_weight'] == 'bold' else 'regular'
+            m = self.fonts.metrics(style, box['font_size'])
+            fill = text_color or self._text_color(base, box, W, H)
+            lh = m.line_height * LINE_GAP
+            if box.get('rotate') == 90:
+                # draw upright in the box's own frame, then turn it to read bottom-to-top
+                bw, bh = max(1, int(box['h'] * H)), max(1, int(box['w'] * W))
+                layer = Image.new('RGBA', (bw, bh), (0, 0, 0, 0))
+                self._lines(ImageDraw.Draw(layer), box, m, 0, 0, bw, lh, fill)
+                layer = layer.rotate(90, expand=True)
+                canvas.paste(layer, (int(box['x'] * W), int(box['y'] * H)), layer)
+            else:
+                self._lines(draw, box, m, box['x'] * W, box['y'] * H, box['w'] * W, lh, fill)
+
+    @staticmethod
+    def _lines(draw, box: dict, m, x: float, y: float, w: float, lh: float, fill: str):
+        for i, text in enumerate(box['lines']):
+            dx = { 'left': 0.0, 'center': (w - m.width(text)) / 2.0, 'right': w - m.width(text) }[box['align']]
+            draw.text((x + dx, y + i * lh), text, font=m.font, fill=fill)
+
+    def render(self, name: str, fields: Dict, text_color: Optional[str] = None) -> bytes:
+        return self.render_batch(name, [fields], text_color)[0]
+
+    def render_batch(self, name: str, field_sets: List[Dict], text_color: Optional[str] = None) -> List[bytes]:
+        """PNG bytes for every field set drawn on one template (decoded once)."""
+        if not PIL_AVAILABLE:
+            raise RuntimeError('Pillow required for template rendering')
+        base = self.template(name)
+        W, H = base.size
+        out = []
+        for fields in field_sets:
+            card = dict(fields or {}, width=W, height=H)
+            _, _, boxes = text_boxes(card, self.fonts)
+            canvas = base.copy()
+            self._draw(base, canvas, boxes, text_color)
+            buf = io.BytesIO()
+            canvas.save(buf, format='PNG')
+            out.append(buf.getvalue())
+        return out
+
+
+TEMPLATES = TemplateRenderer()
@@ -0,0 +1,53 @@
+"""Lexical icon search: typo queries land on the intended icon (run with pytest or python)."""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from icon_index import build_catalogue, LexicalIndex  # noqa: E402
+
+ICONS_JS = """
+export const ICONS = [
+  { id: 'phone', label: 'Phone' },
+  { id: 'email', label: 'Email' },
+  { id: 'globe', label: 'Website' },
+  { id: 'linkedin', label: 'LinkedIn' },
+  { id: 'twitter', label: 'Twitter' },
+  { id: 'whatsapp', label: 'WhatsApp' },
+];
+"""
+EMOJI_JS = """
+export const EMOJI_ICONS = [
+  // Objects
+  '\U0001F48E', '\U0001F950', '\U0001F418', '\U0001F3ED',
+];
+"""
+
+
+def _search(q, top_k=5):
+    icons, texts = build_catalogue({ 'icons': ICONS_JS, 'emoji': EMOJI_JS })
+    index = LexicalIndex(texts)
+    return [icons[i]['label'] for i, _ in index.search(q, top_k)]
+
+
+def test_typos_find_intended_icon():
+    assert _search('emial') == ['Email']
+    assert _search('fone') == ['Phone']
+    assert _search('phnoe') == ['Phone']
+
+
+def test_unrelated_word_matches_nothing():
+    assert _search('restaurant') == []
+    assert _search('doctor') == []
+
+
+def test_exact_and_prefix_words_still_rank():
+    assert _search('email')[0] == 'Email'
+    assert _search('soc')[:1] in (['LinkedIn'], ['Twitter'], ['WhatsApp'])
+
+
+if __name__ == '__main__':
+    for name, fn in list(globals().items()):
+        if name.startswith('test_'):
+            fn()
+    print('ok')
@@ -0,0 +1,244 @@
+"""Per-request timing spans, exposed as Server-Timing and tagged with X-Request-Id.
+
+`TracingMiddleware` opens a trace per HTTP request under the incoming
+`X-Request-Id` (one is generated when missing) and echoes the id back. Code
+inside the request records spans with
+
+    with span('decode'):
+        ...
+
+Spans nest through a context variable, so they follow the request into
+`asyncio.to_thread` and tasks it creates; executors need the context copied
+explicitly (see `in_context`). `metrics.stage()` opens a span too, so every
+timed pipeline stage shows up without extra calls. Outside a request `span()`
+is a no-op.
+
+The response carries per-name totals, e.g.
+
+    Server-Timing: provider.hf;dur=5321.4;desc="x2", postprocess;dur=84.2, total;dur=5602.0
+
+and, with `X-Debug-Timing: 1` (or `?debug_timing=1`), JSON responses get a
+`_timing` field holding the request id and the full span tree. Streaming
+endpoints send their headers before the work is done, so they report timings
+in their final event instead (`Trace.debug` tells them whether to add the tree).
+
+Env configuration:
+- SERVER_TIMING (default 1): 0 disables tracing and the response headers
+- SERVER_TIMING_DEBUG (default 0): 1 adds the `_timing` field to every JSON response
+- TRACE_LOG_SLOW_MS (default 10000): log a one-line timing summary for slower requests (0 = off)
+"""
+import os
+import re
+import json
+import time
+import uuid
+import contextvars
+from typing import Dict, List, Optional
+
+ENABLED = str(os.environ.get('SERVER_TIMING', '1')).lower() not in ('0', 'false', 'no')
+DEBUG_ALWAYS = str(os.environ.get('SERVER_TIMING_DEBUG', '0')).lower() in ('1', 'true', 'yes')
+try:
+    LOG_SLOW_MS = float(os.environ.get('TRACE_LOG_SLOW_MS', 10000))
+except Exception:
+    LOG_SLOW_MS = 10000.0
+
+# request ids end up in headers and log lines: keep them short and printable
+_REQUEST_ID_RE = re.compile(r'^[A-Za-z0-9._:-]{1,128}$')
+# bound a single trace so long-running streams or leaked tasks cannot grow it forever
+MAX_SPANS = 2048
+
+_CURRENT = contextvars.ContextVar('trace_span', default=None)
+
+
+class Span:
+    __slots__ = ('name', 'trace', 'start', 'end', 'children')
+
+    def __init__(self, name: str, trace: 'Trace'):
+        self.name = name
+        self.trace = trace
+        self.start = time.perf_counter()
+        self.end = None
+        self.children = []
+
+    @property
+    def duration_ms(self) -> float:
+        end = self.end if self.end is not None else time.perf_counter()
+        return (end - self.start) * 1000.0
+
+    def tree(self, origin: float) -> Dict:
+        node = { 'name': self.name, 'start_ms': round((self.start - origin) * 1000.0, 3), 'duration_ms': round(self.duration_ms, 3) }
+        if self.end is None:
+            node['open'] = True
+        if self.children:
+            node['children'] = [c.tree(origin) for c in list(self.children)]
+        return node
+
+
+class Trace:
+    """All spans of one request; `root` covers the whole request."""
+
+    def __init__(self, request_id: str, debug: bool = False):
+        self.request_id = request_id
+        self.debug = debug
+        self.root = Span('request', self)
+        self.count = 0
+        self.closed = False
+
+    def totals(self) -> Dict[str, List[float]]:
+        """name -> [total ms, count], summed over the tree (same-name spans add up)."""
+        out = {}
+        stack = list(self.root.children)
+        while stack:
+            s = stack.pop()
+            entry = out.setdefault(s.name, [0.0, 0])
+            entry[0] += s.duration_ms
+            entry[1] += 1
+            stack.extend(s.children)
+        return out
+
+    def server_timing(self) -> str:
+        parts = []
+        for name, (ms, n) in sorted(self.totals().items(), key=lambda kv: -kv[1][0]):
+            part = f'{name};dur={ms:.1f}'
+            if n > 1:
+                part += f';desc="x{n}"'
+            parts.append(part)
+        parts.append(f'total;dur={self.root.duration_ms:.1f}')
+        return ', '.join(parts)
+
+    def as_dict(self) -> Dict:
+        return { 'request_id': self.request_id, 'spans': self.root.tree(self.root.start) }
+
+
+class _SpanContext:
+    __slots__ = ('name', 'span', 'token')
+
+    def __init__(self, name: str):
+        self.name = name
+        self.span = None
+
+    def __enter__(self):
+        parent = _CURRENT.get()
+        if parent is not None:
+            trace = parent.trace
+            if not trace.closed and trace.count < MAX_SPANS:
+                trace.count += 1
+                self.span = Span(self.name, trace)
+                parent.children.append(self.span)
+                self.token = _CURRENT.set(self.span)
+        return self
+
+    def __exit__(self, *exc):
+        if self.span is not None:
+            self.span.end = time.perf_counter()
+            try:
+                _CURRENT.reset(self.token)
+            except ValueError:
+                # exited in a different context (e.g. a generator finalized elsewhere)
+                pass
+        return False
+
+
+def span(name: str) -> _SpanContext:
+    """Context manager recording a timing span under the current one (no-op outside a request)."""
+    return _SpanContext(name)
+
+
+def current_trace() -> Optional[Trace]:
+    s = _CURRENT.get()
+    return s.trace if s is not None else None
+
+
+def current_request_id() -> Optional[str]:
+    trace = current_trace()
+    return trace.request_id if trace is not None else None
+
+
+def in_context(fn):
+    """Bind `fn` to the caller's context, for executors that do not copy it (run_in_executor)."""
+    ctx = contextvars.copy_context()
+    return lambda *args: ctx.run(fn, *args)
+
+
+def _header(scope, name: bytes) -> Optional[str]:
+    for k, v in scope.get('headers') or ():
+        if k.lower() == name:
+            return v.decode('latin-1')
+    return None
+
+
+def _debug_requested(scope) -> bool:
+    if DEBUG_ALWAYS:
+        return True
+    flag = _header(scope, b'x-debug-timing')
+    if flag and flag.strip().lower() not in ('0', 'false', 'no'):
+        return True
+    return b'debug_timing=1' in (scope.get('query_string') or b'')
+
+
+class TracingMiddleware:
+    """ASGI middleware: per-request trace, X-Request-Id echo and Server-Timing header.
+    With debug timing requested, JSON bodies are buffered and get a `_timing` field.
+    """
+
+    def __init__(self, app, skip=('/metrics', '/health')):
+        self.app = app
+        self.skip = set(skip)
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http' or not ENABLED or scope.get('path') in self.skip:
+            await self.app(scope, receive, send)
+            return
+        incoming = (_header(scope, b'x-request-id') or '').strip()
+        request_id = incoming if _REQUEST_ID_RE.match(incoming) else uuid.uuid4().hex
+        debug = _debug_requested(scope)
+        trace = Trace(request_id, debug)
+        held = { 'start': None, 'body': [], 'json': False }
+
+        def _headers(message, extra_body: Optional[bytes] = None):
+            drop = (b'x-request-id', b'content-length') if extra_body is not None else (b'x-request-id',)
+            headers = [(k, v) for k, v in message.get('headers', []) if k.lower() not in drop]
+            headers.append((b'x-request-id', request_id.encode('latin-1')))
+            headers.append((b'server-timing', trace.server_timing().encode('latin-1')))
+            if extra_body is not None:
+                headers.append((b'content-length', str(len(extra_body)).encode('latin-1')))
+            return { **message, 'headers': headers }
+
+        async def _send(message):
+            kind = message['type']
+            if kind == 'http.response.start':
+                content_type = (dict((k.lower(), v) for k, v in message.get('headers', [])).get(b'content-type') or b'')
+                if debug and content_type.startswith(b'application/json'):
+                    held['start'] = message
+                    held['json'] = True
+                    return
+                await send(_headers(message))
+                return
+            if kind == 'http.response.body' and held['json']:
+                held['body'].append(message.get('body', b''))
+                if message.get('more_body'):
+                    return
+                body = b''.join(held['body'])
+                try:
+                    payload = json.loads(body)
+                    if isinstance(payload, dict):
+                        trace.root.end = time.perf_counter()
+                        payload['_timing'] = trace.as_dict()
+                        body = json.dumps(payload).encode('utf-8')
+                except Exception:
+                    pass
+                await send(_headers(held['start'], body))
+                await send({ 'type': 'http.response.body', 'body': body })
+                return
+            await send(message)
+
+        token = _CURRENT.set(trace.root)
+        try:
+            await self.app(scope, receive, _send)
+        finally:
+            trace.root.end = time.perf_counter()
+            trace.closed = True
+            _CURRENT.reset(token)
+            total = trace.root.duration_ms
+            if LOG_SLOW_MS and total >= LOG_SLOW_MS:
+                print(f'[{request_id}] {scope.get("method", "")} {scope.get("path", "")} {total:.0f}ms:', trace.server_timing())